@@ -1,11 +1,25 @@
 MODEL_PATH = 'C://Users//leela//Downloads//Final4//GNPlantCareApp//plant-disease-data//train//plant_disease_model.h5'
 train_dir = 'C://Users//leela//Downloads//Final4//GNPlantCareApp//plant-disease-data//train'
+import time
+PROCESS_START = time.perf_counter()
 print('Starting Flask API...')
-from flask import Flask, request, jsonify
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import numpy as np
+import io
+import json
+import numbers
 import os
+import threading
+import zipfile
+from model_registry import ModelRegistry
+from inference_backends import backend_for, load_model_file, model_path_for
+from batching import MicroBatcher
+from class_manifest import read_class_names
+from preprocess import ImageTooLarge, decode_image, image_inputs
+from prediction_cache import PredictionCache, content_hash, dhash
+import metrics
+import request_profiler
+from metrics import stage_timer
 
 app = Flask(__name__)
 
@@ -16,152 +30,597 @@ IDENTIFY_MODEL_PATH = 'plant_disease_mobilenet_final.h5'
 HEALTH_MODEL_PATH = 'plant_health_model.h5'
 # DISEASE_MODEL_PATH: For Disease field alone
 DISEASE_MODEL_PATH = 'disease_model.h5'
+# FUSED_MODEL_PATH: Shared-trunk model with identify, health and disease heads
+# (train_multihead_model.py). Used instead of the three models when present.
+FUSED_MODEL_PATH = os.getenv('FUSED_MODEL_PATH', 'multihead_model.h5')
+USE_FUSED_MODEL = os.path.exists(model_path_for(FUSED_MODEL_PATH, backend_for('fused')))
+# PRESCREEN_MODEL_PATH: Small low-resolution model (train_prescreen_model.py)
+# that settles unsupported images and clearly healthy leaves before the 224x224
+# health and disease models run, and takes the health model's place for
+# clearly unhealthy ones. The pre-screen only knows the health classes, so
+# those still go through the disease model. Used when present, unless CASCADE=0.
+PRESCREEN_MODEL_PATH = os.getenv('PRESCREEN_MODEL_PATH', 'prescreen_model.h5')
+USE_CASCADE = (not USE_FUSED_MODEL and os.getenv('CASCADE', '1') == '1'
+               and os.path.exists(model_path_for(PRESCREEN_MODEL_PATH, backend_for('prescreen'))))
+# Pre-screen class meaning "not a supported leaf", and the confidences at which
+# the pre-screen's answer is trusted without running the larger models
+PRESCREEN_REJECT_CLASS = 'not_leaf'
+PRESCREEN_REJECT_THRESHOLD = float(os.getenv('PRESCREEN_REJECT_THRESHOLD', '0.9'))
+PRESCREEN_HEALTHY_THRESHOLD = float(os.getenv('PRESCREEN_HEALTHY_THRESHOLD', '0.95'))
+PRESCREEN_DISEASE_THRESHOLD = float(os.getenv('PRESCREEN_DISEASE_THRESHOLD', '0.98'))
+# SYMPTOM_MODEL_PATH: The disease model with a multi-label symptom head
+# (train_symptom_model.py). Served in place of DISEASE_MODEL_PATH when present;
+# /predict?symptoms=1 then adds per-symptom probabilities from the same pass.
+SYMPTOM_MODEL_PATH = os.getenv('SYMPTOM_MODEL_PATH', 'disease_symptom_model.h5')
+USE_SYMPTOM_MODEL = (not USE_FUSED_MODEL
+                     and os.path.exists(model_path_for(SYMPTOM_MODEL_PATH, backend_for('disease'))))
+if USE_FUSED_MODEL:
+    MODEL_FILES = {'fused': FUSED_MODEL_PATH}
+else:
+    MODEL_FILES = {'identify': IDENTIFY_MODEL_PATH, 'health': HEALTH_MODEL_PATH,
+                   'disease': SYMPTOM_MODEL_PATH if USE_SYMPTOM_MODEL else DISEASE_MODEL_PATH}
+    if USE_CASCADE:
+        MODEL_FILES['prescreen'] = PRESCREEN_MODEL_PATH
 
-print('Loading models:', IDENTIFY_MODEL_PATH, HEALTH_MODEL_PATH, DISEASE_MODEL_PATH)
-identify_model = load_model(IDENTIFY_MODEL_PATH)
-health_model = load_model(HEALTH_MODEL_PATH)
-disease_model = load_model(DISEASE_MODEL_PATH)
-print('Models loaded successfully.')
-print('Model input shape:', identify_model.input_shape)
+# How often (seconds) to check the .h5 files for a new version to hot-swap
+MODEL_POLL_SECONDS = float(os.getenv('MODEL_POLL_SECONDS', '5'))
+# Load models in a background thread so /healthz answers straight away;
+# /readyz and /predict report 503 until loading and warm-up are done
+MODEL_LOAD_ASYNC = os.getenv('MODEL_LOAD_ASYNC', '1') == '1'
 
+# Class names come from the manifests the training scripts write next to each
+# model (class_manifest.py), so the training data isn't needed at startup
+CLASS_NAMES = []
+HEALTH_CLASS_NAMES = []
+DISEASE_CLASS_NAMES = []
+PRESCREEN_CLASS_NAMES = []
+SYMPTOM_NAMES = []
 
 
-# Dynamically load class names for plant identification (original train_dir)
-CLASS_NAMES = [d for d in os.listdir('C://Users//leela//Downloads//Final4//GNPlantCareApp//plant-disease-data//train') if os.path.isdir(os.path.join('C://Users//leela//Downloads//Final4//GNPlantCareApp//plant-disease-data//train', d))]
-print('Loaded class names:', CLASS_NAMES)
+def load_class_names():
+    global CLASS_NAMES, HEALTH_CLASS_NAMES, DISEASE_CLASS_NAMES, PRESCREEN_CLASS_NAMES, SYMPTOM_NAMES
+    if USE_FUSED_MODEL:
+        CLASS_NAMES = read_class_names(FUSED_MODEL_PATH, 'identify')
+        HEALTH_CLASS_NAMES = read_class_names(FUSED_MODEL_PATH, 'health')
+        DISEASE_CLASS_NAMES = read_class_names(FUSED_MODEL_PATH, 'disease')
+    else:
+        CLASS_NAMES = read_class_names(IDENTIFY_MODEL_PATH)
+        HEALTH_CLASS_NAMES = read_class_names(HEALTH_MODEL_PATH)
+        if USE_SYMPTOM_MODEL:
+            DISEASE_CLASS_NAMES = read_class_names(SYMPTOM_MODEL_PATH, 'disease')
+            SYMPTOM_NAMES = read_class_names(SYMPTOM_MODEL_PATH, 'symptoms')
+            print('Loaded symptom names:', SYMPTOM_NAMES)
+        else:
+            DISEASE_CLASS_NAMES = read_class_names(DISEASE_MODEL_PATH)
+    if USE_CASCADE:
+        PRESCREEN_CLASS_NAMES = read_class_names(PRESCREEN_MODEL_PATH)
+        print('Loaded pre-screen class names:', PRESCREEN_CLASS_NAMES)
+    print('Loaded class names:', CLASS_NAMES)
+    print('Loaded health class names:', HEALTH_CLASS_NAMES)
+    print('Loaded disease class names:', DISEASE_CLASS_NAMES)
 
-# Load disease class names from PlantVillage dataset for disease model (ignore non-class folders)
-plantvillage_dir = 'C:/Users/leela/Downloads/diseases_images/Newfolder/archive/PlantVillage'
-DISEASE_CLASS_NAMES = [d for d in os.listdir(plantvillage_dir) if os.path.isdir(os.path.join(plantvillage_dir, d)) and d.lower() != 'plantvillage']
-print('Loaded disease class names:', DISEASE_CLASS_NAMES)
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    print('Received request to /predict')
-    if 'file' not in request.files:
-        print('No file uploaded')
-        return jsonify({'error': 'No file uploaded'}), 400
-    file = request.files['file']
-    # Accept only image files
-    allowed_exts = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tiff'}
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in allowed_exts:
-        print(f'Unsupported file type: {ext}')
-        return jsonify({'error': f'Unsupported file type: {ext}'}), 400
-    img_path = os.path.join('uploads', file.filename)
-    file.save(img_path)
-    print('Saved file to', img_path)
+def warm_up(model):
+    # First predict() builds the graph and allocates buffers; do it before the
+    # model takes traffic. TFLite reports numpy ints, ONNX may name dynamic dims.
+    shape = [int(d) if isinstance(d, numbers.Integral) and d > 0 else 1 for d in model.input_shape[1:]]
+    model.predict(np.zeros([1] + shape, dtype=np.float32), verbose=0)
+
+
+model_registry = ModelRegistry(load_model_file, warm_up=warm_up)
+models_ready = threading.Event()
+model_load_error = None
+
+
+def load_models():
+    global model_load_error
     try:
-        # Load image in any size, then resize for each model
-        img_raw = image.load_img(img_path)
-        # For identify model (128x128)
-        img_id = img_raw.resize((128, 128))
-        x_id = image.img_to_array(img_id)
-        x_id = np.expand_dims(x_id, axis=0) / 255.0
-        # For health model (224x224)
-        img_health = img_raw.resize((224, 224))
-        x_health = image.img_to_array(img_health)
-        x_health = np.expand_dims(x_health, axis=0) / 255.0
+        load_class_names()
+        for name, h5_path in MODEL_FILES.items():
+            # MODEL_BACKEND / MODEL_BACKEND_<NAME> pick keras, tflite, tflite-fp16,
+            # tflite-int8 or onnx; the non-Keras files come from export_models.py
+            backend = backend_for(name)
+            path = model_path_for(h5_path, backend)
+            print(f'Loading {name} model ({backend}):', path)
+            model_registry.register(name, path)
     except Exception as e:
-        print(f'Error loading image: {e}')
-        os.remove(img_path)
-        return jsonify({'error': 'Invalid image file'}), 400
+        model_load_error = str(e)
+        print(f'Model loading failed: {e}')
+        return
+    model_registry.start_watcher(MODEL_POLL_SECONDS)
+    ready_seconds = time.perf_counter() - PROCESS_START
+    metrics.STARTUP_SECONDS.set(ready_seconds, 'ready')
+    models_ready.set()
+    print(f'Models loaded successfully. Ready {ready_seconds:.2f}s after start.')
 
 
-    # Plant identification (plant details and confidence)
-    id_preds = identify_model.predict(x_id)
-    id_class_idx = np.argmax(id_preds[0])
-    id_confidence = float(id_preds[0][id_class_idx])
-    id_class = CLASS_NAMES[id_class_idx] if id_class_idx < len(CLASS_NAMES) else 'Unknown'
-
-    # Health model (condition, health confidence, spoilage)
-    health_preds = health_model.predict(x_health)
-    print(f'Raw health model predictions: {health_preds[0]}')
-    class_indices = {
-        'guava_healthy': 0,
-        'guava_unhealthy': 1,
-        'sapota_healthy': 2,
-        'sapota_unhealthy': 3
-    }
-    health_class_names = [None] * len(class_indices)
-    for name, idx in class_indices.items():
-        health_class_names[idx] = name
-    health_class_idx = np.argmax(health_preds[0])
-    health_confidence = float(health_preds[0][health_class_idx])
-    health_class = health_class_names[health_class_idx] if health_class_idx < len(health_class_names) else 'Unknown'
-
-    if '_' in health_class:
-        disease, condition = health_class.split('_', 1)
-    else:
-        disease, condition = health_class, 'Unknown'
-
-    medicine_map = {
-        'guava_bad': 'Copper fungicide, Neem oil',
-        'guava_good': 'No treatment needed',
-        'sapota_bad': 'Copper fungicide, Neem oil',
-        'sapota_good': 'No treatment needed',
-    }
-    spoilage_map = {
-        'guava_bad': 70,
-        'guava_good': 10,
-        'sapota_bad': 70,
-        'sapota_good': 10,
-    }
-    medicine = medicine_map.get(health_class, 'Unknown')
-    plant_conf_threshold = 0.7
-    health_conf_threshold = 0.7
+# Concurrent requests are grouped into one predict() call per model, waiting at
+# most BATCH_MAX_WAIT_MS for up to BATCH_MAX_SIZE images
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+batchers = {
+    name: MicroBatcher(name, lambda name=name: model_registry.get(name), BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+    for name in MODEL_FILES
+}
+
+
+
+# Results are cached by upload content hash; set CACHE_PHASH_DISTANCE >= 0 to
+# also match near-duplicate photos by perceptual hash
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '1024')),
+    max_bytes=int(os.getenv('CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv('CACHE_TTL_SECONDS', '3600')),
+    phash_distance=int(os.getenv('CACHE_PHASH_DISTANCE', '-1')),
+)
+
+
+def on_model_swapped(name, entry):
+    # A retrained model may come with a new class manifest
+    try:
+        load_class_names()
+    except Exception as e:
+        print(f'Keeping previous class names after reloading {name}: {e}')
+    # Cached results are only valid for the model versions that produced them
+    prediction_cache.clear()
+
+
+model_registry.add_listener(on_model_swapped)
+
+metrics.REGISTRY.register(metrics.Gauge(
+    'plant_api_batch_queue_depth', 'Requests waiting for the next batch, per model.', ['model'],
+    callback=lambda: {(name, ): b.queue_depth() for name, b in batchers.items()}))
+metrics.REGISTRY.register(metrics.Gauge(
+    'plant_api_model_load_seconds', 'Time taken to load the current version of each model.', ['model'],
+    callback=lambda: {(name, ): model_registry.entry(name).load_seconds for name in model_registry.names()}))
+metrics.REGISTRY.register(metrics.Gauge(
+    'plant_api_model_version', 'Times each model has been (re)loaded.', ['model'],
+    callback=lambda: {(name, ): model_registry.entry(name).version for name in model_registry.names()}))
+metrics.REGISTRY.register(metrics.Gauge(
+    'plant_api_cache', 'Prediction cache counters and hit rate.', ['stat'],
+    callback=lambda: {(k, ): v for k, v in prediction_cache.stats().items()}))
+
+if MODEL_LOAD_ASYNC:
+    threading.Thread(target=load_models, name='model-loader', daemon=True).start()
+else:
+    load_models()
+
+# Accept only image files
+ALLOWED_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tiff'}
+# Request body limit (Flask answers 413 above it), and limits on what a zip
+# in /predict/batch may expand to, checked before any member is inflated
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(64 * 1024 * 1024)))
+MAX_ZIP_MEMBER_BYTES = int(os.getenv('MAX_ZIP_MEMBER_BYTES', str(20 * 1024 * 1024)))
+MAX_ZIP_TOTAL_BYTES = int(os.getenv('MAX_ZIP_TOTAL_BYTES', str(256 * 1024 * 1024)))
+MAX_ZIP_MEMBERS = int(os.getenv('MAX_ZIP_MEMBERS', '1000'))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+MEDICINE_MAP = {
+    'guava_bad': 'Copper fungicide, Neem oil',
+    'guava_good': 'No treatment needed',
+    'sapota_bad': 'Copper fungicide, Neem oil',
+    'sapota_good': 'No treatment needed',
+}
+SPOILAGE_MAP = {
+    'guava_bad': 70,
+    'guava_good': 10,
+    'sapota_bad': 70,
+    'sapota_good': 10,
+}
+PLANT_CONF_THRESHOLD = 0.7
+HEALTH_CONF_THRESHOLD = 0.7
+
+
+def spoilage_for(condition, health_confidence):
     # Improved spoilage percent calculation
-    if health_confidence >= health_conf_threshold:
+    if health_confidence >= HEALTH_CONF_THRESHOLD:
         if condition == "healthy":
             # Healthy: low spoilage (10-30%)
-            spoilage_percent = int((1 - health_confidence) * 20) + 10
+            return int((1 - health_confidence) * 20) + 10
         elif condition == "unhealthy":
             # Unhealthy: high spoilage (30-100%)
-            spoilage_percent = int((1 - health_confidence) * 70) + 30
-        else:
-            spoilage_percent = 0
+            return int((1 - health_confidence) * 70) + 30
+    return 0
+
+
+def disease_label(disease_row, id_class):
+    disease_class_idx = np.argmax(disease_row)
+    if disease_class_idx < len(DISEASE_CLASS_NAMES):
+        folder_name = DISEASE_CLASS_NAMES[disease_class_idx]
+        # Replace the part before the first underscore with the plant name
+        if '_' in folder_name:
+            parts = folder_name.split('_', 1)
+            return f"{id_class}_{parts[1]}"
+        return folder_name
+    return str(disease_class_idx)
+
+
+def run_prescreen(x_id):
+    """Returns {row: (health_class, confidence)} for images the pre-screen
+    settles without the health model: unsupported images and confidently
+    healthy or unhealthy leaves."""
+    settled = {}
+    with stage_timer('predict_prescreen'):
+        pre_preds = batchers['prescreen'].predict(x_id)
+    for i, row in enumerate(pre_preds):
+        if PRESCREEN_REJECT_CLASS in PRESCREEN_CLASS_NAMES:
+            reject_conf = float(row[PRESCREEN_CLASS_NAMES.index(PRESCREEN_REJECT_CLASS)])
+            if reject_conf >= PRESCREEN_REJECT_THRESHOLD:
+                settled[i] = (PRESCREEN_REJECT_CLASS, reject_conf)
+                continue
+        idx = np.argmax(row)
+        name = PRESCREEN_CLASS_NAMES[idx]
+        threshold = PRESCREEN_HEALTHY_THRESHOLD if name.endswith('_healthy') else PRESCREEN_DISEASE_THRESHOLD
+        if name != PRESCREEN_REJECT_CLASS and float(row[idx]) >= threshold:
+            settled[i] = (name, float(row[idx]))
+    return settled
+
+
+def run_pipeline(x_id, x_health, symptoms=False):
+    """Run N images (stacked along axis 0) through the models and return one
+    result dict per image. With symptoms (needs USE_SYMPTOM_MODEL), every
+    supported leaf also gets per-symptom probabilities."""
+    n = len(x_health)
+    all_disease_preds = None
+    # (health_class, health_confidence) per image
+    health = [None] * n
+    if USE_FUSED_MODEL:
+        # One forward pass through the shared trunk gives all three heads;
+        # the identify head was trained on the 224x224 input
+        with stage_timer('predict_fused'):
+            id_preds, health_preds, all_disease_preds = batchers['fused'].predict(x_health)
+        health_rows = list(range(n))
     else:
-        spoilage_percent = 0
+        # Plant identification (plant details and confidence)
+        with stage_timer('predict_identify'):
+            id_preds = batchers['identify'].predict(x_id)
+        if USE_CASCADE:
+            # Cheap pre-screen on the 128x128 input; the 224x224 health model
+            # only sees images it isn't confident about
+            for i, settled in run_prescreen(x_id).items():
+                health[i] = settled
+        health_rows = [i for i in range(n) if health[i] is None]
+        # Health model (condition, health confidence, spoilage)
+        if health_rows:
+            with stage_timer('predict_health'):
+                health_preds = batchers['health'].predict(x_health if len(health_rows) == n else x_health[health_rows])
+
+    postprocess_start = time.perf_counter()
+    for row, i in zip(health_preds if health_rows else [], health_rows):
+        print(f'Raw health model predictions: {row}')
+        health_class_idx = np.argmax(row)
+        health_class = HEALTH_CLASS_NAMES[health_class_idx] if health_class_idx < len(HEALTH_CLASS_NAMES) else 'Unknown'
+        health[i] = (health_class, float(row[health_class_idx]))
+
+    results = []
+    needs_disease = []
+    supported = []
+    for i in range(n):
+        id_class_idx = np.argmax(id_preds[i])
+        id_confidence = float(id_preds[i][id_class_idx])
+        id_class = CLASS_NAMES[id_class_idx] if id_class_idx < len(CLASS_NAMES) else 'Unknown'
+
+        health_class, health_confidence = health[i]
+        if health_class == PRESCREEN_REJECT_CLASS:
+            # Pre-screen says this isn't a supported leaf
+            metrics.CASCADE_EXITS.inc('unsupported')
+            results.append({
+                "plant": 'Unknown',
+                "plant_confidence": 1.0 - health_confidence,
+                "disease": 'Unknown',
+                "condition": 'Unknown',
+                "spoilage_percent": 0,
+                "medicine": 'Unknown'
+            })
+            continue
+        supported.append(i)
+        if '_' in health_class:
+            disease, condition = health_class.split('_', 1)
+        else:
+            disease, condition = health_class, 'Unknown'
 
-    # Disease model (disease field only)
-    disease_pred = "Unknown"
-    try:
         # If plant or health model predicts healthy, set disease to 'healthy'
         if condition == "healthy" or "healthy" in id_class.lower():
             disease_pred = "healthy"
+            metrics.CASCADE_EXITS.inc('health' if i in health_rows else 'prescreen')
         else:
-            disease_model = load_model(DISEASE_MODEL_PATH)
-            img = image.load_img(img_path, target_size=(224, 224))
-            x = image.img_to_array(img)
-            x = np.expand_dims(x, axis=0)
-            x = x / 255.0
-            preds = disease_model.predict(x)
-            disease_class_idx = np.argmax(preds[0])
-            if disease_class_idx < len(DISEASE_CLASS_NAMES):
-                folder_name = DISEASE_CLASS_NAMES[disease_class_idx]
-                # Replace the part before the first underscore with the plant name
-                if '_' in folder_name:
-                    parts = folder_name.split('_', 1)
-                    disease_pred = f"{id_class}_{parts[1]}"
-                else:
-                    disease_pred = folder_name
+            disease_pred = "Unknown"
+            needs_disease.append(i)
+            metrics.CASCADE_EXITS.inc('disease')
+
+        results.append({
+            "plant": id_class,
+            "plant_confidence": id_confidence,
+            "disease": disease_pred,
+            "condition": condition,
+            "spoilage_percent": spoilage_for(condition, health_confidence),
+            "medicine": MEDICINE_MAP.get(health_class, 'Unknown')
+        })
+    metrics.observe_stage('postprocess', time.perf_counter() - postprocess_start)
+
+    # Disease model (disease field only), on the same 224x224 input as the
+    # health model and only for the images that need it. Symptoms come from
+    # the same pass, so asking for them sends every supported leaf through it.
+    disease_rows = supported if symptoms else needs_disease
+    if symptoms:
+        for result in results:
+            result["symptoms"] = {}
+    request_profiler.note('disease_branch_ran', bool(disease_rows))
+    if USE_CASCADE:
+        request_profiler.note('prescreen_settled', n - len(health_rows))
+    if disease_rows:
+        try:
+            if all_disease_preds is not None:
+                disease_preds = all_disease_preds[disease_rows]
             else:
-                disease_pred = str(disease_class_idx)
+                with stage_timer('predict_disease'):
+                    disease_preds = batchers['disease'].predict(x_health[disease_rows])
+                if USE_SYMPTOM_MODEL:
+                    disease_preds, symptom_preds = disease_preds
+            labelled = set(needs_disease)
+            for row, i in zip(disease_preds, disease_rows):
+                if i in labelled:
+                    results[i]["disease"] = disease_label(row, results[i]["plant"])
+            if symptoms:
+                for row, i in zip(symptom_preds, disease_rows):
+                    results[i]["symptoms"] = {name: float(p) for name, p in zip(SYMPTOM_NAMES, row)}
+        except Exception as e:
+            print(f"Disease prediction error: {e}")
+    return results
+
+
+def lookup_upload(data, symptoms=False):
+    """Returns (result, key, phash, x_id, x_health); result is set on a cache
+    hit, otherwise the model inputs are. Raises if the image can't be decoded."""
+    # Results with symptoms are cached apart from the plain ones
+    key = prediction_cache.key(content_hash(data) + (':symptoms' if symptoms else ''))
+    result = prediction_cache.get(key)
+    if result is not None:
+        request_profiler.note('cache', 'hit')
+        return result, key, None, None, None
+    # Decode the upload once, in memory, and build both model inputs from it
+    with stage_timer('decode'):
+        img = decode_image(data)
+    phash = None
+    if prediction_cache.uses_phash and not symptoms:
+        phash = dhash(img)
+        result = prediction_cache.get_similar(phash)
+        if result is not None:
+            prediction_cache.put(key, result, phash)
+            request_profiler.note('cache', 'similar')
+            return result, key, phash, None, None
+    prediction_cache.record_miss()
+    with stage_timer('resize'):
+        x_id, x_health = image_inputs(img)
+    return None, key, phash, x_id, x_health
+
+
+def symptoms_requested(args, form):
+    # /predict?symptoms=1, or a symptoms=1 form field next to the file
+    return (args.get('symptoms') or form.get('symptoms') or '0').lower() in ('1', 'true')
+
+
+SYMPTOMS_UNAVAILABLE = 'Symptom predictions need a symptom model (train_symptom_model.py)'
+
+
+def not_ready_response():
+    return jsonify({'error': 'Models are still loading'}), 503
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    print('Received request to /predict')
+    if not models_ready.is_set():
+        return not_ready_response()
+    try:
+        profile_mode = request_profiler.requested_mode(request.headers, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if profile_mode is None:
+        return predict_upload()
+    if not request_profiler.is_trusted(request.remote_addr):
+        print(f'Refusing to profile request from {request.remote_addr}')
+        return jsonify({'error': 'Profiling is only available to trusted clients'}), 403
+    try:
+        with request_profiler.profiling(profile_mode) as profile:
+            response, status = predict_upload()
+    except request_profiler.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 429
+    body = response.get_json()
+    body['profile'] = profile.to_dict()
+    print('Request profile:', body['profile'])
+    return jsonify(body), status
+
+
+def predict_upload():
+    if 'file' not in request.files:
+        print('No file uploaded')
+        return jsonify({'error': 'No file uploaded'}), 400
+    file = request.files['file']
+    ext = os.path.splitext(file.filename)[1].lower()
+    if ext not in ALLOWED_EXTS:
+        print(f'Unsupported file type: {ext}')
+        return jsonify({'error': f'Unsupported file type: {ext}'}), 400
+    symptoms = symptoms_requested(request.args, request.form)
+    if symptoms and not USE_SYMPTOM_MODEL:
+        return jsonify({'error': SYMPTOMS_UNAVAILABLE}), 400
+    with stage_timer('upload'):
+        data = file.read()
+    try:
+        result, key, phash, x_id, x_health = lookup_upload(data, symptoms)
+    except ImageTooLarge as e:
+        print(f'Rejected image: {e}')
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
-        print(f"Disease prediction error: {e}")
-    result = {
-        "plant": id_class,
-        "plant_confidence": id_confidence,
-        "disease": disease_pred,
-        "condition": condition,
-        "spoilage_percent": spoilage_percent,
-        "medicine": medicine
-    }
+        print(f'Error loading image: {e}')
+        return jsonify({'error': 'Invalid image file'}), 400
+
+    if result is not None:
+        print('Prediction cache hit:', result)
+        return jsonify(result), 200
+    result = run_pipeline(x_id, x_health, symptoms)[0]
+    prediction_cache.put(key, result, phash)
     print('Prediction result:', result)
-    os.remove(img_path)
-    return jsonify(result)
+    return jsonify(result), 200
+
+
+def iter_batch_uploads(files):
+    """Yields (filename, bytes, error) for every image in the uploaded
+    (filename, bytes) pairs, expanding zips; bytes is None when error is
+    set."""
+    for filename, data in files:
+        ext = os.path.splitext(filename or '')[1].lower()
+        if ext == '.zip':
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile:
+                yield filename, None, 'Invalid zip file'
+                continue
+            with archive:
+                yield from iter_zip_images(filename, archive)
+        elif ext in ALLOWED_EXTS:
+            yield filename, data, None
+        else:
+            yield filename, None, 'Unsupported file type'
+
+
+def iter_zip_images(filename, archive):
+    # member.file_size bounds what read() inflates, so limits are checked on it first
+    members = [m for m in archive.infolist()
+               if not m.is_dir() and os.path.splitext(m.filename)[1].lower() in ALLOWED_EXTS]
+    if len(members) > MAX_ZIP_MEMBERS:
+        yield filename, None, f'Zip holds {len(members)} images; the limit is {MAX_ZIP_MEMBERS}'
+        return
+    total = 0
+    for member in members:
+        if member.file_size > MAX_ZIP_MEMBER_BYTES:
+            yield member.filename, None, f'Image is larger than {MAX_ZIP_MEMBER_BYTES} bytes uncompressed'
+            continue
+        total += member.file_size
+        if total > MAX_ZIP_TOTAL_BYTES:
+            yield filename, None, f'Zip expands to more than {MAX_ZIP_TOTAL_BYTES} bytes; remaining images skipped'
+            return
+        yield member.filename, archive.read(member), None
+
+
+def iter_batch_predictions(files):
+    """Yields one NDJSON line per image in the uploaded (filename, bytes)
+    pairs, for /predict/batch on either server. Images are decoded
+    and predicted BATCH_MAX_SIZE at a time and each chunk's results are
+    yielded as soon as its predict() calls return."""
+    def flush(chunk):
+        x_id = np.concatenate([c[3] for c in chunk])
+        x_health = np.concatenate([c[4] for c in chunk])
+        try:
+            results = run_pipeline(x_id, x_health)
+        except Exception as e:
+            # One failed chunk must not end the stream for the rest of the upload
+            print(f'Error during batch prediction: {e}')
+            for filename, *_ in chunk:
+                yield json.dumps({'filename': filename, 'error': 'Prediction failed'}) + '\n'
+            return
+        for (filename, key, phash, _, _), result in zip(chunk, results):
+            prediction_cache.put(key, result, phash)
+            yield json.dumps({'filename': filename, **result}) + '\n'
+
+    chunk = []
+    for filename, data, error in iter_batch_uploads(files):
+        if error:
+            print(f'Skipped {filename}: {error}')
+            yield json.dumps({'filename': filename, 'error': error}) + '\n'
+            continue
+        try:
+            result, key, phash, x_id, x_health = lookup_upload(data)
+        except ImageTooLarge as e:
+            print(f'Rejected image {filename}: {e}')
+            yield json.dumps({'filename': filename, 'error': str(e)}) + '\n'
+            continue
+        except Exception as e:
+            print(f'Error loading image {filename}: {e}')
+            yield json.dumps({'filename': filename, 'error': 'Invalid image file'}) + '\n'
+            continue
+        if result is not None:
+            yield json.dumps({'filename': filename, **result}) + '\n'
+            continue
+        chunk.append((filename, key, phash, x_id, x_health))
+        if len(chunk) >= BATCH_MAX_SIZE:
+            yield from flush(chunk)
+            chunk = []
+    if chunk:
+        yield from flush(chunk)
+
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    print('Received request to /predict/batch')
+    if not models_ready.is_set():
+        return not_ready_response()
+    # Read now: Werkzeug closes the uploaded files once this view returns,
+    # before the streamed response is generated
+    with stage_timer('upload'):
+        files = [(f.filename, f.read()) for f in request.files.getlist('files') + request.files.getlist('file')]
+    if not files:
+        print('No files uploaded')
+        return jsonify({'error': 'No files uploaded'}), 400
+    return Response(stream_with_context(iter_batch_predictions(files)), mimetype='application/x-ndjson')
+
+def endpoint_label():
+    # Route pattern rather than raw path, so unknown URLs don't add label values
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.IN_FLIGHT.inc()
+
+
+first_prediction_served = False
+
+
+@app.after_request
+def record_request_metrics(response):
+    global first_prediction_served
+    metrics.REQUESTS_TOTAL.inc(endpoint_label(), str(response.status_code))
+    if not first_prediction_served and request.path == '/predict' and response.status_code == 200:
+        first_prediction_served = True
+        metrics.STARTUP_SECONDS.set(time.perf_counter() - PROCESS_START, 'first_request')
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    metrics.IN_FLIGHT.dec()
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint_label())
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving HTTP
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: models are loaded and warmed up
+    if models_ready.is_set():
+        return jsonify({'status': 'ready', 'models': {
+            name: model_registry.entry(name).version for name in model_registry.names()
+        }})
+    if model_load_error is not None:
+        return jsonify({'status': 'error', 'error': model_load_error}), 503
+    return jsonify({'status': 'loading'}), 503
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(prediction_cache.stats())
 
 if __name__ == '__main__':
-    os.makedirs('uploads', exist_ok=True)
-    print('Uploads directory ready.')
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # The Werkzeug debugger allows arbitrary code execution; only for local development
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG', '0') == '1')
\ No newline at end of file
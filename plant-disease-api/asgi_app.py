@@ -0,0 +1,254 @@
+"""
+asgi_app.py
+
+Production serving mode for the prediction API on Starlette/uvicorn.
+
+Uploads are received on the event loop, decoding and inference run in
+bounded thread pools, and once MAX_PENDING_REQUESTS requests are waiting any
+new /predict request gets a 503 instead of queueing without limit. The
+/predict contract (multipart 'file' field in, the same JSON out) is the one
+app.py serves, so app/(tabs)/identify.tsx works against either server.
+/predict/batch streams the same NDJSON lines as app.py's, from the same
+code, driven one line at a time on an inference thread.
+
+Usage:
+  pip install starlette uvicorn python-multipart
+  python asgi_app.py
+  uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as flask_service
+import metrics
+import request_profiler
+from preprocess import ImageTooLarge
+
+# Threads running model inference; each one blocks on the micro-batchers, so
+# this bounds how many images can be in a batch at once
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', str(flask_service.BATCH_MAX_SIZE)))
+# Threads decoding uploads
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', str(os.cpu_count() or 4)))
+# Requests allowed to be in flight before new ones are rejected with 503
+MAX_PENDING_REQUESTS = int(os.getenv('MAX_PENDING_REQUESTS', str(4 * INFERENCE_WORKERS)))
+
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='decode')
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix='inference')
+pending_requests = 0
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def limit_body(request, limit):
+    """request, with its body counted as it arrives: reading more than limit
+    bytes raises UploadTooLarge. Starlette has no limit of its own, and a
+    chunked upload has no Content-Length to check up front."""
+    receive = request.receive
+    received = 0
+
+    async def limited_receive():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise UploadTooLarge(f'Upload is larger than {limit} bytes')
+        return message
+
+    return Request(request.scope, limited_receive)
+
+
+def upload_too_large(request):
+    # Rejects an over-long declared body before any of it is read
+    if int(request.headers.get('content-length') or 0) > flask_service.MAX_UPLOAD_BYTES:
+        return JSONResponse({'error': f'Upload is larger than {flask_service.MAX_UPLOAD_BYTES} bytes'},
+                            status_code=413)
+    return None
+
+
+async def predict(request):
+    global pending_requests
+    if pending_requests >= MAX_PENDING_REQUESTS:
+        print(f'Rejecting /predict: {pending_requests} requests pending')
+        metrics.REQUESTS_TOTAL.inc('/predict', '503')
+        return JSONResponse({'error': 'Server busy, try again shortly'}, status_code=503, headers={'Retry-After': '1'})
+    pending_requests += 1
+    metrics.IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handle_predict(request)
+        status = response.status_code
+        return response
+    finally:
+        pending_requests -= 1
+        metrics.IN_FLIGHT.dec()
+        metrics.REQUESTS_TOTAL.inc('/predict', str(status))
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, '/predict')
+
+
+async def handle_predict(request):
+    print('Received request to /predict')
+    if not flask_service.models_ready.is_set():
+        return JSONResponse({'error': 'Models are still loading'}, status_code=503)
+    try:
+        profile_mode = request_profiler.requested_mode(request.headers, request.query_params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    if profile_mode is None:
+        return await predict_upload(request)
+    client = request.client.host if request.client else None
+    if not request_profiler.is_trusted(client):
+        print(f'Refusing to profile request from {client}')
+        return JSONResponse({'error': 'Profiling is only available to trusted clients'}, status_code=403)
+    # The event loop serves other requests meanwhile, so cProfile only runs
+    # inside this request's executor calls
+    try:
+        with request_profiler.profiling(profile_mode, in_executor=True) as profile:
+            response = await predict_upload(request)
+    except request_profiler.ProfilerBusy as e:
+        return JSONResponse({'error': str(e)}, status_code=429)
+    body = json.loads(response.body)
+    body['profile'] = profile.to_dict()
+    print('Request profile:', body['profile'])
+    return JSONResponse(body, status_code=response.status_code)
+
+
+async def predict_upload(request):
+    upload_start = time.perf_counter()
+    rejected = upload_too_large(request)
+    if rejected is not None:
+        return rejected
+    try:
+        form = await limit_body(request, flask_service.MAX_UPLOAD_BYTES).form()
+    except UploadTooLarge as e:
+        return JSONResponse({'error': str(e)}, status_code=413)
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        print('No file uploaded')
+        return JSONResponse({'error': 'No file uploaded'}, status_code=400)
+    ext = os.path.splitext(file.filename or '')[1].lower()
+    if ext not in flask_service.ALLOWED_EXTS:
+        print(f'Unsupported file type: {ext}')
+        return JSONResponse({'error': f'Unsupported file type: {ext}'}, status_code=400)
+    symptoms = flask_service.symptoms_requested(request.query_params, form)
+    if symptoms and not flask_service.USE_SYMPTOM_MODEL:
+        return JSONResponse({'error': flask_service.SYMPTOMS_UNAVAILABLE}, status_code=400)
+    data = await file.read()
+    metrics.observe_stage('upload', time.perf_counter() - upload_start)
+
+    loop = asyncio.get_running_loop()
+    # The executor threads don't inherit this task's context; hand them the
+    # request's profile (None when not profiling)
+    profile = request_profiler.current()
+    try:
+        result, key, phash, x_id, x_health = await loop.run_in_executor(
+            decode_executor, request_profiler.run_with, profile, flask_service.lookup_upload, data, symptoms)
+    except ImageTooLarge as e:
+        print(f'Rejected image: {e}')
+        return JSONResponse({'error': str(e)}, status_code=413)
+    except Exception as e:
+        print(f'Error loading image: {e}')
+        return JSONResponse({'error': 'Invalid image file'}, status_code=400)
+    if result is not None:
+        print('Prediction cache hit:', result)
+        return JSONResponse(result)
+
+    results = await loop.run_in_executor(
+        inference_executor, request_profiler.run_with, profile, flask_service.run_pipeline, x_id, x_health, symptoms)
+    result = results[0]
+    flask_service.prediction_cache.put(key, result, phash)
+    print('Prediction result:', result)
+    return JSONResponse(result)
+
+
+async def predict_batch(request):
+    print('Received request to /predict/batch')
+    if not flask_service.models_ready.is_set():
+        return JSONResponse({'error': 'Models are still loading'}, status_code=503)
+    if pending_requests >= MAX_PENDING_REQUESTS:
+        print(f'Rejecting /predict/batch: {pending_requests} requests pending')
+        metrics.REQUESTS_TOTAL.inc('/predict/batch', '503')
+        return JSONResponse({'error': 'Server busy, try again shortly'}, status_code=503, headers={'Retry-After': '1'})
+    # The same body limit Flask enforces with MAX_CONTENT_LENGTH
+    rejected = upload_too_large(request)
+    if rejected is None:
+        try:
+            form = await limit_body(request, flask_service.MAX_UPLOAD_BYTES).form()
+        except UploadTooLarge as e:
+            rejected = JSONResponse({'error': str(e)}, status_code=413)
+    if rejected is not None:
+        metrics.REQUESTS_TOTAL.inc('/predict/batch', '413')
+        return rejected
+    files = [(f.filename, await f.read()) for f in form.getlist('files') + form.getlist('file') if not isinstance(f, str)]
+    if not files:
+        print('No files uploaded')
+        metrics.REQUESTS_TOTAL.inc('/predict/batch', '400')
+        return JSONResponse({'error': 'No files uploaded'}, status_code=400)
+    return StreamingResponse(stream_batch(files), media_type='application/x-ndjson')
+
+
+async def stream_batch(files):
+    global pending_requests
+    pending_requests += 1
+    metrics.IN_FLIGHT.inc()
+    start = time.perf_counter()
+    lines = flask_service.iter_batch_predictions(files)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            # Unzipping, decoding and the chunk predictions all block, so every
+            # step of the generator runs on an inference thread
+            line = await loop.run_in_executor(inference_executor, next, lines, None)
+            if line is None:
+                break
+            yield line
+    finally:
+        pending_requests -= 1
+        metrics.IN_FLIGHT.dec()
+        metrics.REQUESTS_TOTAL.inc('/predict/batch', '200')
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, '/predict/batch')
+
+
+async def healthz(request):
+    return JSONResponse({'status': 'ok'})
+
+
+async def readyz(request):
+    if flask_service.models_ready.is_set():
+        return JSONResponse({'status': 'ready'})
+    if flask_service.model_load_error is not None:
+        return JSONResponse({'status': 'error', 'error': flask_service.model_load_error}, status_code=503)
+    return JSONResponse({'status': 'loading'}, status_code=503)
+
+
+async def prometheus_metrics(request):
+    return Response(metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+
+async def cache_stats(request):
+    return JSONResponse(flask_service.prediction_cache.stats())
+
+
+app = Starlette(routes=[
+    Route('/predict', predict, methods=['POST']),
+    Route('/predict/batch', predict_batch, methods=['POST']),
+    Route('/healthz', healthz, methods=['GET']),
+    Route('/readyz', readyz, methods=['GET']),
+    Route('/metrics', prometheus_metrics, methods=['GET']),
+    Route('/cache/stats', cache_stats, methods=['GET']),
+])
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,200 @@
+"""
+audit_dataset.py
+
+Checks every image in class-per-folder datasets before training, replacing
+audit_clean_dataset.py and preview_clean_dataset.py.
+
+Each image is fully decoded in a pool of worker processes. A cheap
+Image.verify() misses truncated JPEGs, which only fail when tf.data decodes
+them mid-training. Besides unreadable files, an image is bad if it isn't
+JPEG (including the MPO JPEGs many cameras write), PNG, GIF or BMP under its
+extension, since tf.io.decode_image can't read anything else. Readable images are flagged, not rejected, when they
+are:
+  too_small   shorter side below --min_size
+  grayscale   single-channel, or colour with identical channels
+  cmyk        CMYK (colours shift when converted to RGB)
+
+Results are cached per data directory in .audit_manifest.json, keyed by
+path, size and mtime, and saved every MANIFEST_EVERY results. Re-running
+only decodes new or changed files, and an interrupted audit resumes where it
+stopped, even part way through a class.
+
+Nothing is deleted. With --quarantine, bad images (and flagged ones too
+with --quarantine_flagged) are moved to <data_dir>_quarantine/<class>/.
+Every run writes a JSON report (--report) listing the bad and flagged
+images with the reasons.
+
+Usage:
+  python audit_dataset.py plant-disease-data/train plant-disease-data/val
+  python audit_dataset.py plant-disease-data/train --quarantine --report audit_train.json
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pack_dataset import IMAGE_EXTS, list_classes
+
+MANIFEST_NAME = '.audit_manifest.json'
+# Formats tf.io.decode_image can read; MPO is a JPEG with extra frames appended
+TRAINABLE_FORMATS = ('JPEG', 'MPO', 'PNG', 'GIF', 'BMP')
+GRAYSCALE_MODES = ('1', 'L', 'LA', 'I', 'I;16', 'F')
+# Decoded images between manifest saves
+MANIFEST_EVERY = 500
+# Largest channel difference (0-255) still counted as a grayscale photo
+GRAY_TOLERANCE = 3
+
+
+def check_image(path, min_size):
+    """Runs in a worker process: fully decodes path and returns its result
+    entry (without the cache key)."""
+    from PIL import Image, ImageChops
+    try:
+        with Image.open(path) as img:
+            fmt, mode, (width, height) = img.format, img.mode, img.size
+            # load() decodes every pixel, so truncated files fail here
+            img.load()
+            flags = []
+            if fmt not in TRAINABLE_FORMATS:
+                return {'status': 'bad', 'error': f'{fmt} data can not be decoded by TensorFlow', 'format': fmt}
+            if min(width, height) < min_size:
+                flags.append('too_small')
+            if mode == 'CMYK':
+                flags.append('cmyk')
+            if mode in GRAYSCALE_MODES:
+                flags.append('grayscale')
+            elif mode in ('RGB', 'RGBA', 'P'):
+                thumb = img.convert('RGB')
+                thumb.thumbnail((64, 64))
+                r, g, b = thumb.split()
+                if max(ImageChops.difference(r, g).getextrema()[1],
+                       ImageChops.difference(g, b).getextrema()[1]) <= GRAY_TOLERANCE:
+                    flags.append('grayscale')
+        return {'status': 'ok', 'format': fmt, 'mode': mode, 'width': width, 'height': height, 'flags': flags}
+    except Exception as e:
+        return {'status': 'bad', 'error': f'{type(e).__name__}: {e}'}
+
+
+def read_manifest(data_dir):
+    path = os.path.join(data_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(data_dir, manifest):
+    path = os.path.join(data_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def quarantine(data_dir, rel_path):
+    """Moves data_dir/rel_path to <data_dir>_quarantine/rel_path, keeping any
+    file already there; returns the new path."""
+    target = os.path.join(os.path.normpath(data_dir) + '_quarantine', rel_path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    base, ext = os.path.splitext(target)
+    n = 1
+    while os.path.exists(target):
+        target = f'{base}.{n}{ext}'
+        n += 1
+    shutil.move(os.path.join(data_dir, rel_path), target)
+    return target
+
+
+def audit_dir(pool, data_dir, args):
+    manifest = read_manifest(data_dir)
+    # Only files still present are carried over
+    current = {}
+    summary = {'classes': {}, 'checked': 0, 'cached': 0, 'ignored': 0, 'bad': [], 'flagged': []}
+    for class_name in list_classes(data_dir):
+        class_dir = os.path.join(data_dir, class_name)
+        entries, todo = {}, []
+        for name in sorted(os.listdir(class_dir)):
+            path = os.path.join(class_dir, name)
+            if not os.path.isfile(path):
+                continue
+            if not name.lower().endswith(IMAGE_EXTS):
+                summary['ignored'] += 1
+                continue
+            rel_path = f'{class_name}/{name}'
+            stat = os.stat(path)
+            cached = manifest.get(rel_path)
+            if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns \
+                    and cached['min_size'] == args.min_size:
+                entries[rel_path] = cached
+                summary['cached'] += 1
+            else:
+                todo.append((rel_path, stat))
+        paths = [os.path.join(data_dir, rel_path) for rel_path, _ in todo]
+        # map() yields results as they arrive, so progress is saved during the class too
+        results = pool.map(check_image, paths, [args.min_size] * len(paths), chunksize=16)
+        for n, ((rel_path, stat), result) in enumerate(zip(todo, results), start=1):
+            entries[rel_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'min_size': args.min_size, **result}
+            if n % MANIFEST_EVERY == 0:
+                write_manifest(data_dir, {**manifest, **current, **entries})
+        summary['checked'] += len(todo)
+
+        counts = {'images': len(entries), 'bad': 0, 'flagged': 0}
+        for rel_path, entry in entries.items():
+            path = os.path.join(data_dir, rel_path)
+            flags = entry.get('flags') or []
+            if entry['status'] == 'bad':
+                counts['bad'] += 1
+                item = {'path': path, 'error': entry['error']}
+                summary['bad'].append(item)
+            elif flags:
+                counts['flagged'] += 1
+                item = {'path': path, 'flags': flags, 'width': entry['width'], 'height': entry['height'],
+                        'mode': entry['mode']}
+                summary['flagged'].append(item)
+            else:
+                current[rel_path] = entry
+                continue
+            if args.quarantine and (entry['status'] == 'bad' or args.quarantine_flagged):
+                item['quarantined_to'] = quarantine(data_dir, rel_path)
+                print(f'  Quarantined {path} -> {item["quarantined_to"]}')
+            else:
+                current[rel_path] = entry
+        summary['classes'][class_name] = counts
+        print(f'{class_name}: {counts["images"]} images, {len(todo)} checked, '
+              f'{counts["bad"]} bad, {counts["flagged"]} flagged')
+        # Written after every class so an interrupted audit resumes where it stopped
+        write_manifest(data_dir, {**manifest, **current})
+    write_manifest(data_dir, current)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit image datasets in parallel and quarantine bad files.")
+    parser.add_argument('data_dirs', nargs='*', default=['plant-disease-data/train', 'plant-disease-data/val'], help='Class-per-folder datasets')
+    parser.add_argument('--min_size', type=int, default=128, help='Flag images whose shorter side is below this')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Decode processes')
+    parser.add_argument('--quarantine', action='store_true', help='Move bad images to <data_dir>_quarantine')
+    parser.add_argument('--quarantine_flagged', action='store_true', help='With --quarantine, move flagged images too')
+    parser.add_argument('--report', type=str, default='audit_report.json', help='Where to write the JSON report')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'min_size': args.min_size, 'datasets': {}}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for data_dir in args.data_dirs:
+            print(f'Auditing {data_dir}')
+            report['datasets'][data_dir] = audit_dir(pool, data_dir, args)
+    report['seconds'] = round(time.perf_counter() - start, 1)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for data_dir, summary in report['datasets'].items():
+        images = sum(c['images'] for c in summary['classes'].values())
+        print(f'{data_dir}: {images} images ({summary["checked"]} decoded, {summary["cached"]} unchanged), '
+              f'{len(summary["bad"])} bad, {len(summary["flagged"])} flagged, {summary["ignored"]} non-image files')
+    print(f'Audit took {report["seconds"]}s. Report written to {args.report}.')
+
+
+if __name__ == '__main__':
+    main()
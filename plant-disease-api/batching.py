@@ -0,0 +1,125 @@
+"""
+batching.py
+
+Dynamic micro-batching in front of a model.
+
+Request threads submit their input tensor and block on a Future. A single
+worker thread per model collects whatever arrives within max_wait_ms (up to
+max_batch_size rows; a request that would go over waits for the next batch,
+and one larger than the cap runs on its own), runs one model.predict() over
+the stacked batch and hands each caller back its own rows.
+
+A request profiled with cProfile skips the queue and calls the model in its
+own thread, where the profiler can see it (request_profiler.py).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import request_profiler
+from metrics import BATCH_SIZE, MODEL_SECONDS
+
+
+class _Request:
+    def __init__(self, x):
+        self.x = x
+        self.rows = x.shape[0]
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        # Filled in by the worker, for request_profiler
+        self.started = None
+        self.model_seconds = None
+        self.batch_rows = None
+
+
+class MicroBatcher:
+    def __init__(self, name, get_model, max_batch_size=16, max_wait_ms=5.0):
+        self.name = name
+        self._get_model = get_model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._start_worker()
+        # Threads don't survive fork(); give each forked worker process its own
+        # queue and batching thread (see serve_prefork.py)
+        os.register_at_fork(after_in_child=self._start_worker)
+
+    def _start_worker(self):
+        self._queue = queue.Queue()
+        # A request taken off the queue that didn't fit in the last batch
+        self._held = None
+        self._worker = threading.Thread(target=self._run, name=f'batcher-{self.name}', daemon=True)
+        self._worker.start()
+
+    def predict(self, x):
+        if request_profiler.runs_cprofile():
+            return self._predict_unbatched(x)
+        request = _Request(x)
+        self._queue.put(request)
+        result = request.future.result()
+        request_profiler.record_batch(self.name, request.started - request.submitted,
+                                      request.model_seconds, request.batch_rows)
+        return result
+
+    def _predict_unbatched(self, x):
+        model = self._get_model()
+        start = time.perf_counter()
+        preds = model.predict(x, batch_size=x.shape[0], verbose=0)
+        model_seconds = time.perf_counter() - start
+        MODEL_SECONDS.observe(model_seconds, self.name)
+        BATCH_SIZE.observe(x.shape[0], self.name)
+        request_profiler.record_batch(self.name, 0.0, model_seconds, x.shape[0])
+        return preds
+
+    def queue_depth(self):
+        return self._queue.qsize() + (self._held is not None)
+
+    def _collect(self):
+        first, self._held = self._held or self._queue.get(), None
+        batch = [first]
+        rows = first.rows
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout <= 0:
+                    request = self._queue.get_nowait()
+                else:
+                    request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if rows + request.rows > self.max_batch_size:
+                self._held = request
+                break
+            batch.append(request)
+            rows += request.rows
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                model = self._get_model()
+                x = batch[0].x if len(batch) == 1 else np.concatenate([r.x for r in batch])
+                start = time.perf_counter()
+                preds = model.predict(x, batch_size=x.shape[0], verbose=0)
+                model_seconds = time.perf_counter() - start
+                MODEL_SECONDS.observe(model_seconds, self.name)
+                BATCH_SIZE.observe(x.shape[0], self.name)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in batch:
+                request.started, request.model_seconds, request.batch_rows = start, model_seconds, x.shape[0]
+                end = offset + request.rows
+                if isinstance(preds, (list, tuple)):
+                    # Multi-output model: slice every head
+                    request.future.set_result([p[offset:end] for p in preds])
+                else:
+                    request.future.set_result(preds[offset:end])
+                offset = end
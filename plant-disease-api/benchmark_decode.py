@@ -0,0 +1,90 @@
+"""
+benchmark_decode.py
+
+Compares full-resolution decoding of uploads with the draft-mode (DCT
+downscaled) decode in preprocess.py: time to decode and build both model
+inputs, peak RSS, and how far the resulting model inputs drift apart.
+
+Each mode runs in its own fresh process so the peak RSS figures don't
+contaminate each other.
+
+Usage:
+  python benchmark_decode.py                       # synthetic phone photos
+  python benchmark_decode.py --image_dir photos/   # your own JPEGs
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+
+from benchmark_service import PHONE_SIZES, synthetic_leaf
+from preprocess import decode_image, image_inputs
+
+
+def load_images(image_dir, count):
+    if image_dir is None:
+        return [synthetic_leaf(PHONE_SIZES[i % len(PHONE_SIZES)], seed=i) for i in range(count)]
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg'):
+            with open(os.path.join(image_dir, name), 'rb') as f:
+                images.append(f.read())
+        if len(images) == count:
+            break
+    return images
+
+
+def run_mode(draft, images, repeats):
+    # Runs in a child process; returns per-image seconds, peak RSS and inputs
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = []
+    for _ in range(repeats):
+        for data in images:
+            start = time.perf_counter()
+            img = decode_image(data, draft=draft)
+            image_inputs(img)
+            seconds.append(time.perf_counter() - start)
+    inputs = [image_inputs(decode_image(data, draft=draft)) for data in images]
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return seconds, baseline_rss, peak_rss, inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full vs draft-mode JPEG decoding.")
+    parser.add_argument('--image_dir', type=str, default=None, help='Directory of JPEGs (default: synthetic phone photos)')
+    parser.add_argument('--images', type=int, default=12, help='Number of images')
+    parser.add_argument('--repeats', type=int, default=3, help='Passes over the images per mode')
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir, args.images)
+    print(f'{len(images)} images, mean {np.mean([len(d) for d in images]) / 1e6:.2f} MB')
+
+    ctx = multiprocessing.get_context('spawn')
+    results = {}
+    for label, draft in (('full', False), ('draft', True)):
+        with ctx.Pool(1) as pool:
+            results[label] = pool.apply(run_mode, (draft, images, args.repeats))
+
+    print(f'{"mode":>6} {"mean ms":>9} {"p95 ms":>9} {"peak RSS MB":>12} {"RSS growth MB":>14}')
+    for label, (seconds, baseline_rss, peak_rss, _) in results.items():
+        ms = np.array(seconds) * 1000
+        print(f'{label:>6} {ms.mean():>9.1f} {np.percentile(ms, 95):>9.1f} '
+              f'{peak_rss / 1024:>12.1f} {(peak_rss - baseline_rss) / 1024:>14.1f}')
+
+    full_ms = np.mean(results['full'][0])
+    draft_ms = np.mean(results['draft'][0])
+    print(f'Draft decode is {full_ms / draft_ms:.1f}x faster')
+
+    # Model inputs on the 0-1 scale: how much the downscaled decode changes them
+    for i, name in enumerate(('identify', 'health')):
+        diffs = [np.abs(full[i] - draft[i]) for full, draft in zip(results['full'][3], results['draft'][3])]
+        print(f'{name} input: mean abs diff {np.mean([d.mean() for d in diffs]):.4f}, '
+              f'max {np.max([d.max() for d in diffs]):.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+benchmark_service.py
+
+Load-testing harness for the /predict service.
+
+Starts the prediction server (the real app.py models, or stub models that
+only simulate inference time, so the HTTP/decode/batching path can be
+measured without TensorFlow), then drives /predict with synthetic leaf
+photos at phone-camera resolutions. For each concurrency level it reports
+throughput, p50/p95/p99 latency and the mean time per pipeline stage taken
+from /metrics. Results are written as JSON so runs can be compared, and
+--compare fails the run when throughput or p95 latency regress.
+
+Usage:
+  python benchmark_service.py --server stub --concurrency 1 4 16
+  python benchmark_service.py --server app --requests 300 --output bench_results/app.json
+  python benchmark_service.py --url http://127.0.0.1:5000 --compare bench_results/baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image, ImageDraw, ImageFilter
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Typical phone camera outputs (width x height)
+PHONE_SIZES = [(4032, 3024), (3024, 4032), (4000, 3000), (1920, 1080)]
+
+# Stub model files: input shape, output classes and simulated compute time
+STUB_MODELS = {
+    'plant_disease_mobilenet_final': {'input_shape': [128, 128, 3], 'classes': ['guava', 'sapota'], 'ms_per_batch': 4, 'ms_per_image': 3},
+    'plant_health_model': {'input_shape': [224, 224, 3], 'classes': ['guava_healthy', 'guava_unhealthy', 'sapota_healthy', 'sapota_unhealthy'], 'ms_per_batch': 6, 'ms_per_image': 8},
+    'disease_model': {'input_shape': [224, 224, 3], 'classes': ['Guava_Anthracnose', 'Guava_Leaf_spot', 'Sapota_Powdery_mildew'], 'ms_per_batch': 6, 'ms_per_image': 8},
+}
+
+
+def synthetic_leaf(size, seed):
+    # Green leaf with a midrib, veins, brown blotches and sensor noise on a
+    # cluttered background; compresses like a real photo rather than a flat fill
+    rng = random.Random(seed)
+    w, h = size
+    img = Image.new('RGB', size, (rng.randint(90, 160), rng.randint(80, 140), rng.randint(60, 110)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(30):
+        x, y = rng.randint(0, w), rng.randint(0, h)
+        r = rng.randint(w // 40, w // 8)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(rng.randint(60, 200), rng.randint(60, 180), rng.randint(40, 140)))
+    cx, cy = w // 2 + rng.randint(-w // 10, w // 10), h // 2 + rng.randint(-h // 10, h // 10)
+    lw, lh = int(w * rng.uniform(0.25, 0.4)), int(h * rng.uniform(0.3, 0.45))
+    green = (rng.randint(30, 80), rng.randint(110, 170), rng.randint(30, 70))
+    draw.ellipse([cx - lw, cy - lh, cx + lw, cy + lh], fill=green)
+    draw.line([cx, cy - lh, cx, cy + lh], fill=(150, 190, 110), width=max(2, w // 300))
+    for i in range(1, 8):
+        y = cy - lh + i * 2 * lh // 8
+        draw.line([cx, y, cx - lw * 3 // 4, y - lh // 6], fill=(110, 170, 90), width=max(1, w // 600))
+        draw.line([cx, y, cx + lw * 3 // 4, y - lh // 6], fill=(110, 170, 90), width=max(1, w // 600))
+    for _ in range(rng.randint(0, 12)):
+        x, y = cx + rng.randint(-lw // 2, lw // 2), cy + rng.randint(-lh // 2, lh // 2)
+        r = rng.randint(w // 200, w // 60)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(rng.randint(90, 140), rng.randint(60, 90), 30))
+    img = img.filter(ImageFilter.GaussianBlur(1))
+    noise = np.random.default_rng(seed).normal(0, 6, (h, w, 3))
+    img = Image.fromarray(np.clip(np.asarray(img, dtype=np.float32) + noise, 0, 255).astype(np.uint8))
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def write_stub_models(directory):
+    for stem, spec in STUB_MODELS.items():
+        with open(os.path.join(directory, stem + '.stub'), 'w') as f:
+            json.dump({'input_shape': spec['input_shape'], 'outputs': [len(spec['classes'])],
+                       'ms_per_batch': spec['ms_per_batch'], 'ms_per_image': spec['ms_per_image']}, f)
+        with open(os.path.join(directory, stem + '.classes.json'), 'w') as f:
+            json.dump({'class_indices': {name: i for i, name in enumerate(spec['classes'])}}, f)
+
+
+def start_server(mode, port, workdir):
+    env = dict(os.environ)
+    # Distinct synthetic images never repeat, but keep the cache out of the numbers anyway
+    env.setdefault('CACHE_MAX_ENTRIES', '0')
+    env['PYTHONPATH'] = API_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    if mode == 'stub':
+        write_stub_models(workdir)
+        env['MODEL_BACKEND'] = 'stub'
+        cwd = workdir
+    else:
+        cwd = API_DIR
+    code = f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return proc, log
+
+
+def wait_until_ready(url, proc, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError('Server exited during startup')
+        try:
+            if requests.get(url + '/readyz', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'Server at {url} not ready after {timeout}s')
+
+
+STAGE_LINE = re.compile(r'^plant_api_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+
+def scrape_stages(url):
+    stages = {}
+    try:
+        text = requests.get(url + '/metrics', timeout=5).text
+    except requests.RequestException:
+        return stages
+    for line in text.splitlines():
+        m = STAGE_LINE.match(line)
+        if m:
+            kind, stage, value = m.groups()
+            stages.setdefault(stage, {'sum': 0.0, 'count': 0.0})[kind] = float(value)
+    return stages
+
+
+def stage_breakdown(before, after):
+    # Mean milliseconds per stage observation over this level
+    breakdown = {}
+    for stage, end in after.items():
+        start = before.get(stage, {'sum': 0.0, 'count': 0.0})
+        count = end['count'] - start['count']
+        if count > 0:
+            breakdown[stage] = (end['sum'] - start['sum']) / count * 1000
+    return breakdown
+
+
+def run_level(url, images, concurrency, total_requests):
+    def one(i):
+        name, data = images[i % len(images)]
+        start = time.perf_counter()
+        try:
+            response = requests.post(url + '/predict', files={'file': (name, data, 'image/jpeg')}, timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    before = scrape_stages(url)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total_requests)))
+    wall = time.perf_counter() - start
+    after = scrape_stages(url)
+
+    latencies = np.array([t for t, ok in outcomes if ok]) * 1000
+    errors = sum(1 for _, ok in outcomes if not ok)
+    level = {
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'errors': errors,
+        'seconds': wall,
+        'throughput_rps': len(latencies) / wall if wall else 0.0,
+        'stages_ms': stage_breakdown(before, after),
+    }
+    if len(latencies):
+        level.update({
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+        })
+    return level
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {lvl['concurrency']: lvl for lvl in json.load(f)['levels']}
+    regressions = []
+    for level in results['levels']:
+        base = baseline.get(level['concurrency'])
+        if base is None or 'p95_ms' not in level or 'p95_ms' not in base:
+            continue
+        if level['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"c={level['concurrency']}: throughput {base['throughput_rps']:.1f} -> {level['throughput_rps']:.1f} req/s")
+        if level['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"c={level['concurrency']}: p95 {base['p95_ms']:.0f} -> {level['p95_ms']:.0f} ms")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=API_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the /predict service.")
+    parser.add_argument('--server', choices=['stub', 'app'], default='stub', help='Server to start: stub models or the real app.py models')
+    parser.add_argument('--url', type=str, default=None, help='Benchmark an already running server instead of starting one')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Concurrency levels to sweep')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per concurrency level')
+    parser.add_argument('--images', type=int, default=24, help='Distinct synthetic images to cycle through')
+    parser.add_argument('--startup_timeout', type=float, default=300, help='Seconds to wait for the server to become ready')
+    parser.add_argument('--output', type=str, default=None, help='Results JSON (default bench_results/<timestamp>.json)')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline results JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression vs the baseline')
+    args = parser.parse_args()
+
+    print(f'Generating {args.images} synthetic leaf photos...')
+    images = []
+    for i in range(args.images):
+        size = PHONE_SIZES[i % len(PHONE_SIZES)]
+        images.append((f'leaf_{i}.jpg', synthetic_leaf(size, seed=i)))
+    print(f'Mean upload size: {np.mean([len(d) for _, d in images]) / 1e6:.2f} MB')
+
+    proc = log = None
+    workdir = tempfile.mkdtemp(prefix='plant-bench-')
+    url = args.url
+    try:
+        if url is None:
+            port = free_port()
+            url = f'http://127.0.0.1:{port}'
+            print(f'Starting {args.server} server on {url} (log: {workdir}/server.log)')
+            proc, log = start_server(args.server, port, workdir)
+        wait_until_ready(url, proc, args.startup_timeout)
+
+        # Warm-up so the first level doesn't pay for lazy initialisation
+        run_level(url, images, 2, 8)
+
+        results = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'server': 'external' if args.url else args.server,
+            'host': {'cpus': os.cpu_count(), 'platform': platform.platform(), 'python': platform.python_version()},
+            'image_sizes': sorted({f'{w}x{h}' for w, h in PHONE_SIZES}),
+            'levels': [],
+        }
+        print(f'{"conc":>5} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"err":>5}')
+        for concurrency in args.concurrency:
+            level = run_level(url, images, concurrency, args.requests)
+            results['levels'].append(level)
+            print(f'{concurrency:>5} {level["throughput_rps"]:>8.1f} {level.get("p50_ms", 0):>8.0f} '
+                  f'{level.get("p95_ms", 0):>8.0f} {level.get("p99_ms", 0):>8.0f} {level["errors"]:>5}')
+            print('      stages (ms): ' + ', '.join(f'{k}={v:.1f}' for k, v in sorted(level['stages_ms'].items())))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+            log.close()
+
+    output = args.output or os.path.join('bench_results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print('Regressions vs baseline:')
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('No regressions vs baseline.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+class_manifest.py
+
+Small JSON files that record a model's class-index mapping next to the model,
+e.g. disease_model.h5 -> disease_model.classes.json. The training scripts
+write them when they save a model and app.py reads them at startup, so the
+server doesn't need the training data on disk and the label order always
+matches the model's class_indices.
+
+For a model trained before manifests existed, write one from the dataset it
+was trained on (flow_from_directory orders classes by sorted folder name):
+  python class_manifest.py disease_model.h5 --data_dir path/to/PlantVillage
+"""
+import argparse
+import json
+import os
+
+
+def manifest_path(model_path):
+    return os.path.splitext(model_path)[0] + '.classes.json'
+
+
+def class_names_from_indices(class_indices):
+    names = [None] * len(class_indices)
+    for name, idx in class_indices.items():
+        names[idx] = name
+    return names
+
+
+def write_class_manifest(model_path, class_indices, heads=None):
+    # heads: {head_name: class_indices} for multi-output models
+    manifest = {'class_indices': class_indices}
+    if heads is not None:
+        manifest = {'heads': {name: {'class_indices': indices} for name, indices in heads.items()}}
+    path = manifest_path(model_path)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'Class manifest saved as {path}.')
+    return path
+
+
+def read_class_manifest(model_path, head=None):
+    path = manifest_path(model_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f'No class manifest {path} for {model_path}. Retrain the model or run: '
+            f'python class_manifest.py {model_path} --data_dir <training data dir>')
+    with open(path) as f:
+        manifest = json.load(f)
+    if head is not None:
+        manifest = manifest['heads'][head]
+    return manifest['class_indices']
+
+
+def read_class_names(model_path, head=None):
+    return class_names_from_indices(read_class_manifest(model_path, head))
+
+
+def class_indices_from_dir(data_dir, exclude=()):
+    names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)) and d.lower() not in exclude)
+    return {name: idx for idx, name in enumerate(names)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a class manifest for an existing model.")
+    parser.add_argument('model_path', type=str, help='Model the manifest belongs to')
+    parser.add_argument('--data_dir', type=str, required=True, help='Class folders the model was trained on')
+    parser.add_argument('--exclude', nargs='*', default=['plantvillage'], help='Folder names that are not classes')
+    args = parser.parse_args()
+    write_class_manifest(args.model_path, class_indices_from_dir(args.data_dir, exclude={e.lower() for e in args.exclude}))
@@ -0,0 +1,32 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+from benchmark_service import write_stub_models
+
+
+@pytest.fixture(scope='session')
+def stub_service(tmp_path_factory):
+    """app.py imported with the benchmark's stub models, loaded synchronously."""
+    workdir = tmp_path_factory.mktemp('stub_models')
+    write_stub_models(str(workdir))
+    env = {'MODEL_BACKEND': 'stub', 'MODEL_LOAD_ASYNC': '0', 'CACHE_MAX_ENTRIES': '0'}
+    saved_env = {name: os.environ.get(name) for name in env}
+    saved_cwd = os.getcwd()
+    os.environ.update(env)
+    # app.py resolves its model files against the working directory at import
+    os.chdir(workdir)
+    try:
+        sys.modules.pop('app', None)
+        service = importlib.import_module('app')
+    finally:
+        os.chdir(saved_cwd)
+    assert service.models_ready.is_set(), service.model_load_error
+    yield service
+    for name, value in saved_env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
@@ -0,0 +1,222 @@
+"""
+export_models.py
+
+Converts trained Keras .h5 models into the formats app.py can serve with
+MODEL_BACKEND: TFLite float32, TFLite float16, TFLite int8 (full-integer
+post-training quantization, calibrated on images from plant-disease-data/val)
+and ONNX. Each export is checked against the .h5 model on an evaluation set
+and the accuracy drop, top-1 agreement, file size and CPU latency are
+reported. Accuracy needs --eval_dir folders named and ordered like the
+model's class manifest (its first head's, for a multi-head model); otherwise
+only agreement is. Without --eval_dir, accuracy is measured on the
+calibration images and reported as calibration-set accuracy, which flatters
+the int8 export calibrated on them.
+
+Usage:
+  python export_models.py --models plant_health_model.h5 disease_model.h5 --calib_dir ../plant-disease-data/val
+  python export_models.py --models plant_health_model.h5 --formats tflite-int8 --eval_dir plant-disease-data/train
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+from class_manifest import class_names_from_indices, manifest_path
+from inference_backends import load_model_file, model_path_for
+from preprocess import decode_image, to_tensor
+
+EXPORT_FORMATS = ['tflite', 'tflite-fp16', 'tflite-int8', 'onnx']
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tiff')
+
+
+def list_labelled_images(data_dir):
+    # Same class order as flow_from_directory: sorted sub-directory names
+    class_names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    samples = []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(data_dir, class_name)
+        for fname in sorted(os.listdir(class_dir)):
+            if fname.lower().endswith(IMAGE_EXTS):
+                samples.append((os.path.join(class_dir, fname), label))
+    return class_names, samples
+
+
+def load_images(samples, size):
+    images, labels = [], []
+    for path, label in samples:
+        try:
+            with open(path, 'rb') as f:
+                images.append(to_tensor(decode_image(f.read()), size))
+            labels.append(label)
+        except Exception as e:
+            print(f'Skipping unreadable image {path}: {e}')
+    return np.concatenate(images), np.array(labels)
+
+
+def convert_tflite(model, fmt, calib_images):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if fmt == 'tflite-fp16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif fmt == 'tflite-int8':
+        def representative_dataset():
+            for x in calib_images:
+                yield [x[np.newaxis].astype(np.float32)]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def convert_onnx(model, path):
+    import tf2onnx
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=path)
+
+
+def write_output_order(model, path, sample):
+    # TFLite doesn't keep Keras output order; match each Keras output to the
+    # TFLite output that reproduces it on a sample batch
+    keras_outputs = model.predict(sample, verbose=0)
+    backend = load_model_file(path)
+    backend._output_order = None
+    tflite_outputs = backend.predict(sample)
+    order = []
+    for expected in keras_outputs:
+        candidates = [i for i, y in enumerate(tflite_outputs) if y.shape == expected.shape and i not in order]
+        order.append(min(candidates, key=lambda i: float(np.mean(np.abs(tflite_outputs[i] - expected)))))
+    with open(path + '.json', 'w') as f:
+        json.dump({'output_order': order}, f)
+
+
+def first_output(preds):
+    return preds[0] if isinstance(preds, list) else preds
+
+
+def measure_latency(predict, x, repeats):
+    predict(x[:1])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict(x[:1])
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def evaluate(predict, images, labels, batch_size=32):
+    preds = np.concatenate([first_output(predict(images[i:i + batch_size])) for i in range(0, len(images), batch_size)])
+    return np.argmax(preds, axis=1), float(np.mean(np.argmax(preds, axis=1) == labels))
+
+
+def first_output_class_names(h5_path):
+    """Class names of the model's first output in index order, or None
+    without a class manifest. A multi-head manifest lists its heads in
+    output order."""
+    path = manifest_path(h5_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if 'heads' in manifest:
+        manifest = next(iter(manifest['heads'].values()))
+    return class_names_from_indices(manifest['class_indices'])
+
+
+def export_model(h5_path, formats, args):
+    print(f'Exporting {h5_path}')
+    model = load_model(h5_path)
+    size = tuple(model.input_shape[1:3])
+
+    _, calib_samples = list_labelled_images(args.calib_dir)
+    random.Random(0).shuffle(calib_samples)
+    calib_images, _ = load_images(calib_samples[:args.num_calib], size)
+    eval_class_names, eval_samples = list_labelled_images(args.eval_dir)
+    eval_images, eval_labels = load_images(eval_samples, size)
+
+    # Accuracy is measured on the first output (the identify head of a fused model)
+    model_class_names = first_output_class_names(h5_path)
+    labelled = model_class_names == eval_class_names
+    if model_class_names is None:
+        print(f'No class manifest for {h5_path}; reporting agreement with the Keras model only.')
+    elif not labelled:
+        print(f'{args.eval_dir} classes {eval_class_names} are not the model\'s {model_class_names} '
+              f'in order; reporting agreement with the Keras model only.')
+    accuracy_on = 'calibration set' if args.eval_is_calibration else args.eval_dir
+
+    keras_predict = lambda x: model.predict(x, verbose=0)
+    keras_top1, keras_acc = evaluate(keras_predict, eval_images, eval_labels)
+    if not labelled:
+        keras_acc = None
+    report = {'keras': {
+        'path': h5_path,
+        'size_mb': os.path.getsize(h5_path) / 1e6,
+        'accuracy': keras_acc,
+        'accuracy_on': accuracy_on if labelled else None,
+        'latency_ms': measure_latency(keras_predict, eval_images, args.repeats),
+    }}
+
+    for fmt in formats:
+        path = model_path_for(h5_path, fmt)
+        try:
+            if fmt == 'onnx':
+                convert_onnx(model, path)
+            else:
+                with open(path, 'wb') as f:
+                    f.write(convert_tflite(model, fmt, calib_images))
+                if len(model.outputs) > 1:
+                    write_output_order(model, path, calib_images[:2])
+        except Exception as e:
+            print(f'  {fmt}: export failed: {e}')
+            report[fmt] = {'error': str(e)}
+            continue
+        backend = load_model_file(path)
+        top1, acc = evaluate(backend.predict, eval_images, eval_labels)
+        report[fmt] = {
+            'path': path,
+            'size_mb': os.path.getsize(path) / 1e6,
+            'accuracy': acc if labelled else None,
+            'accuracy_drop': keras_acc - acc if labelled else None,
+            'accuracy_on': accuracy_on if labelled else None,
+            'agreement_with_keras': float(np.mean(top1 == keras_top1)),
+            'latency_ms': measure_latency(backend.predict, eval_images, args.repeats),
+        }
+
+    print(f'{"format":<12} {"size MB":>8} {"acc":>7} {"drop":>7} {"agree":>7} {"ms/img":>8}')
+    for fmt, row in report.items():
+        if 'error' in row:
+            print(f'{fmt:<12} failed: {row["error"]}')
+            continue
+        acc, drop = ((f'{row["accuracy"]:>7.3f}', f'{row.get("accuracy_drop", 0):>7.3f}') if labelled
+                     else (f'{"-":>7}', f'{"-":>7}'))
+        print(f'{fmt:<12} {row["size_mb"]:>8.2f} {acc} {drop} '
+              f'{row.get("agreement_with_keras", 1):>7.3f} {row["latency_ms"]:>8.2f}')
+    if labelled and args.eval_is_calibration:
+        print('acc is calibration-set accuracy (no --eval_dir); pass held-out folders for an unbiased figure.')
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Keras models to TFLite and ONNX.")
+    parser.add_argument('--models', nargs='+', default=['plant_disease_mobilenet_final.h5', 'plant_health_model.h5', 'disease_model.h5'], help='Keras .h5 models to export')
+    parser.add_argument('--formats', nargs='+', default=EXPORT_FORMATS, choices=EXPORT_FORMATS, help='Formats to export')
+    parser.add_argument('--calib_dir', type=str, default='../plant-disease-data/val', help='Class folders used for int8 calibration')
+    parser.add_argument('--eval_dir', type=str, default=None, help='Held-out class folders for accuracy (default: --calib_dir, reported as calibration-set accuracy)')
+    parser.add_argument('--num_calib', type=int, default=100, help='Calibration images for int8 quantization')
+    parser.add_argument('--repeats', type=int, default=50, help='Timed single-image runs per format')
+    parser.add_argument('--report', type=str, default='export_report.json', help='Where to write the JSON report')
+    args = parser.parse_args()
+    args.eval_is_calibration = (args.eval_dir is None
+                                or os.path.abspath(args.eval_dir) == os.path.abspath(args.calib_dir))
+    args.eval_dir = args.eval_dir or args.calib_dir
+
+    reports = {}
+    for h5_path in args.models:
+        reports[h5_path] = export_model(h5_path, args.formats, args)
+    with open(args.report, 'w') as f:
+        json.dump(reports, f, indent=2)
+    print(f'Export report written to {args.report}')
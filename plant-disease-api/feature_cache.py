@@ -0,0 +1,141 @@
+"""
+feature_cache.py
+
+Trains the Dense head of a frozen-backbone model on cached backbone
+features instead of images.
+
+All the MobileNetV2 models here are trunk -> GlobalAveragePooling2D ->
+Dense(128) -> Dense(num_classes), and while the trunk is frozen every epoch
+recomputes the same trunk output for every image. fit_head() runs the
+trunk once per image (plus once per augmented copy when augment_variants
+is set), stores the pooled features in memory-mapped .npy files under
+cache_dir, and fits the two Dense layers on them. The head model shares
+its layers with the full model, so the full model is trained in place and
+saved as before.
+
+Cached features are reused across runs as long as the trunk weights, image
+size, augmentation settings and image files are unchanged, so trying a new
+head, learning rate or class subset costs seconds.
+
+  model = Model(base_model.input, predictions)   # frozen base_model
+  fit_head(model, train_data, val_data, (224, 224), 'feature_cache', epochs=40)
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Input
+from tensorflow.keras.models import Model
+
+import training_modes
+from input_pipeline import make_dataset
+
+
+def feature_extractor(model):
+    # Trunk plus pooling: the input of the model's Dense head
+    return Model(inputs=model.input, outputs=model.layers[-3].output)
+
+
+def head_model(model):
+    # The model's own Dense layers on a feature input; training it trains them
+    hidden, out = model.layers[-2], model.layers[-1]
+    features = Input(shape=model.layers[-3].output.shape[1:])
+    return Model(inputs=features, outputs=out(hidden(features)))
+
+
+def weights_digest(model):
+    digest = hashlib.sha256()
+    for w in model.get_weights():
+        digest.update(np.ascontiguousarray(w).tobytes())
+    return digest.hexdigest()
+
+
+def extract_features(extractor, data, image_size, cache_dir, augment=None, augment_variants=0, batch_size=64):
+    """Returns (features, labels) memory-mapped from cache_dir, computing
+    them first if no cache matches. Row blocks are the un-augmented images
+    followed by augment_variants augmented passes over the data."""
+    key = hashlib.sha256(json.dumps({
+        'trunk': weights_digest(extractor),
+        'image_size': list(image_size),
+        'data': data.signature(),
+        'augment': augment if augment_variants else None,
+        'augment_variants': augment_variants,
+    }, sort_keys=True).encode()).hexdigest()[:16]
+    features_path = os.path.join(cache_dir, f'{key}.features.npy')
+    labels_path = os.path.join(cache_dir, f'{key}.labels.npy')
+    if os.path.exists(features_path) and os.path.exists(labels_path):
+        print(f'Using cached features {features_path}')
+        return np.load(features_path, mmap_mode='r'), np.load(labels_path, mmap_mode='r')
+
+    os.makedirs(cache_dir, exist_ok=True)
+    rows = data.samples * (1 + augment_variants)
+    dim = extractor.output.shape[-1]
+    features = np.lib.format.open_memmap(features_path + '.tmp', mode='w+', dtype=np.float32, shape=(rows, dim))
+    labels = np.empty(rows, dtype=np.int32)
+    extract = tf.function(lambda x: extractor(x, training=False))
+    start = time.perf_counter()
+    offset = 0
+    for variant in range(1 + augment_variants):
+        ds = make_dataset(data, image_size, batch_size, augment=augment if variant else None)
+        for images, one_hot in ds:
+            n = images.shape[0]
+            features[offset:offset + n] = extract(images).numpy()
+            labels[offset:offset + n] = np.argmax(one_hot.numpy(), axis=1)
+            offset += n
+        print(f'Features for pass {variant + 1}/{1 + augment_variants}: {offset} rows '
+              f'({time.perf_counter() - start:.0f}s)')
+    features.flush()
+    del features
+    # Skipped unreadable images leave fewer rows than planned
+    if offset != rows:
+        full = np.load(features_path + '.tmp', mmap_mode='r')
+        np.save(features_path + '.trim', full[:offset])
+        del full
+        os.replace(features_path + '.trim.npy', features_path + '.tmp')
+    np.save(labels_path, labels[:offset])
+    # Renamed last, so an interrupted run never leaves a cache that looks complete
+    os.replace(features_path + '.tmp', features_path)
+    return np.load(features_path, mmap_mode='r'), np.load(labels_path, mmap_mode='r')
+
+
+def feature_dataset(features, labels, num_classes, batch_size, shuffle=False):
+    # Batches are gathered from the memmap, so only they are ever in memory
+    ds = tf.data.Dataset.range(len(labels))
+    if shuffle:
+        ds = ds.shuffle(len(labels), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    def gather(idx):
+        idx = np.sort(idx)
+        return np.asarray(features[idx]), np.asarray(labels[idx])
+
+    def load(idx):
+        x, y = tf.numpy_function(gather, [idx], [tf.float32, tf.int32])
+        x.set_shape([None, features.shape[1]])
+        return x, tf.one_hot(y, num_classes)
+
+    return ds.map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def fit_head(model, train_data, val_data, image_size, cache_dir, epochs, batch_size=32,
+             augment=None, augment_variants=0, optimizer='adam', callbacks=None, args=None):
+    """Fits model's Dense head on cached trunk features and returns the
+    Keras history. The trunk must be frozen. args: the script's parsed
+    arguments, for training_modes.resumable_fit()."""
+    extractor = feature_extractor(model)
+    train_x, train_y = extract_features(extractor, train_data, image_size, cache_dir, augment, augment_variants)
+    val_x, val_y = extract_features(extractor, val_data, image_size, cache_dir)
+    head = head_model(model)
+    head.compile(optimizer=optimizer, loss='categorical_crossentropy', metrics=['accuracy'],
+                 **training_modes.compile_options())
+    num_classes = model.output.shape[-1]
+    return training_modes.resumable_fit(
+        args, 'head', head,
+        feature_dataset(train_x, train_y, num_classes, batch_size, shuffle=True),
+        validation_data=feature_dataset(val_x, val_y, num_classes, batch_size),
+        epochs=epochs,
+        callbacks=callbacks
+    )
@@ -0,0 +1,185 @@
+"""
+inference_backends.py
+
+Loaders for the model formats app.py can serve: Keras .h5, TFLite
+(float32, float16 or int8, written by export_models.py) and ONNX.
+
+Every backend exposes predict(x, batch_size=None, verbose=0) like a Keras
+model, returning one array, or a list of arrays for multi-output models, so
+the registry and the micro-batcher don't care which one they hold.
+TFLite and ONNX Runtime are only imported when a model in that format is
+loaded.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# MODEL_BACKEND values and the file each one loads next to the .h5 model
+BACKEND_SUFFIXES = {
+    'keras': '.h5',
+    'tflite': '_fp32.tflite',
+    'tflite-fp16': '_fp16.tflite',
+    'tflite-int8': '_int8.tflite',
+    'onnx': '.onnx',
+    # Fake models for load testing without TensorFlow (benchmark_service.py)
+    'stub': '.stub',
+}
+
+
+def model_path_for(h5_path, backend):
+    if backend not in BACKEND_SUFFIXES:
+        raise ValueError(f'Unknown model backend: {backend} (expected one of {", ".join(BACKEND_SUFFIXES)})')
+    return os.path.splitext(h5_path)[0] + BACKEND_SUFFIXES[backend]
+
+
+def backend_for(name):
+    # MODEL_BACKEND_<NAME> (e.g. MODEL_BACKEND_DISEASE=tflite-int8) overrides MODEL_BACKEND
+    return os.getenv(f'MODEL_BACKEND_{name.upper()}', os.getenv('MODEL_BACKEND', 'keras'))
+
+
+def num_threads():
+    value = os.getenv('INFERENCE_THREADS')
+    return int(value) if value else None
+
+
+def configure_tf_threads():
+    # Must run before TensorFlow executes anything; later calls raise and are ignored
+    import tensorflow as tf
+    threads = num_threads()
+    try:
+        if threads:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+        interop = os.getenv('INFERENCE_INTEROP_THREADS')
+        if interop:
+            tf.config.threading.set_inter_op_parallelism_threads(int(interop))
+    except RuntimeError:
+        pass
+
+
+class KerasBackend:
+    def __init__(self, path):
+        configure_tf_threads()
+        from tensorflow.keras.models import load_model
+        self.model = load_model(path)
+        self.input_shape = self.model.input_shape
+
+    def predict(self, x, batch_size=None, verbose=0):
+        return self.model.predict(x, batch_size=batch_size, verbose=verbose)
+
+
+def _tflite_interpreter(path):
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter(model_path=path, num_threads=num_threads())
+
+
+class TFLiteBackend:
+    def __init__(self, path):
+        self._path = path
+        interpreter = _tflite_interpreter(path)
+        interpreter.allocate_tensors()
+        self._input = interpreter.get_input_details()[0]
+        self.input_shape = tuple(self._input['shape'])
+        # Resizing and reallocating on every batch size change is slow, so
+        # batches are padded to a power of two and each size keeps its own
+        # interpreter
+        self._interpreters = {int(self._input['shape'][0]): interpreter}
+        # export_models.py records which TFLite output matches each Keras output
+        order = None
+        manifest_path = path + '.json'
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                order = json.load(f).get('output_order')
+        self._output_order = order
+        # The interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    def _interpreter_for(self, batch):
+        interpreter = self._interpreters.get(batch)
+        if interpreter is None:
+            interpreter = _tflite_interpreter(self._path)
+            interpreter.resize_tensor_input(self._input['index'], [batch] + list(self._input['shape'][1:]))
+            interpreter.allocate_tensors()
+            self._interpreters[batch] = interpreter
+        return interpreter
+
+    def predict(self, x, batch_size=None, verbose=0):
+        rows = x.shape[0]
+        batch = rows if rows in self._interpreters else 1 << (rows - 1).bit_length()
+        if batch != rows:
+            x = np.concatenate([x, np.zeros((batch - rows,) + x.shape[1:], dtype=x.dtype)])
+        with self._lock:
+            interpreter = self._interpreter_for(batch)
+            scale, zero_point = self._input['quantization']
+            if self._input['dtype'] != np.float32 and scale:
+                limits = np.iinfo(self._input['dtype'])
+                x = np.clip(np.round(x / scale + zero_point), limits.min, limits.max)
+            interpreter.set_tensor(self._input['index'], x.astype(self._input['dtype']))
+            interpreter.invoke()
+            outputs = []
+            for detail in interpreter.get_output_details():
+                y = interpreter.get_tensor(detail['index'])[:rows]
+                scale, zero_point = detail['quantization']
+                if detail['dtype'] != np.float32 and scale:
+                    y = (y.astype(np.float32) - zero_point) * scale
+                outputs.append(y)
+        if len(outputs) == 1:
+            return outputs[0]
+        if self._output_order is not None:
+            outputs = [outputs[i] for i in self._output_order]
+        return outputs
+
+
+class OnnxBackend:
+    def __init__(self, path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        threads = num_threads()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self.input_shape = tuple(model_input.shape)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        outputs = self.session.run(None, {self._input_name: x.astype(np.float32)})
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+class StubBackend:
+    # A .stub file is JSON: {"input_shape": [224, 224, 3], "outputs": [4],
+    # "ms_per_batch": 5, "ms_per_image": 2}. predict() sleeps for the
+    # configured time and returns random softmax rows.
+    def __init__(self, path):
+        with open(path) as f:
+            spec = json.load(f)
+        self.input_shape = (None,) + tuple(spec['input_shape'])
+        self._outputs = spec['outputs']
+        self._ms_per_batch = spec.get('ms_per_batch', 0)
+        self._ms_per_image = spec.get('ms_per_image', 0)
+        self._rng = np.random.default_rng(0)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        time.sleep((self._ms_per_batch + self._ms_per_image * x.shape[0]) / 1000)
+        outputs = []
+        for classes in self._outputs:
+            logits = self._rng.normal(size=(x.shape[0], classes)).astype(np.float32) * 3
+            e = np.exp(logits - logits.max(axis=1, keepdims=True))
+            outputs.append(e / e.sum(axis=1, keepdims=True))
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+def load_model_file(path):
+    if path.endswith('.stub'):
+        return StubBackend(path)
+    if path.endswith('.tflite'):
+        return TFLiteBackend(path)
+    if path.endswith('.onnx'):
+        return OnnxBackend(path)
+    return KerasBackend(path)
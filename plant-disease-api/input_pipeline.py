@@ -0,0 +1,287 @@
+"""
+input_pipeline.py
+
+tf.data input pipelines for the training scripts, replacing
+ImageDataGenerator.flow_from_directory.
+
+Files are read and decoded in parallel, decoded images can be cached (in
+memory or in a file), and augmentation runs on whole batches inside the
+graph: one random affine transform per image (rotation, shift, shear and
+zoom, like ImageDataGenerator's random_transform), random flips and
+brightness. Batches are prefetched so the next one is ready while the model
+trains on the current one.
+
+Class folders, class_indices and validation_split behave like
+flow_from_directory, so the trained models and their class manifests are
+unchanged:
+
+  train = image_folder('plant-disease-data/train', subset='training', validation_split=0.2)
+  train_ds = make_dataset(train, (224, 224), 32, augment=STRONG_AUGMENT, shuffle=True)
+  model.fit(train_ds, ...)
+
+load_images() reads the same dataset from the pre-resized TFRecord shards
+written by pack_dataset.py when they exist and are up to date, and from the
+image files otherwise.
+"""
+import hashlib
+import math
+import os
+
+import tensorflow as tf
+
+from pack_dataset import IMAGE_EXTS, packed_dir_for, read_index, size_dir_name, stale_classes
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# The ImageDataGenerator settings the training scripts used (rotation and
+# shear in degrees, shift and zoom as fractions, fill_mode='nearest')
+LIGHT_AUGMENT = {
+    'rotation': 20, 'shift': 0.2, 'shear': 0.2, 'zoom': 0.2,
+    'horizontal_flip': True,
+}
+STRONG_AUGMENT = {
+    'rotation': 40, 'shift': 0.3, 'shear': 0.3, 'zoom': 0.3,
+    'brightness': (0.7, 1.3), 'horizontal_flip': True, 'vertical_flip': True,
+}
+
+
+class FolderData:
+    """Image paths and labels of a class-per-folder dataset, with the same
+    class_indices / classes / num_classes / samples attributes as a
+    flow_from_directory iterator.
+
+    With multi_label, labels is an (images, num_classes) 0/1 matrix and
+    make_dataset yields those rows instead of one-hot labels."""
+
+    def __init__(self, paths, labels, class_indices, multi_label=False):
+        self.paths = paths
+        self.classes = labels
+        self.class_indices = class_indices
+        self.num_classes = len(class_indices)
+        self.samples = len(paths)
+        self.multi_label = multi_label
+
+    def signature(self):
+        # Changes whenever a file is added, removed or rewritten
+        digest = hashlib.sha256()
+        for path, label in zip(self.paths, self.classes):
+            stat = os.stat(path)
+            if self.multi_label:
+                label = ''.join(str(int(v)) for v in label)
+            digest.update(f'{path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+        return digest.hexdigest()
+
+    def decoded(self, image_size, shuffle=False, seed=None, reshuffle=True):
+        # (uint8 image, label) pairs
+        ds = tf.data.Dataset.from_tensor_slices((self.paths, self.classes))
+        if shuffle:
+            # Shuffling paths before decoding costs no image memory
+            ds = ds.shuffle(max(1, self.samples), seed=seed, reshuffle_each_iteration=reshuffle)
+        return ds.map(lambda path, label: (decode_file(path, image_size), label), num_parallel_calls=AUTOTUNE)
+
+
+class PackedData:
+    """A dataset packed by pack_dataset.py, with the same attributes as
+    FolderData."""
+
+    multi_label = False
+
+    def __init__(self, packed_dir, index, subset=None, validation_split=0.0):
+        self.packed_dir = packed_dir
+        self.class_indices = index['class_indices']
+        self.num_classes = len(self.class_indices)
+        self.subset = subset
+        # Records at positions below this are the class's validation files
+        self._n_val = {name: int(entry['files'] * validation_split) for name, entry in index['classes'].items()}
+        self.sizes = index['sizes']
+        self.classes = []
+        for name, entry in index['classes'].items():
+            n_val = self._n_val[name]
+            n = {'validation': n_val, 'training': entry['files'] - n_val}.get(subset, entry['files'])
+            # Approximate when unreadable files were skipped while packing
+            self.classes += [self.class_indices[name]] * min(n, entry['count'])
+        self.samples = len(self.classes)
+        self._fingerprints = {name: entry['fingerprint'] for name, entry in index['classes'].items()}
+
+    def signature(self):
+        digest = hashlib.sha256(f'{self.subset}\0{sorted(self._n_val.items())}\n'.encode())
+        for name, fingerprint in sorted(self._fingerprints.items()):
+            digest.update(f'{name}\0{fingerprint}\n'.encode())
+        return digest.hexdigest()
+
+    def decoded(self, image_size, shuffle=False, seed=None, reshuffle=True):
+        size = size_dir_name(image_size)
+        if size not in self.sizes:
+            raise ValueError(f'{self.packed_dir} has no {size} images (packed: {", ".join(self.sizes)}); '
+                             f'rerun pack_dataset.py with --sizes including {image_size[0]}')
+        files = sorted(tf.io.gfile.glob(os.path.join(self.packed_dir, size, '*', '*.tfrecord')))
+        ds = tf.data.Dataset.from_tensor_slices(files)
+        if shuffle:
+            ds = ds.shuffle(len(files), seed=seed, reshuffle_each_iteration=reshuffle)
+        ds = ds.interleave(tf.data.TFRecordDataset, cycle_length=min(len(files), 16),
+                           num_parallel_calls=AUTOTUNE, deterministic=not shuffle)
+        if shuffle:
+            # Records are small encoded images, so a wide buffer is cheap
+            ds = ds.shuffle(8192, seed=seed, reshuffle_each_iteration=reshuffle)
+        names = list(self.class_indices)
+        labels = tf.lookup.StaticHashTable(tf.lookup.KeyValueTensorInitializer(
+            names, [self.class_indices[n] for n in names], value_dtype=tf.int64), -1)
+        n_val = tf.lookup.StaticHashTable(tf.lookup.KeyValueTensorInitializer(
+            names, [self._n_val[n] for n in names], value_dtype=tf.int64), 0)
+        features = {
+            'image': tf.io.FixedLenFeature([], tf.string),
+            'label': tf.io.FixedLenFeature([], tf.string),
+            'position': tf.io.FixedLenFeature([], tf.int64),
+        }
+        subset = self.subset
+
+        def parse(record):
+            example = tf.io.parse_single_example(record, features)
+            return example['image'], example['label'], example['position']
+
+        def in_subset(image, label, position):
+            if subset == 'validation':
+                return position < n_val.lookup(label)
+            if subset == 'training':
+                return position >= n_val.lookup(label)
+            return tf.constant(True)
+
+        def decode(image, label, position):
+            img = tf.io.decode_jpeg(image, channels=3)
+            img = tf.ensure_shape(img, [image_size[0], image_size[1], 3])
+            return img, tf.cast(labels.lookup(label), tf.int32)
+
+        ds = ds.map(parse, num_parallel_calls=AUTOTUNE).filter(in_subset)
+        return ds.map(decode, num_parallel_calls=AUTOTUNE)
+
+
+def image_folder(data_dir, subset=None, validation_split=0.0):
+    # Classes are the sorted sub-directory names, as in flow_from_directory
+    class_names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    class_indices = {name: idx for idx, name in enumerate(class_names)}
+    paths, labels = [], []
+    for name in class_names:
+        class_dir = os.path.join(data_dir, name)
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTS))
+        # flow_from_directory puts the first validation_split of each class
+        # in the validation subset
+        n_val = int(len(files) * validation_split)
+        if subset == 'validation':
+            files = files[:n_val]
+        elif subset == 'training':
+            files = files[n_val:]
+        paths += [os.path.join(class_dir, f) for f in files]
+        labels += [class_indices[name]] * len(files)
+    print(f'Found {len(paths)} images belonging to {len(class_names)} classes in {data_dir}'
+          + (f' ({subset})' if subset else '') + '.')
+    return FolderData(paths, labels, class_indices)
+
+
+def load_images(data_dir, image_size, subset=None, validation_split=0.0, packed_dir=None):
+    """PackedData from pack_dataset.py's shards (default <data_dir>_packed)
+    when they are packed at image_size and match the files in data_dir,
+    otherwise FolderData over the image files."""
+    packed_dir = packed_dir or packed_dir_for(data_dir)
+    index = read_index(packed_dir)
+    if index is not None:
+        stale = stale_classes(data_dir, index, image_size) if os.path.isdir(data_dir) else []
+        if not stale:
+            data = PackedData(packed_dir, index, subset, validation_split)
+            print(f'Streaming {data.samples} packed images from {packed_dir}'
+                  + (f' ({subset})' if subset else '') + '.')
+            return data
+        print(f'Packed shards in {packed_dir} are out of date for: {", ".join(stale)}. '
+              f'Run: python pack_dataset.py {data_dir}. Reading image files instead.')
+    return image_folder(data_dir, subset, validation_split)
+
+
+def decode_file(path, image_size):
+    data = tf.io.read_file(path)
+    img = tf.io.decode_image(data, channels=3, expand_animations=False)
+    img = tf.image.resize(img, image_size, antialias=True)
+    # Kept as uint8 so a cache holds a quarter of the float32 bytes
+    return tf.cast(tf.round(tf.clip_by_value(img, 0, 255)), tf.uint8)
+
+
+def _affine_matrices(batch, height, width, rotation=0, shift=0.0, shear=0.0, zoom=0.0):
+    # One random transform per image, composed about the image centre and
+    # mapping output pixel coordinates to input coordinates
+    def uniform(limit):
+        return tf.random.uniform([batch], -limit, limit)
+
+    theta = uniform(rotation * math.pi / 180)
+    tx = uniform(shift) * width
+    ty = uniform(shift) * height
+    sh = uniform(shear * math.pi / 180)
+    zx = 1.0 + uniform(zoom)
+    zy = 1.0 + uniform(zoom)
+    zeros, ones = tf.zeros([batch]), tf.ones([batch])
+
+    def matrix(rows):
+        return tf.reshape(tf.stack(rows, axis=1), [batch, 3, 3])
+
+    cx, cy = (width - 1) / 2.0, (height - 1) / 2.0
+    to_centre = matrix([ones, zeros, -cx * ones, zeros, ones, -cy * ones, zeros, zeros, ones])
+    from_centre = matrix([ones, zeros, cx * ones, zeros, ones, cy * ones, zeros, zeros, ones])
+    rotate = matrix([tf.cos(theta), -tf.sin(theta), zeros, tf.sin(theta), tf.cos(theta), zeros, zeros, zeros, ones])
+    translate = matrix([ones, zeros, tx, zeros, ones, ty, zeros, zeros, ones])
+    shear_m = matrix([ones, -tf.sin(sh), zeros, zeros, tf.cos(sh), zeros, zeros, zeros, ones])
+    scale = matrix([zx, zeros, zeros, zeros, zy, zeros, zeros, zeros, ones])
+    m = from_centre @ rotate @ translate @ shear_m @ scale @ to_centre
+    return tf.reshape(m, [batch, 9])[:, :8]
+
+
+def augment_batch(images, rotation=0, shift=0.0, shear=0.0, zoom=0.0, brightness=None,
+                  horizontal_flip=False, vertical_flip=False):
+    """Randomly transforms a float32 batch [N, H, W, 3] with pixel values 0-255."""
+    shape = tf.shape(images)
+    batch, height, width = shape[0], shape[1], shape[2]
+    if rotation or shift or shear or zoom:
+        transforms = _affine_matrices(batch, tf.cast(height, tf.float32), tf.cast(width, tf.float32),
+                                      rotation, shift, shear, zoom)
+        images = tf.raw_ops.ImageProjectiveTransformV3(
+            images=images, transforms=transforms, output_shape=shape[1:3],
+            fill_value=0.0, interpolation='BILINEAR', fill_mode='NEAREST')
+    if horizontal_flip:
+        flip = tf.random.uniform([batch, 1, 1, 1]) < 0.5
+        images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+    if vertical_flip:
+        flip = tf.random.uniform([batch, 1, 1, 1]) < 0.5
+        images = tf.where(flip, tf.reverse(images, axis=[1]), images)
+    if brightness is not None:
+        factor = tf.random.uniform([batch, 1, 1, 1], brightness[0], brightness[1])
+        images = tf.clip_by_value(images * factor, 0.0, 255.0)
+    return images
+
+
+def make_dataset(data, image_size, batch_size, augment=None, shuffle=False, cache=None, seed=None):
+    """Batched (images, one-hot labels) dataset for FolderData or PackedData
+    (0/1 label vectors for multi-label FolderData), with pixel values
+    rescaled to 0-1 like ImageDataGenerator(rescale=1./255).
+
+    augment: keyword arguments for augment_batch (e.g. STRONG_AUGMENT).
+    cache: True to keep decoded images in memory, or a file path prefix to
+    cache them on disk; decoding then only happens in the first epoch.
+    """
+    image_size = tuple(image_size)
+    # A cached dataset is shuffled once before caching, so the cache isn't in
+    # class-sorted file order, and then reshuffled through a bounded buffer
+    # every epoch
+    ds = data.decoded(image_size, shuffle=shuffle, seed=seed, reshuffle=not cache)
+    if cache:
+        ds = ds.cache('' if cache is True else cache)
+        if shuffle:
+            ds = ds.shuffle(max(1, min(data.samples, 4096)), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    num_classes = data.num_classes
+    multi_label = data.multi_label
+
+    def finish(images, labels):
+        images = tf.cast(images, tf.float32)
+        if augment:
+            images = augment_batch(images, **augment)
+        labels = tf.cast(labels, tf.float32) if multi_label else tf.one_hot(labels, num_classes)
+        return images / 255.0, labels
+
+    ds = ds.map(finish, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
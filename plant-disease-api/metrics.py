@@ -0,0 +1,179 @@
+"""
+metrics.py
+
+Minimal Prometheus instrumentation for the prediction service: counters,
+gauges and histograms with labels, rendered in the Prometheus text exposition
+format for the /metrics endpoint, plus stage_timer() for timing a block of
+code into the per-stage latency histogram.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import request_profiler
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        # callback() -> {labels tuple: value}, read at scrape time
+        self._callback = callback
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount=1.0):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            values.update(self._callback())
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        # {labels: (sum, count)}
+        with self._lock:
+            return {k: (s[1], s[2]) for k, s in self._series.items()}
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, ([*s[0]], s[1], s[2])) for k, s in self._series.items())
+        for labels, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = (('le', _format_value(bound)),)
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {bucket_count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'plant_api_stage_seconds', 'Time spent in each stage of a prediction request.', ['stage']))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'plant_api_request_seconds', 'End-to-end request latency.', ['endpoint']))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'plant_api_requests_total', 'Requests served, by endpoint and HTTP status.', ['endpoint', 'status']))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'plant_api_in_flight_requests', 'Requests currently being handled.'))
+MODEL_SECONDS = REGISTRY.register(Histogram(
+    'plant_api_model_predict_seconds', 'Time of one batched model predict() call.', ['model']))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    'plant_api_startup_seconds', 'Seconds from process start until models were ready / the first prediction was served.', ['phase']))
+CASCADE_EXITS = REGISTRY.register(Counter(
+    'plant_api_cascade_exits_total', 'Images by the pipeline stage that settled them '
+    '(unsupported/prescreen: pre-screen, health: health model, disease: disease model).', ['stage']))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    'plant_api_batch_size', 'Images per batched model predict() call.', ['model'], buckets=BATCH_SIZE_BUCKETS))
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    # Also lands in the request's timing breakdown when it is being profiled
+    request_profiler.record(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
@@ -0,0 +1,136 @@
+"""
+model_registry.py
+
+Process-wide registry for the Keras models served by app.py.
+
+Each model is loaded once and kept warm. A background watcher polls the
+model files and, when a file changes, loads the new version next to the old
+one and swaps the reference atomically. Requests that already hold the old
+model keep using it until they finish, so nothing is dropped mid-flight.
+"""
+import os
+import threading
+import time
+
+
+class ModelEntry:
+    def __init__(self, name, path, model, signature, version, load_seconds, warmup_seconds):
+        self.name = name
+        self.path = path
+        self.model = model
+        self.signature = signature
+        self.version = version
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+
+
+def file_signature(path):
+    # (mtime, size) changes whenever a new .h5 is written over the old one
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ModelRegistry:
+    def __init__(self, loader, warm_up=None):
+        self._loader = loader
+        # warm_up(model) runs before a model is swapped in, so the first
+        # request on a new version doesn't pay for graph building
+        self._warm_up = warm_up
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._pending = {}
+        self._listeners = []
+        self._watcher = None
+        self._watch_interval = None
+        self._stop = threading.Event()
+        os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def register(self, name, path):
+        entry = self._load(name, path, version=1)
+        with self._lock:
+            self._entries[name] = entry
+        return entry.model
+
+    def get(self, name):
+        # Callers keep the returned reference for the whole request
+        with self._lock:
+            return self._entries[name].model
+
+    def entry(self, name):
+        with self._lock:
+            return self._entries[name]
+
+    def names(self):
+        with self._lock:
+            return list(self._entries)
+
+    def add_listener(self, callback):
+        # callback(name, entry) runs after a model has been swapped in
+        self._listeners.append(callback)
+
+    def _load(self, name, path, version):
+        start = time.perf_counter()
+        signature = file_signature(path)
+        model = self._loader(path)
+        load_seconds = time.perf_counter() - start
+        warmup_seconds = 0.0
+        if self._warm_up is not None:
+            start = time.perf_counter()
+            self._warm_up(model)
+            warmup_seconds = time.perf_counter() - start
+        print(f'Loaded model {name} v{version} from {path} in {load_seconds:.2f}s (warm-up {warmup_seconds:.2f}s)')
+        return ModelEntry(name, path, model, signature, version, load_seconds, warmup_seconds)
+
+    def reload_if_changed(self, name):
+        with self._reload_lock:
+            current = self.entry(name)
+            try:
+                signature = file_signature(current.path)
+            except OSError:
+                # File is being replaced; try again on the next poll
+                return False
+            if signature == current.signature:
+                self._pending.pop(name, None)
+                return False
+            # Wait until the file has stopped changing before loading it, so a
+            # half-copied .h5 is never picked up
+            if self._pending.get(name) != signature:
+                self._pending[name] = signature
+                return False
+            try:
+                entry = self._load(name, current.path, current.version + 1)
+            except Exception as e:
+                print(f'Reload of model {name} failed, keeping v{current.version}: {e}')
+                return False
+            self._pending.pop(name, None)
+            with self._lock:
+                self._entries[name] = entry
+        for callback in self._listeners:
+            callback(name, entry)
+        return True
+
+    def check_for_updates(self):
+        for name in self.names():
+            self.reload_if_changed(name)
+
+    def _restart_after_fork(self):
+        # Locks may have been copied mid-use and the watcher thread is gone
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        if self._watcher is not None:
+            self._watcher = None
+            self.start_watcher(self._watch_interval)
+
+    def start_watcher(self, interval=5.0):
+        if self._watcher is not None:
+            return
+        self._watch_interval = interval
+        def watch():
+            while not self._stop.wait(interval):
+                self.check_for_updates()
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
@@ -1,15 +1,8 @@
 import os
 import pandas as pd
-from sklearn.preprocessing import MultiLabelBinarizer
 
-# Example: symptoms for multi-label classification
-SYMPTOM_LABELS = [
-    "leaf_spots",
-    "leaf_distortion",
-    "twig_blight",
-    "cankers",
-    "premature_defoliation"
-]
+# Symptoms for multi-label classification (the list lives in symptom_labels.py)
+from symptom_labels import SYMPTOM_LABELS
 
 # Example: CSV format for multi-label dataset
 # Columns: image_path, symptoms (comma-separated)
@@ -34,9 +27,9 @@ for disease in os.listdir(DATASET_PATH):
 df = pd.DataFrame(output_rows)
 df.to_csv("multi_label_symptom_template.csv", index=False)
 print("Template CSV created: multi_label_symptom_template.csv. Fill in symptoms for each image.")
+print("Known symptoms:", ", ".join(SYMPTOM_LABELS))
 
-# Example: How to use MultiLabelBinarizer for training
-# df = pd.read_csv("multi_label_symptom_template.csv")
-# mlb = MultiLabelBinarizer(classes=SYMPTOM_LABELS)
-# y = mlb.fit_transform(df["symptoms"].str.split(","))
-# Now y can be used as multi-label targets for model training.
+# Once filled in, compile it into a label store and train the symptom head:
+#   python symptom_labels.py multi_label_symptom_template.csv
+#   python train_symptom_model.py --labels symptom_labels.npz --disease_model disease_model.h5
+# Write 'none' for images with no symptoms; blank rows are treated as not labelled yet.
@@ -0,0 +1,216 @@
+"""
+pack_dataset.py
+
+Packs a class-per-folder image dataset into sharded TFRecords, with every
+image decoded once and stored pre-resized (as high-quality JPEG) at each
+training resolution, so training epochs read small records instead of
+re-decoding full-size photos.
+
+Layout of the packed directory (default: <data_dir>_packed):
+  index.json                              classes, per-class fingerprints and counts
+  224x224/<class>/shard-00000.tfrecord    one shard series per class and size
+
+Each record holds the encoded image, its class name and its position in
+the class's sorted file list, which is what flow_from_directory's
+validation_split is based on.
+
+Re-running only repacks classes whose files changed (added, removed,
+resized or touched), and drops classes that no longer exist. The training
+scripts use the packed shards automatically while they are up to date (see
+input_pipeline.load_images).
+
+Usage:
+  python pack_dataset.py plant-disease-data/train --sizes 128 224
+  python pack_dataset.py plant-disease-data/val --sizes 128 224
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+INDEX_NAME = 'index.json'
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def packed_dir_for(data_dir):
+    return os.path.normpath(data_dir) + '_packed'
+
+
+def size_dir_name(size):
+    return f'{size[0]}x{size[1]}'
+
+
+def class_files(data_dir, class_name):
+    class_dir = os.path.join(data_dir, class_name)
+    return sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTS))
+
+
+def list_classes(data_dir):
+    return sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+
+
+def class_fingerprint(data_dir, class_name, files=None):
+    # Any added, removed or rewritten file changes (name, size, mtime)
+    files = class_files(data_dir, class_name) if files is None else files
+    digest = hashlib.sha256()
+    for name in files:
+        stat = os.stat(os.path.join(data_dir, class_name, name))
+        digest.update(f'{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+def read_index(packed_dir):
+    path = os.path.join(packed_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def stale_classes(data_dir, index, size=None):
+    """Classes whose packed shards don't match the files in data_dir (or
+    weren't packed at size), including classes added or removed since."""
+    current = list_classes(data_dir)
+    packed = index['classes'] if index else {}
+    stale = sorted(set(packed) - set(current))
+    for name in current:
+        entry = packed.get(name)
+        if (entry is None or entry['fingerprint'] != class_fingerprint(data_dir, name)
+                or (size is not None and size_dir_name(size) not in index['sizes'])):
+            stale.append(name)
+    return stale
+
+
+def encode_image(path, sizes, quality):
+    # Runs in a worker process: one decode, one JPEG per target size.
+    # Returns None for files that can't be decoded.
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            img.draft('RGB', (max(max(s) for s in sizes),) * 2)
+            img = img.convert('RGB')
+            encoded = []
+            for size in sizes:
+                buf = io.BytesIO()
+                img.resize((size[1], size[0]), Image.BILINEAR).save(buf, format='JPEG', quality=quality)
+                encoded.append(buf.getvalue())
+        return encoded
+    except Exception as e:
+        print(f'  Skipping unreadable image {path}: {e}')
+        return None
+
+
+def pack_class(pool, data_dir, packed_dir, class_name, files, sizes, shard_size, quality):
+    """Writes the class's shards for every size; returns the number of
+    records written."""
+    import tensorflow as tf
+
+    def feature(value):
+        if isinstance(value, int):
+            return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+        return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+    for size in sizes:
+        class_dir = os.path.join(packed_dir, size_dir_name(size), class_name)
+        shutil.rmtree(class_dir, ignore_errors=True)
+        os.makedirs(class_dir)
+    paths = [os.path.join(data_dir, class_name, f) for f in files]
+    # size directory name -> (shard number, open writer)
+    writers = {}
+    written = 0
+    results = pool.map(encode_image, paths, [sizes] * len(paths), [quality] * len(paths), chunksize=8)
+    for position, encoded in enumerate(results):
+        if encoded is None:
+            # Positions of the other files stay those of the sorted file list
+            continue
+        shard = position // shard_size
+        for size, data in zip(sizes, encoded):
+            name = size_dir_name(size)
+            current = writers.get(name)
+            if current is None or current[0] != shard:
+                if current is not None:
+                    current[1].close()
+                path = os.path.join(packed_dir, name, class_name, f'shard-{shard:05d}.tfrecord')
+                writers[name] = (shard, tf.io.TFRecordWriter(path))
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'image': feature(data),
+                'label': feature(class_name.encode()),
+                'position': feature(position),
+            }))
+            writers[name][1].write(example.SerializeToString())
+        written += 1
+    for _, writer in writers.values():
+        writer.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack an image folder dataset into resized TFRecord shards.")
+    parser.add_argument('data_dir', type=str, help='Class-per-folder dataset')
+    parser.add_argument('--out_dir', type=str, default=None, help='Packed output directory (default <data_dir>_packed)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[128, 224], help='Square image sizes to store')
+    parser.add_argument('--shard_size', type=int, default=1000, help='Images per shard')
+    parser.add_argument('--quality', type=int, default=95, help='JPEG quality of the stored images')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Decode processes')
+    parser.add_argument('--force', action='store_true', help='Repack every class')
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or packed_dir_for(args.data_dir)
+    sizes = [(s, s) for s in args.sizes]
+    index = read_index(out_dir)
+    if index is not None and sorted(index['sizes']) != sorted(size_dir_name(s) for s in sizes):
+        print('Packed sizes changed; repacking every class.')
+        for name in index['sizes']:
+            shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+        index = None
+    packed = index['classes'] if index and not args.force else {}
+
+    classes = list_classes(args.data_dir)
+    for name in set(packed) - set(classes):
+        print(f'Removing class {name}')
+        for size in sizes:
+            shutil.rmtree(os.path.join(out_dir, size_dir_name(size), name), ignore_errors=True)
+        del packed[name]
+
+    start = time.perf_counter()
+    repacked = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for name in classes:
+            files = class_files(args.data_dir, name)
+            fingerprint = class_fingerprint(args.data_dir, name, files)
+            if name in packed and packed[name]['fingerprint'] == fingerprint:
+                continue
+            print(f'Packing {name}: {len(files)} images')
+            count = pack_class(pool, args.data_dir, out_dir, name, files, sizes, args.shard_size, args.quality)
+            # 'files' is what validation_split is taken from, 'count' what was written
+            packed[name] = {'fingerprint': fingerprint, 'files': len(files), 'count': count}
+            repacked += 1
+            # Written after every class so an interrupted run resumes where it stopped
+            write_index(out_dir, args.data_dir, sizes, packed)
+
+    write_index(out_dir, args.data_dir, sizes, packed)
+    total = sum(entry['count'] for entry in packed.values())
+    print(f'{repacked} of {len(classes)} classes repacked in {time.perf_counter() - start:.1f}s; '
+          f'{total} images in {out_dir}.')
+
+
+def write_index(out_dir, data_dir, sizes, packed):
+    os.makedirs(out_dir, exist_ok=True)
+    index = {
+        'source': os.path.abspath(data_dir),
+        'sizes': [size_dir_name(s) for s in sizes],
+        'class_indices': {name: idx for idx, name in enumerate(sorted(packed))},
+        'classes': dict(sorted(packed.items())),
+    }
+    path = os.path.join(out_dir, INDEX_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+prediction_cache.py
+
+LRU/TTL cache of /predict results.
+
+Entries are keyed by the SHA-256 of the uploaded bytes. When
+phash_distance >= 0, a 64-bit difference hash (dHash) of the decoded image is
+also stored, so a recompressed or slightly resized copy of a photo within
+that Hamming distance is served from the cache as well. The cache is bounded
+by entry count and by an estimate of the memory its results use.
+
+Keys come from PredictionCache.key(), which tags them with the cache's
+generation. clear() starts a new generation, so a result computed by the old
+models and put() after the clear (by a request already in flight when the
+models were swapped) is dropped instead of outliving it.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-entry bookkeeping cost (key, hash, OrderedDict node) on top of the result
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(img, hash_size=8):
+    small = img.convert('L').resize((hash_size + 1, hash_size))
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class _Entry:
+    def __init__(self, result, phash, expires_at, size):
+        self.result = result
+        self.phash = phash
+        self.expires_at = expires_at
+        self.size = size
+
+
+class PredictionCache:
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl_seconds=3600, phash_distance=-1):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.phash_distance = phash_distance
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @property
+    def uses_phash(self):
+        return self.enabled and self.phash_distance >= 0
+
+    def key(self, content_key):
+        return self.generation, content_key
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+    def get_similar(self, phash):
+        if not self.uses_phash:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_distance = None, self.phash_distance + 1
+            for key, entry in self._entries.items():
+                if entry.phash is None or entry.expires_at < now:
+                    continue
+                distance = (entry.phash ^ phash).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.similar_hits += 1
+            return self._entries[best_key].result
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key, result, phash=None):
+        if not self.enabled:
+            return
+        size = len(json.dumps(result)) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key[0] != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(result, phash, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,56 @@
+"""
+preprocess.py
+
+In-memory decoding of uploaded images for the prediction models.
+
+The upload is decoded once and both model inputs (128x128 for the identify
+model, 224x224 for the health and disease models) are built from that one
+decoded image, so nothing touches the filesystem.
+
+JPEGs are decoded in draft mode: libjpeg scales by 1/2, 1/4 or 1/8 in the
+DCT domain while decoding, to the smallest scale that still leaves both
+sides at least as large as the biggest model input. A 12-megapixel phone
+photo then decodes as roughly 500x380 instead of 4032x3024. Images that
+declare more than MAX_IMAGE_PIXELS pixels are rejected from their header,
+before any pixel memory is allocated.
+"""
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+IDENTIFY_SIZE = (128, 128)
+HEALTH_SIZE = (224, 224)
+# Decoded images are never scaled below the largest model input
+MIN_DECODE_SIZE = max(IDENTIFY_SIZE + HEALTH_SIZE)
+# Decompression bomb limit; 50 MP is well above any phone camera
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(50_000_000)))
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def decode_image(data, draft=True):
+    # Image.open() only parses the header; pixels are decoded by convert()
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as e:
+        # Pillow's own limit, hit before ours when MAX_IMAGE_PIXELS is raised past it
+        raise ImageTooLarge(str(e)) from e
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f'Image is {width}x{height}; the limit is {MAX_IMAGE_PIXELS:,} pixels')
+    if draft and img.format == 'JPEG':
+        img.draft('RGB', (MIN_DECODE_SIZE, MIN_DECODE_SIZE))
+    return img.convert('RGB')
+
+
+def to_tensor(img, size):
+    x = np.asarray(img.resize(size), dtype=np.float32)
+    return np.expand_dims(x, axis=0) / 255.0
+
+
+def image_inputs(img):
+    return to_tensor(img, IDENTIFY_SIZE), to_tensor(img, HEALTH_SIZE)
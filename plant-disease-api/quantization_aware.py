@@ -0,0 +1,138 @@
+"""
+quantization_aware.py
+
+Optional quantization-aware fine-tuning (--qat_epochs N) for the disease
+and health trainers, run after their frozen-base training.
+
+Post-training int8 quantization (export_models.py --formats tflite-int8)
+rounds weights and activations the model never saw during training, which
+costs the most on the subtle disease classes. Here the trained model is
+wrapped with tensorflow_model_optimization's fake-quantization layers and
+fine-tuned for a few epochs at a low learning rate, so it learns weights
+that survive int8. The result is converted to a fully integer TFLite model
+(int8 weights, activations, input and output) and written where app.py's
+tflite-int8 backend looks for it, next to the float .h5 model:
+  disease_model.h5 -> disease_model_int8.tflite
+
+The float model is evaluated next to the int8 one on the validation images
+(accuracy, agreement, size and single-image CPU latency), and the report is
+written to <output>.qat.json.
+
+Needs tensorflow-model-optimization (pip install tensorflow-model-optimization).
+QAT always runs in float32, whatever --precision the first phase used.
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+
+import training_modes
+from export_models import first_output, measure_latency
+from inference_backends import load_model_file, model_path_for
+
+
+def add_arguments(parser):
+    parser.add_argument('--qat_epochs', type=int, default=0, help='Quantization-aware fine-tuning epochs (0 = off)')
+    parser.add_argument('--qat_learning_rate', type=float, default=1e-5, help='Adam learning rate for quantization-aware fine-tuning')
+
+
+def check_available(parser, args):
+    # Fail before the first phase trains, not after
+    if not args.qat_epochs:
+        return
+    try:
+        import tensorflow_model_optimization  # noqa: F401
+    except ImportError:
+        parser.error('--qat_epochs needs tensorflow-model-optimization (pip install tensorflow-model-optimization)')
+
+
+def convert_int8(qat_model):
+    converter = tf.lite.TFLiteConverter.from_keras_model(qat_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def evaluate_batches(predicts, ds):
+    """Top-1 predictions of each predict function and the labels, computed a
+    batch of ds (a make_dataset() dataset) at a time so the validation images
+    are never all held in memory; also returns one image for latency runs."""
+    top1 = [[] for _ in predicts]
+    labels = []
+    sample = None
+    for x, y in ds:
+        x = x.numpy()
+        if sample is None:
+            sample = x[:1]
+        labels.append(np.argmax(y.numpy(), axis=1))
+        for preds, predict in zip(top1, predicts):
+            preds.append(np.argmax(first_output(predict(x)), axis=1))
+    return [np.concatenate(preds) for preds in top1], np.concatenate(labels), sample
+
+
+def fine_tune(model, train_ds, val_ds, output, args, callbacks=None, repeats=50):
+    """Quantization-aware fine-tunes a copy of model (already saved as
+    output), writes the int8 TFLite model next to it and returns the
+    float vs int8 report."""
+    import tensorflow_model_optimization as tfmot
+
+    policy = tf.keras.mixed_precision.global_policy()
+    float_model = training_modes.float32_model(model)
+    tf.keras.mixed_precision.set_global_policy('float32')
+    try:
+        qat_model = tfmot.quantization.keras.quantize_model(float_model)
+        qat_model.compile(optimizer=Adam(learning_rate=args.qat_learning_rate), loss='categorical_crossentropy',
+                          metrics=['accuracy'], **training_modes.compile_options())
+        print(f'Quantization-aware fine-tuning for {args.qat_epochs} epochs')
+        training_modes.resumable_fit(
+            args, 'qat', qat_model,
+            train_ds,
+            validation_data=val_ds,
+            epochs=args.qat_epochs,
+            callbacks=callbacks
+        )
+        int8_path = model_path_for(output, 'tflite-int8')
+        with open(int8_path, 'wb') as f:
+            f.write(convert_int8(qat_model))
+    finally:
+        tf.keras.mixed_precision.set_global_policy(policy)
+    print(f'Int8 TFLite model saved as {int8_path}.')
+
+    float_predict = lambda x: float_model.predict(x, verbose=0)
+    backend = load_model_file(int8_path)
+    (float_top1, int8_top1), labels, sample = evaluate_batches([float_predict, backend.predict], val_ds)
+    float_acc = float(np.mean(float_top1 == labels))
+    int8_acc = float(np.mean(int8_top1 == labels))
+    report = {
+        'float': {
+            'path': output,
+            'size_mb': os.path.getsize(output) / 1e6,
+            'accuracy': float_acc,
+            'latency_ms': measure_latency(float_predict, sample, repeats),
+        },
+        'int8': {
+            'path': int8_path,
+            'size_mb': os.path.getsize(int8_path) / 1e6,
+            'accuracy': int8_acc,
+            'accuracy_drop': float_acc - int8_acc,
+            'agreement_with_float': float(np.mean(int8_top1 == float_top1)),
+            'latency_ms': measure_latency(backend.predict, sample, repeats),
+        },
+        'qat_epochs': args.qat_epochs,
+        'qat_learning_rate': args.qat_learning_rate,
+    }
+    report_path = os.path.splitext(output)[0] + '.qat.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'{"model":<6} {"size MB":>8} {"acc":>7} {"drop":>7} {"agree":>7} {"ms/img":>8}')
+    for name in ('float', 'int8'):
+        row = report[name]
+        print(f'{name:<6} {row["size_mb"]:>8.2f} {row["accuracy"]:>7.3f} {row.get("accuracy_drop", 0):>7.3f} '
+              f'{row.get("agreement_with_float", 1):>7.3f} {row["latency_ms"]:>8.2f}')
+    print(f'Report written to {report_path}')
+    return report
@@ -0,0 +1,224 @@
+"""
+request_profiler.py
+
+Opt-in profiling of a single /predict request.
+
+A trusted client sends the X-Profile header or ?profile= query parameter and
+gets a "profile" object in the JSON response: milliseconds spent in upload,
+decode, each resize and each model call (split into time queued in the
+micro-batcher and the batched predict() it ran in), and whether the disease
+branch ran. Every stage_timer() block in the request records into the
+active profile, so new stages show up without changes here.
+
+  X-Profile: 1 (or timing)   timing breakdown only
+  X-Profile: cprofile        also dump cProfile stats for the request's work
+  X-Profile: tf              also capture a TensorFlow profiler trace
+
+Dumps go to PROFILE_DIR and their path is returned in the response. The
+TensorFlow profiler is process-wide, so only one trace runs at a time and
+it includes any other requests being served meanwhile. cProfile is limited
+to one profiler per process too (Python 3.12+ refuses a second one), so a
+cprofile request arriving while another runs gets a 429. cProfile only sees
+the thread it was enabled in, so a cprofile request bypasses the
+micro-batchers and runs its model calls itself (batching.py), and the dump
+includes them; their "queued_ms" is 0. Under asgi_app.py the profiler is
+switched on only inside the executor calls (run_with), not around the event
+loop, which is busy with other requests.
+
+PROFILE_TRUSTED_NETWORKS (comma-separated, default loopback only) lists the
+client addresses allowed to profile.
+"""
+import contextvars
+import cProfile
+import ipaddress
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAM = 'profile'
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_TRUSTED_NETWORKS = [
+    ipaddress.ip_network(net.strip(), strict=False)
+    for net in os.getenv('PROFILE_TRUSTED_NETWORKS', '127.0.0.1/32,::1/128').split(',') if net.strip()
+]
+MODES = {'1': 'timing', 'true': 'timing', 'timing': 'timing', 'cprofile': 'cprofile', 'tf': 'tf'}
+
+_active = contextvars.ContextVar('request_profile', default=None)
+# The TensorFlow profiler can only run one trace per process
+_tf_trace_lock = threading.Lock()
+# Likewise only one cProfile profiler may be enabled at a time
+_cprofile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def requested_mode(headers, args):
+    """Returns None, or the profiling mode asked for by the request. Raises
+    ValueError for an unknown mode."""
+    value = headers.get(PROFILE_HEADER) or args.get(PROFILE_PARAM)
+    if not value:
+        return None
+    mode = MODES.get(value.strip().lower())
+    if mode is None:
+        raise ValueError(f'Unknown profile mode: {value} (expected one of {", ".join(MODES)})')
+    return mode
+
+
+def is_trusted(remote_addr):
+    try:
+        addr = ipaddress.ip_address(remote_addr)
+    except (TypeError, ValueError):
+        return False
+    return any(addr in net for net in PROFILE_TRUSTED_NETWORKS)
+
+
+class RequestProfile:
+    def __init__(self, mode):
+        self.mode = mode
+        self.id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+        self.start = time.perf_counter()
+        self.stages = []
+        self.models = {}
+        self.notes = {}
+        # Set when run_with() should enable cProfile around executor calls
+        self.profiler = None
+
+    def record(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def record_batch(self, model, wait_seconds, model_seconds, batch_rows):
+        self.models[model] = {
+            'queued_ms': round(wait_seconds * 1000, 3),
+            'predict_ms': round(model_seconds * 1000, 3),
+            'batch_rows': batch_rows,
+        }
+
+    def to_dict(self):
+        stages = {}
+        for stage, seconds in self.stages:
+            stages[stage] = round(stages.get(stage, 0.0) + seconds * 1000, 3)
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'stages_ms': stages,
+            'models': self.models,
+            **self.notes,
+        }
+
+
+def current():
+    return _active.get()
+
+
+def runs_cprofile():
+    # True in a thread whose request is being profiled with cProfile
+    profile = _active.get()
+    return profile is not None and profile.mode == 'cprofile'
+
+
+def record(stage, seconds):
+    profile = _active.get()
+    if profile is not None:
+        profile.record(stage, seconds)
+
+
+def record_batch(model, wait_seconds, model_seconds, batch_rows):
+    profile = _active.get()
+    if profile is not None:
+        profile.record_batch(model, wait_seconds, model_seconds, batch_rows)
+
+
+def note(key, value):
+    profile = _active.get()
+    if profile is not None:
+        profile.notes[key] = value
+
+
+def run_with(profile, fn, *args):
+    # For work handed to another thread (asgi_app.py executors): contextvars
+    # are not carried into run_in_executor() calls
+    token = _active.set(profile)
+    profiler = profile.profiler if profile is not None else None
+    try:
+        if profiler is None:
+            return fn(*args)
+        profiler.enable()
+        try:
+            return fn(*args)
+        finally:
+            profiler.disable()
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def _cprofile(profile, in_executor):
+    if not _cprofile_lock.acquire(blocking=False):
+        raise ProfilerBusy('Another request is already being profiled with cProfile')
+    try:
+        profiler = cProfile.Profile()
+        if in_executor:
+            profile.profiler = profiler
+        else:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profile.profiler = None
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f'{profile.id}.prof')
+            profiler.dump_stats(path)
+            profile.notes['dump'] = path
+    finally:
+        _cprofile_lock.release()
+
+
+@contextmanager
+def _tf_trace(profile):
+    if not _tf_trace_lock.acquire(blocking=False):
+        profile.notes['dump_error'] = 'Another TensorFlow trace is already running'
+        yield
+        return
+    try:
+        try:
+            import tensorflow as tf
+        except ImportError:
+            profile.notes['dump_error'] = 'TensorFlow is not installed'
+            yield
+            return
+        logdir = os.path.join(PROFILE_DIR, profile.id)
+        tf.profiler.experimental.start(logdir)
+        try:
+            yield
+        finally:
+            tf.profiler.experimental.stop()
+            profile.notes['dump'] = logdir
+    finally:
+        _tf_trace_lock.release()
+
+
+@contextmanager
+def profiling(mode, in_executor=False):
+    """Makes a new RequestProfile the active one for the enclosed block.
+    With in_executor, cProfile only runs inside run_with() calls. Raises
+    ProfilerBusy if cProfile is already in use."""
+    profile = RequestProfile(mode)
+    token = _active.set(profile)
+    try:
+        if mode == 'cprofile':
+            with _cprofile(profile, in_executor):
+                yield profile
+        elif mode == 'tf':
+            with _tf_trace(profile):
+                yield profile
+        else:
+            yield profile
+    finally:
+        _active.reset(token)
@@ -0,0 +1,209 @@
+"""
+serve_prefork.py
+
+Pre-fork launcher for app.py on Linux. The parent process loads and warms the
+models once, then forks N workers that share the listening socket and the
+model memory copy-on-write, instead of N separate processes that each load
+their own copy.
+
+Each worker gets an equal share of the CPUs as its TensorFlow/TFLite/ONNX
+intra-op thread budget (so N workers don't oversubscribe the machine), can be
+pinned to its own CPUs, and is restarted by the parent if it dies. The parent
+prints per-worker and aggregate throughput every --report_interval seconds
+and writes a JSON summary on shutdown.
+
+TensorFlow's runtime (its thread pools in particular) does not survive
+fork(), so models are only preloaded in the parent when every model is
+served by a fork-safe backend (MODEL_BACKEND / MODEL_BACKEND_<NAME> of
+tflite, tflite-fp16, tflite-int8, onnx or stub). For that reason this
+launcher serves the TFLite exports by default (MODEL_BACKEND=tflite unless
+it is already set; run export_models.py first). With MODEL_BACKEND=keras
+each worker loads its own copy after forking, and the launcher says so at
+startup; --no_preload forces that for every backend.
+
+Usage:
+  python export_models.py --formats tflite
+  python serve_prefork.py --workers 4 --port 5000 --pin_cpus
+  MODEL_BACKEND=keras python serve_prefork.py --workers 2
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from multiprocessing import Array
+
+from inference_backends import backend_for
+
+parser = argparse.ArgumentParser(description="Serve app.py from pre-forked worker processes.")
+parser.add_argument('--workers', type=int, default=2, help='Number of worker processes')
+parser.add_argument('--host', type=str, default='0.0.0.0', help='Address to listen on')
+parser.add_argument('--port', type=int, default=5000, help='Port to listen on')
+parser.add_argument('--threads_per_worker', type=int, default=None, help='Intra-op threads per worker (default: CPUs / workers)')
+parser.add_argument('--interop_threads', type=int, default=1, help='Inter-op threads per worker')
+parser.add_argument('--pin_cpus', action='store_true', help='Pin each worker to its own block of CPUs')
+parser.add_argument('--no_preload', action='store_true', help='Load models in each worker after fork instead of in the parent')
+parser.add_argument('--report_interval', type=float, default=30.0, help='Seconds between throughput reports')
+parser.add_argument('--report_json', type=str, default='prefork_report.json', help='Where to write the throughput summary')
+args = parser.parse_args()
+
+cpus = sorted(os.sched_getaffinity(0))
+threads_per_worker = args.threads_per_worker or max(1, len(cpus) // args.workers)
+
+os.environ['MODEL_LOAD_ASYNC'] = '0'
+# Fork-safe, so the parent can load the models once for every worker
+os.environ.setdefault('MODEL_BACKEND', 'tflite')
+
+# Every model app.py may load, and the backends that can be loaded before fork()
+MODEL_NAMES = ('identify', 'health', 'disease', 'fused', 'prescreen')
+FORK_SAFE_BACKENDS = ('tflite', 'tflite-fp16', 'tflite-int8', 'onnx', 'stub')
+
+# Per-worker completed request counters, shared with the forked children.
+# Each worker serves requests from several threads, so updates take the lock.
+request_counts = Array('Q', args.workers)
+
+
+def set_thread_limits():
+    # Must be in place before the inference runtime initialises, which
+    # happens when app.py loads the models
+    os.environ['INFERENCE_THREADS'] = str(threads_per_worker)
+    os.environ['INFERENCE_INTEROP_THREADS'] = str(args.interop_threads)
+    os.environ['OMP_NUM_THREADS'] = str(threads_per_worker)
+
+
+def fork_unsafe_models():
+    """{model name: backend} for the models that can't be loaded before fork()."""
+    return {name: backend_for(name) for name in MODEL_NAMES if backend_for(name) not in FORK_SAFE_BACKENDS}
+
+
+def worker_cpus(slot):
+    per_worker = max(1, len(cpus) // args.workers)
+    start = (slot * per_worker) % len(cpus)
+    return set(cpus[start:start + per_worker])
+
+
+def run_worker(slot, sock):
+    if args.pin_cpus:
+        os.sched_setaffinity(0, worker_cpus(slot))
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    set_thread_limits()
+    from werkzeug.serving import make_server
+    import app as service
+
+    @service.app.after_request
+    def count_request(response):
+        if response.status_code == 200 and service.request.path.startswith('/predict'):
+            with request_counts.get_lock():
+                request_counts[slot] += 1
+        return response
+
+    print(f'Worker {slot} (pid {os.getpid()}) serving with {threads_per_worker} threads'
+          + (f' on CPUs {sorted(worker_cpus(slot))}' if args.pin_cpus else ''))
+    server = make_server(args.host, args.port, service.app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+
+def spawn(slot, sock):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(slot, sock)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def report(last_counts, last_time):
+    now = time.perf_counter()
+    with request_counts.get_lock():
+        counts = list(request_counts)
+    rates = [(c - l) / (now - last_time) for c, l in zip(counts, last_counts)]
+    print(f'[{args.workers} workers] aggregate {sum(rates):.1f} req/s | '
+          + ' '.join(f'w{i}={r:.1f}' for i, r in enumerate(rates)))
+    return counts, now
+
+
+def main():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    unsafe = fork_unsafe_models()
+    preload = not args.no_preload and not unsafe
+    if args.no_preload:
+        print('Not preloading (--no_preload): each worker loads its own copy of the models.')
+    elif unsafe:
+        print('Not preloading: backends that are not fork-safe ('
+              + ', '.join(f'{name}={backend}' for name, backend in sorted(unsafe.items()))
+              + '), so each worker loads its own copy of the models and none of the memory is shared. '
+              'Serve with MODEL_BACKEND=tflite or onnx to share one preloaded copy.')
+    if preload:
+        # Loads and warms the models; forked workers share these pages.
+        # Interpreters built here keep the per-worker thread budget.
+        set_thread_limits()
+        import app as service
+        if not service.models_ready.is_set():
+            print(f'Model loading failed: {service.model_load_error}')
+            sys.exit(1)
+
+    workers = {spawn(slot, sock): slot for slot in range(args.workers)}
+    print(f'Started {args.workers} workers on {args.host}:{args.port} ({threads_per_worker} intra-op threads each, '
+          f'models {"preloaded" if preload else "loaded per worker"})')
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    start = last_time = time.perf_counter()
+    last_counts = [0] * args.workers
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            slot = workers.pop(pid)
+            if not stopping:
+                print(f'Worker {slot} (pid {pid}) exited with status {status}; restarting')
+                time.sleep(1)
+                workers[spawn(slot, sock)] = slot
+            continue
+        if not stopping and time.perf_counter() - last_time >= args.report_interval:
+            last_counts, last_time = report(last_counts, last_time)
+        time.sleep(0.2)
+
+    elapsed = time.perf_counter() - start
+    with request_counts.get_lock():
+        counts = list(request_counts)
+    summary = {
+        'workers': args.workers,
+        'threads_per_worker': threads_per_worker,
+        'pinned': args.pin_cpus,
+        'preloaded': preload,
+        'seconds': elapsed,
+        'requests': counts,
+        'aggregate_req_per_s': sum(counts) / elapsed if elapsed else 0.0,
+        'per_worker_req_per_s': [c / elapsed for c in counts] if elapsed else [],
+    }
+    with open(args.report_json, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f'Throughput summary written to {args.report_json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""
+sweep_protocol.py
+
+Names shared by sweep_runner.py and the trainers it starts
+(training_modes.resumable_fit). Kept free of TensorFlow so the runner
+doesn't load it.
+
+Inside a trial directory, the trainer appends one JSON line of epoch
+metrics per epoch to PROGRESS_FILE. The runner creates STOP_FILE to stop a
+losing trial; the trainer checks for it after every epoch and exits with
+STOPPED_EXIT_CODE.
+"""
+
+PROGRESS_FILE = 'progress.jsonl'
+STOP_FILE = 'STOP'
+# Exit status of a trial stopped by the runner
+STOPPED_EXIT_CODE = 3
@@ -0,0 +1,368 @@
+"""
+sweep_runner.py
+
+Runs a grid or random hyperparameter search over one of the train_*.py
+scripts, several trials at a time, and writes a leaderboard of validation
+accuracy against training wall-clock time.
+
+Each trial is a separate `python <script>` process started with
+  --<param> <value> ... --trial_dir <sweep_dir>/trial-NNN
+  --output <sweep_dir>/trial-NNN/model.h5 --threads <threads_per_trial>
+plus any script arguments given after `--`. OMP_NUM_THREADS is set to the
+same thread count, and --pin_cpus gives each concurrent trial its own CPU
+cores so trials don't fight over them. Cores are handed out from the ones
+this process may use (its affinity mask, e.g. a container's CPU set), and
+trials are pinned with taskset.
+
+With --trial_dir the trainer backs up every epoch (see
+training_modes.resumable_fit), so killing the runner and starting it again
+with the same --sweep_dir picks up every unfinished trial where it stopped.
+The sweep's trials and their state are kept in <sweep_dir>/sweep.json;
+search arguments are ignored when resuming.
+
+Losing trials are stopped early with the median stopping rule: once a
+trial has run --grace_epochs epochs, it is stopped if its best val_accuracy
+so far is below the median of the other trials' best val_accuracy over the
+same number of epochs.
+
+Usage:
+  python sweep_runner.py --script train_plant_health_model.py \\
+      --grid learning_rate=0.001,0.0003 --grid unfreeze_layers=0,20 \\
+      --parallel 4 --threads_per_trial 2 -- --data_dir plant-disease-data/train
+  python sweep_runner.py --script train_disease_model.py --random 12 \\
+      --space learning_rate=log:1e-5:1e-2 --space batch_size=16,32,64 \\
+      --space unfreeze_layers=0:40 -- --data_dir plant-disease-data/disease_train
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+from sweep_protocol import PROGRESS_FILE, STOP_FILE, STOPPED_EXIT_CODE
+
+STATE_NAME = 'sweep.json'
+LEADERBOARD_NAME = 'leaderboard.csv'
+METRIC = 'val_accuracy'
+POLL_SECONDS = 5
+
+
+def parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def split_assignment(text):
+    name, sep, values = text.partition('=')
+    if not sep or not name or not values:
+        raise ValueError(f'Expected name=values, got {text!r}')
+    return name, values
+
+
+def grid_trials(grid):
+    """Every combination of the --grid name=v1,v2 options."""
+    names, choices = [], []
+    for text in grid:
+        name, values = split_assignment(text)
+        names.append(name)
+        choices.append([parse_value(v) for v in values.split(',')])
+    return [dict(zip(names, combo)) for combo in itertools.product(*choices)]
+
+
+def sample_space(text, rng):
+    """One draw from a --space name=spec option. spec is v1,v2,... (choice),
+    lo:hi (uniform; integers if both bounds are) or log:lo:hi (log-uniform)."""
+    name, spec = split_assignment(text)
+    if spec.startswith('log:'):
+        lo, hi = (float(v) for v in spec[4:].split(':'))
+        return name, float(f'{math.exp(rng.uniform(math.log(lo), math.log(hi))):.3g}')
+    if ':' in spec:
+        lo, hi = (parse_value(v) for v in spec.split(':'))
+        if isinstance(lo, int) and isinstance(hi, int):
+            return name, rng.randint(lo, hi)
+        return name, float(f'{rng.uniform(lo, hi):.3g}')
+    return name, parse_value(rng.choice(spec.split(',')))
+
+
+def random_trials(space, count, seed):
+    rng = random.Random(seed)
+    return [dict(sample_space(text, rng) for text in space) for _ in range(count)]
+
+
+def usable_cpus():
+    # Can be fewer cores than os.cpu_count(), or not numbered from 0
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def read_progress(trial_dir):
+    """The trial's METRIC for every epoch it has reported, across phases."""
+    path = os.path.join(trial_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return []
+    # Keyed by (phase, epoch): an epoch re-run after a resume replaces the earlier report
+    values = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line still being written
+                continue
+            if METRIC in record:
+                values[record['phase'], record['epoch']] = record[METRIC]
+    return list(values.values())
+
+
+def should_stop(progress, others, grace_epochs):
+    """Median stopping rule: stop if the best METRIC in the first n epochs is
+    below the median of the other trials' best over their first n epochs."""
+    n = len(progress)
+    if n < grace_epochs:
+        return False
+    bests = sorted(max(p[:n]) for p in others if len(p) >= n)
+    if len(bests) < 2:
+        return False
+    mid = len(bests) // 2
+    median = bests[mid] if len(bests) % 2 else (bests[mid - 1] + bests[mid]) / 2
+    return max(progress) < median
+
+
+def pareto_front(rows):
+    # Trials no other trial beats on both accuracy and wall-clock time
+    front = set()
+    for row in rows:
+        if row['accuracy'] is None:
+            continue
+        if not any(other['accuracy'] is not None
+                   and other['accuracy'] >= row['accuracy'] and other['seconds'] <= row['seconds']
+                   and (other['accuracy'] > row['accuracy'] or other['seconds'] < row['seconds'])
+                   for other in rows):
+            front.add(row['trial'])
+    return front
+
+
+class Sweep:
+    """The sweep's trials and their state, saved to sweep.json after every
+    change."""
+
+    def __init__(self, sweep_dir, state):
+        self.sweep_dir = sweep_dir
+        self.state = state
+
+    @classmethod
+    def create(cls, sweep_dir, script, script_args, trials):
+        state = {
+            'script': script,
+            'script_args': script_args,
+            'trials': [{'trial': f'trial-{i:03d}', 'params': params, 'status': 'pending',
+                        'seconds': 0.0, 'returncode': None} for i, params in enumerate(trials)],
+        }
+        sweep = cls(sweep_dir, state)
+        sweep.save()
+        return sweep
+
+    @classmethod
+    def load(cls, sweep_dir):
+        with open(os.path.join(sweep_dir, STATE_NAME)) as f:
+            state = json.load(f)
+        # Trials that were running when the last runner died resume from their backups
+        for trial in state['trials']:
+            if trial['status'] == 'running':
+                trial['status'] = 'pending'
+        return cls(sweep_dir, state)
+
+    @property
+    def trials(self):
+        return self.state['trials']
+
+    def trial_dir(self, trial):
+        return os.path.join(self.sweep_dir, trial['trial'])
+
+    def save(self):
+        os.makedirs(self.sweep_dir, exist_ok=True)
+        path = os.path.join(self.sweep_dir, STATE_NAME)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+
+def start_trial(sweep, trial, threads, cpus):
+    trial_dir = sweep.trial_dir(trial)
+    os.makedirs(trial_dir, exist_ok=True)
+    # taskset sets the affinity before python starts; no preexec_fn needed
+    cmd = ['taskset', '-c', ','.join(str(cpu) for cpu in cpus)] if cpus else []
+    cmd += [sys.executable, sweep.state['script']]
+    for name, value in trial['params'].items():
+        cmd += [f'--{name}', str(value)]
+    cmd += sweep.state['script_args']
+    cmd += ['--trial_dir', trial_dir, '--output', os.path.join(trial_dir, 'model.h5'), '--threads', str(threads)]
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+    log = open(os.path.join(trial_dir, 'train.log'), 'a')
+    print(f'Starting {trial["trial"]}: {trial["params"]}' + (f' on CPUs {cpus}' if cpus else ''))
+    return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env), log
+
+
+def run(sweep, parallel, threads, grace_epochs, pin_cpus):
+    # trial name -> (process, log file, start time, CPU slot)
+    running = {}
+    free_slots = list(range(parallel))
+    cpu_list = usable_cpus()
+    try:
+        while True:
+            for trial in sweep.trials:
+                if len(running) >= parallel:
+                    break
+                if trial['status'] != 'pending':
+                    continue
+                slot = free_slots.pop(0)
+                cpus = cpu_list[slot * threads:(slot + 1) * threads] if pin_cpus else None
+                stop_file = os.path.join(sweep.trial_dir(trial), STOP_FILE)
+                if os.path.exists(stop_file):
+                    os.remove(stop_file)
+                proc, log = start_trial(sweep, trial, threads, cpus)
+                running[trial['trial']] = (proc, log, time.time(), slot)
+                trial['status'] = 'running'
+                sweep.save()
+            if not running:
+                break
+            time.sleep(POLL_SECONDS)
+
+            by_name = {t['trial']: t for t in sweep.trials}
+            progress = {t['trial']: read_progress(sweep.trial_dir(t)) for t in sweep.trials}
+            for name, (proc, log, started, slot) in list(running.items()):
+                trial = by_name[name]
+                if proc.poll() is None:
+                    others = [p for other, p in progress.items() if other != name]
+                    stop_file = os.path.join(sweep.trial_dir(trial), STOP_FILE)
+                    if not os.path.exists(stop_file) and should_stop(progress[name], others, grace_epochs):
+                        print(f'Stopping {name}: best {METRIC} {max(progress[name]):.4f} '
+                              f'after {len(progress[name])} epochs is below the median')
+                        open(stop_file, 'w').close()
+                    continue
+                log.close()
+                del running[name]
+                free_slots.append(slot)
+                trial['seconds'] += time.time() - started
+                trial['returncode'] = proc.returncode
+                trial['status'] = {0: 'done', STOPPED_EXIT_CODE: 'stopped'}.get(proc.returncode, 'failed')
+                print(f'{name} {trial["status"]} after {trial["seconds"]:.0f}s')
+                sweep.save()
+    except KeyboardInterrupt:
+        print('Interrupted; unfinished trials resume on the next run.')
+        for name, (proc, log, started, slot) in running.items():
+            proc.terminate()
+            proc.wait()
+            log.close()
+            trial = next(t for t in sweep.trials if t['trial'] == name)
+            trial['seconds'] += time.time() - started
+            trial['status'] = 'pending'
+        sweep.save()
+        raise
+
+
+def leaderboard(sweep):
+    rows = []
+    for trial in sweep.trials:
+        progress = read_progress(sweep.trial_dir(trial))
+        rows.append({
+            'trial': trial['trial'],
+            'status': trial['status'],
+            'accuracy': max(progress) if progress else None,
+            'epochs': len(progress),
+            'seconds': round(trial['seconds'], 1),
+            **trial['params'],
+        })
+    front = pareto_front(rows)
+    for row in rows:
+        row['pareto'] = row['trial'] in front
+    rows.sort(key=lambda r: (r['accuracy'] is None, -(r['accuracy'] or 0), r['seconds']))
+    return rows
+
+
+def write_leaderboard(sweep, rows):
+    params = sorted({name for t in sweep.trials for name in t['params']})
+    fields = ['trial', 'status', 'accuracy', 'epochs', 'seconds', 'pareto'] + params
+    with open(os.path.join(sweep.sweep_dir, LEADERBOARD_NAME), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f'\n{"trial":<10} {"status":<8} {METRIC:>12} {"epochs":>6} {"seconds":>8}  params')
+    for row in rows:
+        accuracy = f'{row["accuracy"]:.4f}' if row['accuracy'] is not None else '-'
+        marker = ' *' if row['pareto'] else ''
+        values = ' '.join(f'{name}={row[name]}' for name in params if name in row)
+        print(f'{row["trial"]:<10} {row["status"]:<8} {accuracy:>12} {row["epochs"]:>6} '
+              f'{row["seconds"]:>8.0f}  {values}{marker}')
+    print('* best accuracy for its training time (Pareto front)')
+
+
+def main():
+    argv = sys.argv[1:]
+    script_args = []
+    if '--' in argv:
+        split = argv.index('--')
+        argv, script_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep over a training script.")
+    parser.add_argument('--script', type=str, help='Training script, e.g. train_plant_health_model.py')
+    parser.add_argument('--grid', action='append', default=[], help='name=v1,v2,... (repeatable)')
+    parser.add_argument('--random', type=int, default=0, help='Sample this many trials from --space instead of a grid')
+    parser.add_argument('--space', action='append', default=[], help='name=v1,v2 | name=lo:hi | name=log:lo:hi (repeatable)')
+    parser.add_argument('--seed', type=int, default=0, help='Random search seed')
+    parser.add_argument('--sweep_dir', type=str, default='sweeps/latest', help='Trial directories, state and leaderboard')
+    parser.add_argument('--parallel', type=int, default=None, help='Concurrent trials (default: cores // threads_per_trial)')
+    parser.add_argument('--threads_per_trial', type=int, default=2, help='TensorFlow/OpenMP threads per trial')
+    parser.add_argument('--pin_cpus', action='store_true', help='Pin each concurrent trial to its own cores (Linux)')
+    parser.add_argument('--grace_epochs', type=int, default=3, help='Epochs before a trial can be stopped early')
+    args = parser.parse_args(argv)
+
+    cores = len(usable_cpus())
+    parallel = args.parallel or max(1, cores // args.threads_per_trial)
+    if args.pin_cpus:
+        if parallel * args.threads_per_trial > cores:
+            parser.error(f'--pin_cpus needs parallel * threads_per_trial <= {cores} usable CPU cores')
+        if shutil.which('taskset') is None:
+            parser.error('--pin_cpus needs taskset (util-linux)')
+
+    if os.path.exists(os.path.join(args.sweep_dir, STATE_NAME)):
+        sweep = Sweep.load(args.sweep_dir)
+        pending = sum(t['status'] == 'pending' for t in sweep.trials)
+        print(f'Resuming sweep in {args.sweep_dir}: {pending} of {len(sweep.trials)} trials to run')
+    else:
+        if not args.script:
+            parser.error('--script is required for a new sweep')
+        try:
+            if args.random:
+                trials = random_trials(args.space, args.random, args.seed)
+            else:
+                trials = grid_trials(args.grid)
+        except ValueError as e:
+            parser.error(str(e))
+        if not trials or not all(trials):
+            parser.error('Give --grid options, or --random N with --space options')
+        sweep = Sweep.create(args.sweep_dir, args.script, script_args, trials)
+        print(f'Sweep of {len(trials)} trials in {args.sweep_dir}')
+
+    print(f'{parallel} trials at a time, {args.threads_per_trial} threads each')
+    try:
+        run(sweep, parallel, args.threads_per_trial, args.grace_epochs, args.pin_cpus)
+    except KeyboardInterrupt:
+        pass
+    write_leaderboard(sweep, leaderboard(sweep))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+symptom_labels.py
+
+Compiles the multi-label symptom CSV (written by
+multi_label_symptom_template.py and filled in by hand) into a compact
+label store for train_symptom_model.py:
+
+  symptom_labels.npz
+    ids       image IDs: the CSV's image paths, normalised to '/' separators
+    bits      one row of bit-packed symptom flags per image (np.packbits)
+    symptoms  the symptom names, in column order
+
+Every label is checked against SYMPTOM_LABELS, and the CSV is rejected with
+the offending lines listed if any label is unknown or an image appears
+twice. Rows whose symptoms are still blank have not been labelled yet and
+are skipped; write 'none' for an image that shows no symptoms.
+
+Both CSV layouts are accepted: the quoted "leaf_spots,twig_blight" cell that
+pandas writes and symptoms spilled over extra columns
+(path,leaf_spots,twig_blight).
+
+Usage:
+  python symptom_labels.py multi_label_symptom_template.csv --output symptom_labels.npz
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+
+SYMPTOM_LABELS = [
+    "leaf_spots",
+    "leaf_distortion",
+    "twig_blight",
+    "cankers",
+    "premature_defoliation"
+]
+NO_SYMPTOMS = 'none'
+DEFAULT_STORE = 'symptom_labels.npz'
+# Bad rows listed in a rejection message
+MAX_REPORTED_ERRORS = 20
+
+
+class SymptomLabelError(ValueError):
+    pass
+
+
+def image_id(path):
+    return os.path.normpath(path).replace(os.sep, '/')
+
+
+def parse_symptoms(cells):
+    names = []
+    for cell in cells:
+        names += [name.strip() for name in cell.split(',') if name.strip()]
+    return names
+
+
+def compile_csv(csv_path, symptoms=SYMPTOM_LABELS):
+    """Returns (ids, label matrix, unlabelled row count); raises
+    SymptomLabelError listing every bad row."""
+    columns = {name: i for i, name in enumerate(symptoms)}
+    ids, rows, errors = [], [], []
+    seen = {}
+    unlabelled = 0
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        for line_no, row in enumerate(reader, start=1):
+            if not row or (line_no == 1 and row[0] == 'image_path'):
+                continue
+            path, names = row[0].strip(), parse_symptoms(row[1:])
+            if not names:
+                unlabelled += 1
+                continue
+            key = image_id(path)
+            if key in seen:
+                errors.append(f'line {line_no}: {path} already labelled on line {seen[key]}')
+                continue
+            seen[key] = line_no
+            unknown = [n for n in names if n not in columns and n != NO_SYMPTOMS]
+            if unknown:
+                errors.append(f'line {line_no}: unknown symptom(s) {", ".join(unknown)}')
+                continue
+            if NO_SYMPTOMS in names and len(names) > 1:
+                errors.append(f'line {line_no}: "{NO_SYMPTOMS}" combined with other symptoms')
+                continue
+            vector = np.zeros(len(symptoms), dtype=np.uint8)
+            for name in names:
+                if name != NO_SYMPTOMS:
+                    vector[columns[name]] = 1
+            ids.append(key)
+            rows.append(vector)
+    if errors:
+        shown = '\n  '.join(errors[:MAX_REPORTED_ERRORS])
+        more = f'\n  ... and {len(errors) - MAX_REPORTED_ERRORS} more' if len(errors) > MAX_REPORTED_ERRORS else ''
+        raise SymptomLabelError(f'{csv_path}: {len(errors)} bad row(s) (known symptoms: '
+                                f'{", ".join(symptoms)}, or {NO_SYMPTOMS}):\n  {shown}{more}')
+    matrix = np.stack(rows) if rows else np.zeros((0, len(symptoms)), dtype=np.uint8)
+    return ids, matrix, unlabelled
+
+
+def save_store(path, ids, matrix, symptoms=SYMPTOM_LABELS):
+    np.savez_compressed(path, ids=np.array(ids, dtype=str), bits=np.packbits(matrix, axis=1),
+                        symptoms=np.array(symptoms, dtype=str))
+
+
+class SymptomStore:
+    """A compiled label store: label vectors looked up by image ID."""
+
+    def __init__(self, path=DEFAULT_STORE):
+        with np.load(path) as store:
+            self.ids = [str(i) for i in store['ids']]
+            self.symptoms = [str(s) for s in store['symptoms']]
+            self.matrix = np.unpackbits(store['bits'], axis=1, count=len(self.symptoms))
+        self.index = {image: row for row, image in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vector(self, image):
+        return self.matrix[self.index[image_id(image)]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the symptom CSV into a compact label store.")
+    parser.add_argument('csv_path', type=str, help='Filled-in multi_label_symptom_template.csv')
+    parser.add_argument('--output', type=str, default=DEFAULT_STORE, help='Label store to write')
+    args = parser.parse_args()
+
+    try:
+        ids, matrix, unlabelled = compile_csv(args.csv_path)
+    except SymptomLabelError as e:
+        parser.exit(1, f'{e}\n')
+    if not ids:
+        parser.exit(1, f'{args.csv_path} has no labelled rows yet.\n')
+    save_store(args.output, ids, matrix)
+    print(f'{len(ids)} labelled images ({unlabelled} not labelled yet) written to {args.output} '
+          f'({os.path.getsize(args.output) / 1024:.1f} KB)')
+    for name, count in zip(SYMPTOM_LABELS, matrix.sum(axis=0)):
+        print(f'  {name:<24} {int(count):>6}')
+    print(f'  {NO_SYMPTOMS:<24} {int((matrix.sum(axis=1) == 0).sum()):>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+asgi_app.py on stub models; needs starlette, python-multipart and httpx:
+  python -m pytest test_asgi_app.py
+"""
+import importlib
+import io
+import json
+import sys
+
+import pytest
+from PIL import Image
+
+pytest.importorskip('starlette')
+pytest.importorskip('multipart')
+pytest.importorskip('httpx')
+from starlette.testclient import TestClient  # noqa: E402
+
+
+def jpeg_bytes():
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), (40, 140, 50)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(stub_service):
+    sys.modules.pop('asgi_app', None)
+    asgi_app = importlib.import_module('asgi_app')
+    with TestClient(asgi_app.app) as client:
+        yield client
+
+
+def multipart_body(files):
+    boundary = 'test-boundary'
+    parts = []
+    for field, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    return b''.join(parts) + f'--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def chunked(body, size=1024):
+    # A generator body is sent without Content-Length
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def test_predict_and_batch(client):
+    response = client.post('/predict', files={'file': ('a.jpg', jpeg_bytes())})
+    assert response.status_code == 200
+    assert 'plant' in response.json()
+    response = client.post('/predict/batch', files=[('files', ('a.jpg', jpeg_bytes())), ('files', ('b.txt', b'x'))])
+    assert response.status_code == 200
+    lines = {line['filename']: line for line in map(json.loads, response.text.splitlines())}
+    assert set(lines) == {'a.jpg', 'b.txt'}
+    assert 'plant' in lines['a.jpg'] and lines['b.txt']['error'] == 'Unsupported file type'
+
+
+@pytest.mark.parametrize('path, field', [('/predict', 'file'), ('/predict/batch', 'files')])
+def test_chunked_upload_over_the_limit_is_rejected(client, stub_service, monkeypatch, path, field):
+    monkeypatch.setattr(stub_service, 'MAX_UPLOAD_BYTES', 4096)
+    body, content_type = multipart_body([(field, 'big.jpg', b'\xff' * 10000)])
+    response = client.post(path, content=chunked(body), headers={'Content-Type': content_type})
+    assert response.status_code == 413
+    body, content_type = multipart_body([(field, 'a.jpg', jpeg_bytes())])
+    response = client.post(path, content=chunked(body), headers={'Content-Type': content_type})
+    assert response.status_code == 200
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+class RecordingModel:
+    """Doubles its input and records each batch size; predict() sets
+    entered and then waits for gate, when one is given."""
+
+    def __init__(self, gate=None, error=None):
+        self.gate = gate
+        self.error = error
+        self.batches = []
+        self.entered = threading.Event()
+
+    def predict(self, x, batch_size=None, verbose=0):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(x.shape[0])
+        if self.error is not None:
+            raise self.error
+        return x * 2
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def predict_in_thread(batcher, x, results):
+    def run():
+        try:
+            results[id(x)] = batcher.predict(x)
+        except Exception as e:
+            results[id(x)] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_rows():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    batcher = MicroBatcher('test', lambda: model, max_batch_size=8, max_wait_ms=50)
+    results = {}
+    # The first request occupies the worker while the others queue up
+    first = np.full((1, 2), 1.0)
+    threads = [predict_in_thread(batcher, first, results)]
+    assert model.entered.wait(5)
+    inputs = [np.full((rows, 2), float(i)) for i, rows in enumerate([1, 2, 3], start=2)]
+    for x in inputs:
+        threads.append(predict_in_thread(batcher, x, results))
+    wait_for(lambda: batcher.queue_depth() == len(inputs))
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert model.batches == [1, 6]
+    for x in [first] + inputs:
+        np.testing.assert_array_equal(results[id(x)], x * 2)
+
+
+def test_batches_stop_before_the_size_cap():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    batcher = MicroBatcher('test', lambda: model, max_batch_size=4, max_wait_ms=50)
+    results = {}
+    threads = [predict_in_thread(batcher, np.zeros((1, 2)), results)]
+    assert model.entered.wait(5)
+    inputs = [np.zeros((rows, 2)) for rows in (3, 2, 2, 6)]
+    for depth, x in enumerate(inputs, start=1):
+        threads.append(predict_in_thread(batcher, x, results))
+        # Queue them in this order
+        wait_for(lambda: batcher.queue_depth() == depth)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    # 3 + 2 would exceed 4, so the 2 waits; a request over the cap runs alone
+    assert model.batches == [1, 3, 4, 6]
+    assert all(results[id(x)].shape == x.shape for x in inputs)
+
+
+def test_model_errors_reach_every_caller_in_the_batch():
+    model = RecordingModel(error=ValueError('bad input'))
+    batcher = MicroBatcher('test', lambda: model, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(ValueError, match='bad input'):
+        batcher.predict(np.zeros((2, 2)))
+    # The worker keeps serving after a failed batch
+    model.error = None
+    np.testing.assert_array_equal(batcher.predict(np.ones((1, 2))), np.full((1, 2), 2.0))
+
+
+def test_model_lookup_errors_are_propagated():
+    def missing_model():
+        raise KeyError('identify')
+    batcher = MicroBatcher('test', missing_model, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(KeyError):
+        batcher.predict(np.zeros((1, 2)))
@@ -0,0 +1,62 @@
+"""
+/predict/batch end to end on stub models (no TensorFlow needed):
+  python -m pytest test_predict_batch.py
+"""
+import io
+import json
+import zipfile
+
+import pytest
+from PIL import Image
+
+
+def jpeg_bytes(color):
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(stub_service):
+    return stub_service.app.test_client()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_zip_and_images_stream_one_line_each(client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('leaves/a.jpg', jpeg_bytes((40, 140, 50)))
+        zf.writestr('leaves/b.png', jpeg_bytes((90, 120, 40)))
+        zf.writestr('leaves/notes.txt', 'not an image')
+    response = client.post('/predict/batch', content_type='multipart/form-data', data={
+        'files': [(io.BytesIO(archive.getvalue()), 'leaves.zip'),
+                  (io.BytesIO(jpeg_bytes((30, 160, 60))), 'c.jpg'),
+                  (io.BytesIO(b'plain text'), 'd.txt')],
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = {line['filename']: line for line in ndjson(response)}
+    assert set(lines) == {'leaves/a.jpg', 'leaves/b.png', 'c.jpg', 'd.txt'}
+    for name in ('leaves/a.jpg', 'leaves/b.png', 'c.jpg'):
+        assert 'error' not in lines[name]
+        assert {'plant', 'disease', 'condition'} <= set(lines[name])
+    assert lines['d.txt']['error'] == 'Unsupported file type'
+
+
+def test_unreadable_images_get_error_lines(client):
+    response = client.post('/predict/batch', content_type='multipart/form-data', data={
+        'files': [(io.BytesIO(b'not a zip'), 'broken.zip'), (io.BytesIO(b'not a jpeg'), 'broken.jpg')],
+    })
+    assert response.status_code == 200
+    assert ndjson(response) == [
+        {'filename': 'broken.zip', 'error': 'Invalid zip file'},
+        {'filename': 'broken.jpg', 'error': 'Invalid image file'},
+    ]
+
+
+def test_no_files_is_rejected(client):
+    response = client.post('/predict/batch', content_type='multipart/form-data', data={})
+    assert response.status_code == 400
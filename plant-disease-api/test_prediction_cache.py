@@ -0,0 +1,56 @@
+from PIL import Image
+
+from prediction_cache import PredictionCache, content_hash, dhash
+
+RESULT = {'plant': 'guava', 'disease': 'healthy'}
+
+
+def test_put_and_get():
+    cache = PredictionCache()
+    key = cache.key(content_hash(b'leaf'))
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    assert cache.get(key) == RESULT
+    assert cache.stats()['hits'] == 1
+
+
+def test_clear_starts_a_new_generation():
+    cache = PredictionCache()
+    old_key = cache.key('leaf')
+    cache.put(old_key, RESULT)
+    cache.clear()
+    assert cache.get(old_key) is None
+    # A request in flight across the clear() puts an old-model result
+    cache.put(old_key, RESULT)
+    assert cache.stats()['entries'] == 0
+    assert cache.get(cache.key('leaf')) is None
+    new_key = cache.key('leaf')
+    cache.put(new_key, RESULT)
+    assert cache.get(new_key) == RESULT
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_stale_put_is_not_matched_by_phash():
+    cache = PredictionCache(phash_distance=4)
+    phash = dhash(Image.new('RGB', (32, 32), (40, 140, 50)))
+    old_key = cache.key('leaf')
+    cache.clear()
+    cache.put(old_key, RESULT, phash)
+    assert cache.get_similar(phash) is None
+
+
+def test_entries_are_evicted_oldest_first():
+    cache = PredictionCache(max_entries=2)
+    keys = [cache.key(name) for name in ('a', 'b', 'c')]
+    for key in keys:
+        cache.put(key, RESULT)
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == RESULT
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PredictionCache(max_entries=0)
+    key = cache.key('leaf')
+    cache.put(key, RESULT)
+    assert cache.get(key) is None
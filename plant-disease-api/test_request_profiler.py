@@ -0,0 +1,35 @@
+import io
+import pstats
+
+from PIL import Image
+
+import request_profiler
+
+
+def jpeg_bytes():
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), (40, 140, 50)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def test_cprofile_dump_includes_the_model_calls(stub_service, monkeypatch, tmp_path):
+    monkeypatch.setattr(request_profiler, 'PROFILE_DIR', str(tmp_path))
+    client = stub_service.app.test_client()
+    response = client.post('/predict', headers={'X-Profile': 'cprofile'},
+                           data={'file': (io.BytesIO(jpeg_bytes()), 'leaf.jpg')})
+    assert response.status_code == 200
+    profile = response.get_json()['profile']
+    assert profile['models']['identify']['queued_ms'] == 0
+    stats = pstats.Stats(profile['dump'])
+    functions = {(func[0].rsplit('/', 1)[-1], func[2]) for func in stats.stats}
+    assert ('inference_backends.py', 'predict') in functions
+
+
+def test_second_cprofile_request_is_busy(monkeypatch, tmp_path):
+    monkeypatch.setattr(request_profiler, 'PROFILE_DIR', str(tmp_path))
+    with request_profiler.profiling('cprofile'):
+        try:
+            with request_profiler.profiling('cprofile'):
+                raise AssertionError('a second cProfile profile started')
+        except request_profiler.ProfilerBusy:
+            pass
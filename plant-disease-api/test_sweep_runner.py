@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from sweep_runner import grid_trials, pareto_front, sample_space, should_stop
+
+
+def test_not_stopped_during_the_grace_epochs():
+    assert not should_stop([0.1, 0.1], [[0.9, 0.9, 0.9]] * 3, grace_epochs=3)
+
+
+def test_stopped_below_the_median_of_the_others():
+    others = [[0.5, 0.6, 0.7], [0.6, 0.7, 0.8], [0.7, 0.8, 0.9]]
+    assert should_stop([0.3, 0.4, 0.5], others, grace_epochs=3)
+    assert not should_stop([0.3, 0.4, 0.85], others, grace_epochs=3)
+
+
+def test_others_compared_over_the_same_epochs():
+    # The others only reach 0.9 later than epoch 2, so they don't count against it
+    others = [[0.2, 0.3, 0.9], [0.1, 0.3, 0.95]]
+    assert not should_stop([0.25, 0.35], others, grace_epochs=2)
+
+
+def test_needs_two_comparable_trials():
+    assert not should_stop([0.1, 0.1, 0.1], [[0.9, 0.9, 0.9]], grace_epochs=3)
+    assert not should_stop([0.1, 0.1, 0.1], [[0.9, 0.9, 0.9], [0.9]], grace_epochs=3)
+
+
+def test_grid_and_random_trials():
+    assert grid_trials(['learning_rate=0.001,0.01', 'batch_size=16']) == [
+        {'learning_rate': 0.001, 'batch_size': 16}, {'learning_rate': 0.01, 'batch_size': 16}]
+    rng = random.Random(0)
+    name, value = sample_space('unfreeze_layers=0:40', rng)
+    assert name == 'unfreeze_layers' and isinstance(value, int) and 0 <= value <= 40
+    name, value = sample_space('learning_rate=log:1e-5:1e-2', rng)
+    assert 1e-5 <= value <= 1e-2
+    with pytest.raises(ValueError):
+        grid_trials(['learning_rate'])
+
+
+def test_pareto_front():
+    rows = [
+        {'trial': 'fast', 'accuracy': 0.8, 'seconds': 10},
+        {'trial': 'best', 'accuracy': 0.9, 'seconds': 50},
+        {'trial': 'dominated', 'accuracy': 0.8, 'seconds': 60},
+        {'trial': 'failed', 'accuracy': None, 'seconds': 5},
+    ]
+    assert pareto_front(rows) == {'fast', 'best'}
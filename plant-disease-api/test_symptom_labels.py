@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from symptom_labels import SYMPTOM_LABELS, SymptomLabelError, SymptomStore, compile_csv, save_store
+
+
+def write_csv(tmp_path, text):
+    path = tmp_path / 'symptoms.csv'
+    path.write_text(text)
+    return str(path)
+
+
+def test_both_csv_layouts_compile(tmp_path):
+    path = write_csv(tmp_path, 'image_path,symptoms\n'
+                               'train/a.jpg,"leaf_spots,twig_blight"\n'
+                               'train/b.jpg,cankers,leaf_distortion\n'
+                               'train/c.jpg,none\n'
+                               'train/d.jpg,\n')
+    ids, matrix, unlabelled = compile_csv(path)
+    assert ids == ['train/a.jpg', 'train/b.jpg', 'train/c.jpg']
+    assert unlabelled == 1
+    columns = {name: i for i, name in enumerate(SYMPTOM_LABELS)}
+    assert matrix[0].tolist() == [int(i in (columns['leaf_spots'], columns['twig_blight'])) for i in range(len(SYMPTOM_LABELS))]
+    assert matrix[1, columns['cankers']] == 1 and matrix[1, columns['leaf_distortion']] == 1
+    assert matrix[2].sum() == 0
+
+
+def test_bad_rows_are_listed(tmp_path):
+    path = write_csv(tmp_path, 'train/a.jpg,leaf_spots\n'
+                               'train/b.jpg,mildew\n'
+                               'train/./a.jpg,cankers\n'
+                               'train/c.jpg,"none,cankers"\n')
+    with pytest.raises(SymptomLabelError) as error:
+        compile_csv(path)
+    message = str(error.value)
+    assert '3 bad row(s)' in message
+    assert 'line 2: unknown symptom(s) mildew' in message
+    assert 'line 3: train/./a.jpg already labelled on line 1' in message
+    assert 'line 4: "none" combined with other symptoms' in message
+
+
+def test_store_round_trip(tmp_path):
+    path = write_csv(tmp_path, 'train/a.jpg,leaf_spots,premature_defoliation\ntrain/b.jpg,none\n')
+    ids, matrix, _ = compile_csv(path)
+    store_path = str(tmp_path / 'labels.npz')
+    save_store(store_path, ids, matrix)
+    store = SymptomStore(store_path)
+    assert len(store) == 2
+    assert store.symptoms == SYMPTOM_LABELS
+    np.testing.assert_array_equal(store.matrix, matrix)
+    np.testing.assert_array_equal(store.vector('train/a.jpg'), matrix[0])
@@ -1,68 +1,74 @@
 import os
 import argparse
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import Adam
+from class_manifest import write_class_manifest
+from feature_cache import fit_head
+from input_pipeline import LIGHT_AUGMENT, load_images, make_dataset
+import quantization_aware
+import training_modes
 
 parser = argparse.ArgumentParser(description="Train plant disease classification model.")
 parser.add_argument('--data_dir', type=str, required=True, help='Path to dataset root directory')
 parser.add_argument('--epochs', type=int, default=20, help='Number of training epochs')
 parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+parser.add_argument('--learning_rate', type=float, default=0.0001, help='Adam learning rate')
+parser.add_argument('--unfreeze_layers', type=int, default=0, help='Fine-tune the last N MobileNetV2 layers')
+parser.add_argument('--output', type=str, default='disease_model.h5', help='Where to save the model')
+parser.add_argument('--feature_cache', type=str, default=None, help='Train the head on trunk features cached in this directory')
+parser.add_argument('--augment_variants', type=int, default=4, help='Augmented feature passes per image with --feature_cache')
+training_modes.add_arguments(parser)
+quantization_aware.add_arguments(parser)
 args = parser.parse_args()
+training_modes.configure(args)
+quantization_aware.check_available(parser, args)
+if args.feature_cache and args.unfreeze_layers:
+    parser.error('--feature_cache needs a frozen trunk (--unfreeze_layers 0)')
 
 DATASET_DIR = args.data_dir
 IMG_SIZE = (224, 224)
 BATCH_SIZE = args.batch_size
 EPOCHS = args.epochs
 
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    validation_split=0.2,
-    rotation_range=20,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    shear_range=0.2,
-    zoom_range=0.2,
-    horizontal_flip=True,
-    fill_mode='nearest'
-)
-
-train_generator = train_datagen.flow_from_directory(
-    DATASET_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    subset='training'
-)
-
-val_generator = train_datagen.flow_from_directory(
-    DATASET_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    subset='validation'
-)
+train_data = load_images(DATASET_DIR, IMG_SIZE, subset='training', validation_split=0.2)
+val_data = load_images(DATASET_DIR, IMG_SIZE, subset='validation', validation_split=0.2)
+train_ds = make_dataset(train_data, IMG_SIZE, BATCH_SIZE, augment=LIGHT_AUGMENT, shuffle=True)
+val_ds = make_dataset(val_data, IMG_SIZE, BATCH_SIZE, cache=True)
 
 base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
 x = base_model.output
 x = GlobalAveragePooling2D()(x)
 x = Dense(128, activation='relu')(x)
-predictions = Dense(train_generator.num_classes, activation='softmax')(x)
+predictions = Dense(train_data.num_classes, activation='softmax', dtype=training_modes.OUTPUT_DTYPE)(x)
 model = Model(inputs=base_model.input, outputs=predictions)
 
 for layer in base_model.layers:
     layer.trainable = False
+for layer in base_model.layers[len(base_model.layers) - args.unfreeze_layers:]:
+    layer.trainable = True
 
-model.compile(optimizer=Adam(learning_rate=0.0001), loss='categorical_crossentropy', metrics=['accuracy'])
+if args.feature_cache:
+    # The trunk is frozen: run it once per image and train the head on its features
+    history = fit_head(model, train_data, val_data, IMG_SIZE, args.feature_cache, epochs=EPOCHS,
+                       batch_size=BATCH_SIZE, augment=LIGHT_AUGMENT, augment_variants=args.augment_variants,
+                       optimizer=Adam(learning_rate=args.learning_rate), args=args)
+else:
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'], **training_modes.compile_options())
+    history = training_modes.resumable_fit(
+        args, 'train', model,
+        train_ds,
+        epochs=EPOCHS,
+        validation_data=val_ds,
+        callbacks=[training_modes.ThroughputLogger(train_data.samples)]
+    )
 
-history = model.fit(
-    train_generator,
-    epochs=EPOCHS,
-    validation_data=val_generator
-)
+training_modes.float32_model(model).save(args.output)
+write_class_manifest(args.output, train_data.class_indices)
 
-model.save('disease_model.h5')
-print('Model training complete. Saved as disease_model.h5.')
+if args.qat_epochs:
+    quantization_aware.fine_tune(model, train_ds, val_ds, args.output, args,
+                                 callbacks=[training_modes.ThroughputLogger(train_data.samples)])
+print(f'Model training complete. Saved as {args.output}.')
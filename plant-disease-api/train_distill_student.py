@@ -0,0 +1,217 @@
+"""
+train_distill_student.py
+
+Distills one of the serving models (identify, health or disease) into a
+much smaller student: a reduced-width MobileNetV2 that runs at a lower
+resolution. The student learns from the teacher's softened predictions as
+well as from the labels, on the same class folders the teacher was trained
+on.
+
+The student takes the same input size as its teacher and downsizes it with
+a Resizing layer, so it is a drop-in replacement for app.py. Point
+HEALTH_MODEL_PATH, DISEASE_MODEL_PATH or IDENTIFY_MODEL_PATH at it, or
+export it with export_models.py. Its class manifest is copied from the
+teacher.
+
+When training finishes, teacher and student are compared on the validation
+images: accuracy, single-image CPU latency, parameters and file size. The
+report is written to <output>.distill.json.
+
+Usage:
+  python train_distill_student.py --teacher plant_health_model.h5 --data_dir plant-disease-data/train
+  python train_distill_student.py --teacher disease_model.h5 --data_dir plant-disease-data/disease_train --alpha 0.5
+  python train_distill_student.py --teacher plant_disease_mobilenet_final.h5 \\
+      --data_dir plant-disease-data/train --val_dir plant-disease-data/val
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import MobileNetV2
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Input, Resizing
+from tensorflow.keras.models import Model, load_model
+from tensorflow.keras.optimizers import Adam
+
+import training_modes
+from class_manifest import read_class_manifest, write_class_manifest
+from export_models import measure_latency
+from input_pipeline import LIGHT_AUGMENT, load_images, make_dataset
+
+# Resolutions and widths MobileNetV2 has ImageNet weights for
+STUDENT_SIZES = (96, 128, 160, 192, 224)
+STUDENT_ALPHAS = (0.35, 0.5, 0.75, 1.0)
+# Teacher input size -> default student resolution
+DEFAULT_STUDENT_SIZE = {224: 160, 128: 96}
+
+
+def soften(probs, temperature):
+    # The models end in softmax; recover the logits up to a constant first
+    return tf.nn.softmax(tf.math.log(tf.cast(probs, tf.float32) + 1e-7) / temperature)
+
+
+class Distiller(Model):
+    """Trains student on a mix of the labels and the teacher's softened
+    predictions; only the student's weights change."""
+
+    def __init__(self, student, teacher, temperature, distill_weight):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.temperature = temperature
+        self.distill_weight = distill_weight
+        self.loss_tracker = tf.keras.metrics.Mean(name='loss')
+        self.accuracy = tf.keras.metrics.CategoricalAccuracy(name='accuracy')
+
+    @property
+    def metrics(self):
+        return [self.loss_tracker, self.accuracy]
+
+    def call(self, x, training=False):
+        return self.student(x, training=training)
+
+    def train_step(self, data):
+        x, y = data
+        teacher_soft = soften(self.teacher(x, training=False), self.temperature)
+        with tf.GradientTape() as tape:
+            probs = tf.cast(self.student(x, training=True), tf.float32)
+            hard = tf.keras.losses.categorical_crossentropy(y, probs)
+            # Scaled by T^2 so the soft-target gradients keep their size as T grows
+            soft = tf.keras.losses.kl_divergence(teacher_soft, soften(probs, self.temperature)) * self.temperature ** 2
+            loss = tf.reduce_mean(self.distill_weight * soft + (1 - self.distill_weight) * hard)
+            scaled = self.optimizer.get_scaled_loss(loss) if hasattr(self.optimizer, 'get_scaled_loss') else loss
+        grads = tape.gradient(scaled, self.student.trainable_variables)
+        if hasattr(self.optimizer, 'get_unscaled_gradients'):
+            grads = self.optimizer.get_unscaled_gradients(grads)
+        self.optimizer.apply_gradients(zip(grads, self.student.trainable_variables))
+        self.loss_tracker.update_state(loss)
+        self.accuracy.update_state(y, probs)
+        return {m.name: m.result() for m in self.metrics}
+
+    def test_step(self, data):
+        x, y = data
+        probs = tf.cast(self.student(x, training=False), tf.float32)
+        self.loss_tracker.update_state(tf.reduce_mean(tf.keras.losses.categorical_crossentropy(y, probs)))
+        self.accuracy.update_state(y, probs)
+        return {m.name: m.result() for m in self.metrics}
+
+
+def build_student(input_size, student_size, alpha, num_classes):
+    inputs = Input(shape=input_size + (3,))
+    x = inputs
+    if student_size != input_size[0]:
+        x = Resizing(student_size, student_size)(x)
+    base_model = MobileNetV2(weights='imagenet', include_top=False, input_tensor=x, alpha=alpha)
+    x = GlobalAveragePooling2D()(base_model.output)
+    predictions = Dense(num_classes, activation='softmax', dtype=training_modes.OUTPUT_DTYPE)(x)
+    return Model(inputs=inputs, outputs=predictions)
+
+
+def accuracy(model, ds):
+    correct = total = 0
+    for x, y in ds:
+        preds = model.predict_on_batch(x)
+        correct += int(np.sum(np.argmax(preds, axis=1) == np.argmax(y, axis=1)))
+        total += len(y)
+    return correct / total
+
+
+def describe_model(model, path, ds, repeats):
+    sample = next(iter(ds))[0].numpy()
+    return {
+        'path': path,
+        'input_size': int(model.input_shape[1]),
+        'params': int(model.count_params()),
+        'size_mb': os.path.getsize(path) / 1e6,
+        'accuracy': accuracy(model, ds),
+        'latency_ms': measure_latency(lambda x: model.predict(x, verbose=0), sample, repeats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill a serving model into a smaller student.")
+    parser.add_argument('--teacher', type=str, required=True, help='Trained .h5 model with a class manifest')
+    parser.add_argument('--data_dir', type=str, required=True, help='Class folders the teacher was trained on')
+    parser.add_argument('--val_dir', type=str, default=None, help='Validation class folders (default: 20%% of --data_dir)')
+    parser.add_argument('--student_size', type=int, choices=STUDENT_SIZES, default=None, help='Student resolution (default 160 for 224px teachers, 96 for 128px)')
+    parser.add_argument('--alpha', type=float, choices=STUDENT_ALPHAS, default=0.35, help='Student MobileNetV2 width multiplier')
+    parser.add_argument('--temperature', type=float, default=4.0, help='Softmax temperature for the teacher targets')
+    parser.add_argument('--distill_weight', type=float, default=0.7, help='Weight of the teacher targets against the labels')
+    parser.add_argument('--epochs', type=int, default=30, help='Number of training epochs')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+    parser.add_argument('--learning_rate', type=float, default=0.001, help='Adam learning rate')
+    parser.add_argument('--output', type=str, default=None, help='Where to save the student (default <teacher>_student.h5)')
+    parser.add_argument('--repeats', type=int, default=50, help='Single-image predictions per latency measurement')
+    training_modes.add_arguments(parser)
+    args = parser.parse_args()
+    training_modes.configure(args)
+    output = args.output or os.path.splitext(args.teacher)[0] + '_student.h5'
+
+    teacher = load_model(args.teacher, compile=False)
+    if len(teacher.outputs) > 1:
+        parser.error('Multi-head teachers are not supported; distill the separate identify/health/disease models')
+    teacher.trainable = False
+    input_size = tuple(teacher.input_shape[1:3])
+    student_size = args.student_size or DEFAULT_STUDENT_SIZE.get(input_size[0], input_size[0])
+    class_indices = read_class_manifest(args.teacher)
+
+    if args.val_dir:
+        train_data = load_images(args.data_dir, input_size)
+        val_data = load_images(args.val_dir, input_size)
+    else:
+        train_data = load_images(args.data_dir, input_size, subset='training', validation_split=0.2)
+        val_data = load_images(args.data_dir, input_size, subset='validation', validation_split=0.2)
+    if train_data.class_indices != class_indices:
+        parser.error(f'{args.data_dir} classes {sorted(train_data.class_indices)} do not match '
+                     f'the teacher\'s {sorted(class_indices)}')
+    train_ds = make_dataset(train_data, input_size, args.batch_size, augment=LIGHT_AUGMENT, shuffle=True)
+    val_ds = make_dataset(val_data, input_size, args.batch_size, cache=True)
+
+    student = build_student(input_size, student_size, args.alpha, len(class_indices))
+    print(f'Teacher: {teacher.count_params():,} parameters at {input_size[0]}px; '
+          f'student: {student.count_params():,} parameters at {student_size}px (alpha {args.alpha})')
+
+    distiller = Distiller(student, teacher, args.temperature, args.distill_weight)
+    distiller.compile(optimizer=Adam(learning_rate=args.learning_rate), **training_modes.compile_options())
+    training_modes.resumable_fit(
+        args, 'distill', distiller,
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        callbacks=[
+            tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', mode='max', patience=6, restore_best_weights=True),
+            training_modes.ThroughputLogger(train_data.samples),
+        ]
+    )
+
+    student = training_modes.float32_model(student)
+    student.save(output)
+    write_class_manifest(output, class_indices)
+
+    report = {
+        'teacher': describe_model(teacher, args.teacher, val_ds, args.repeats),
+        'student': describe_model(student, output, val_ds, args.repeats),
+        'student_size': student_size,
+        'alpha': args.alpha,
+        'temperature': args.temperature,
+        'distill_weight': args.distill_weight,
+    }
+    report_path = os.path.splitext(output)[0] + '.distill.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'{"model":<8} {"px":>4} {"params":>10} {"size MB":>8} {"acc":>7} {"ms/img":>8}')
+    for name in ('teacher', 'student'):
+        row = report[name]
+        print(f'{name:<8} {row["input_size"]:>4} {row["params"]:>10,} {row["size_mb"]:>8.2f} '
+              f'{row["accuracy"]:>7.3f} {row["latency_ms"]:>8.2f}')
+    teacher_row, student_row = report['teacher'], report['student']
+    print(f'Student is {teacher_row["latency_ms"] / student_row["latency_ms"]:.1f}x faster, '
+          f'{teacher_row["size_mb"] / student_row["size_mb"]:.1f}x smaller, '
+          f'accuracy {(student_row["accuracy"] - teacher_row["accuracy"]) * 100:+.1f} points against the teacher.')
+    print(f'Report written to {report_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,73 +1,89 @@
+import argparse
 import os
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
 from tensorflow.keras.callbacks import ModelCheckpoint
+from tensorflow.keras.optimizers import Adam
+from class_manifest import write_class_manifest
+from feature_cache import fit_head
+from input_pipeline import LIGHT_AUGMENT, load_images, make_dataset
+import training_modes
+from training_monitor import TrainingMonitor
+
+parser = argparse.ArgumentParser(description="Train the plant identification model.")
+parser.add_argument('--train_dir', type=str, default='C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/train', help='Training class folders')
+parser.add_argument('--val_dir', type=str, default='C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/val', help='Validation class folders')
+parser.add_argument('--epochs', type=int, default=10, help='Epochs with the base model frozen')
+parser.add_argument('--fine_tune_epochs', type=int, default=10, help='Epochs with the last --unfreeze_layers layers trainable')
+parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+parser.add_argument('--learning_rate', type=float, default=0.001, help='Adam learning rate for both phases')
+parser.add_argument('--unfreeze_layers', type=int, default=20, help='MobileNetV2 layers to fine-tune in phase 2')
+parser.add_argument('--output', type=str, default='plant_disease_mobilenet_final.h5', help='Where to save the final model')
+parser.add_argument('--checkpoint', type=str, default=None, help='Where to save the best model (default plant_disease_mobilenet_best.h5, or best.h5 in --trial_dir)')
+parser.add_argument('--feature_cache', type=str, default=None, help='Train the frozen-trunk phase on trunk features cached in this directory')
+parser.add_argument('--augment_variants', type=int, default=4, help='Augmented feature passes per image with --feature_cache')
+training_modes.add_arguments(parser)
+args = parser.parse_args()
+training_modes.configure(args)
+if args.checkpoint is None:
+    args.checkpoint = os.path.join(args.trial_dir, 'best.h5') if args.trial_dir else 'plant_disease_mobilenet_best.h5'
 
 # Paths
-train_dir = 'C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/train'
-val_dir = 'C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/val'
+train_dir = args.train_dir
+val_dir = args.val_dir
 
 IMG_SIZE = (128, 128)
-BATCH_SIZE = 8
+BATCH_SIZE = args.batch_size
 
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=20,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    shear_range=0.2,
-    zoom_range=0.2,
-    horizontal_flip=True,
-    fill_mode='nearest'
-)
-val_datagen = ImageDataGenerator(rescale=1./255)
-
-train_generator = train_datagen.flow_from_directory(
-    train_dir,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical'
-)
-val_generator = val_datagen.flow_from_directory(
-    val_dir,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical'
-)
+train_data = load_images(train_dir, IMG_SIZE)
+val_data = load_images(val_dir, IMG_SIZE)
+train_ds = make_dataset(train_data, IMG_SIZE, BATCH_SIZE, augment=LIGHT_AUGMENT, shuffle=True, cache=True)
+# Times each step's wait for input against compute (see training_monitor.py)
+monitor = TrainingMonitor(train_data.samples)
+train_ds = monitor.instrument(train_ds)
+val_ds = make_dataset(val_data, IMG_SIZE, BATCH_SIZE, cache=True)
 
 base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(128, 128, 3))
 x = base_model.output
 x = GlobalAveragePooling2D()(x)
 x = Dense(128, activation='relu')(x)
-predictions = Dense(train_generator.num_classes, activation='softmax')(x)
+predictions = Dense(train_data.num_classes, activation='softmax', dtype=training_modes.OUTPUT_DTYPE)(x)
 model = Model(inputs=base_model.input, outputs=predictions)
 
 for layer in base_model.layers:
     layer.trainable = False  # Freeze base model
 
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-
-checkpoint = ModelCheckpoint('plant_disease_mobilenet_best.h5', monitor='val_accuracy', save_best_only=True, mode='max')
+checkpoint = ModelCheckpoint(args.checkpoint, monitor='val_accuracy', save_best_only=True, mode='max')
 
-model.fit(
-    train_generator,
-    epochs=10,
-    validation_data=val_generator,
-    callbacks=[checkpoint]
-)
+if args.feature_cache:
+    # Phase 1 only trains the head: run the frozen trunk once per image
+    fit_head(model, train_data, val_data, IMG_SIZE, args.feature_cache, epochs=args.epochs, batch_size=BATCH_SIZE,
+             augment=LIGHT_AUGMENT, augment_variants=args.augment_variants,
+             optimizer=Adam(learning_rate=args.learning_rate), args=args)
+else:
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'], **training_modes.compile_options())
+    training_modes.resumable_fit(
+        args, 'frozen', model,
+        train_ds,
+        epochs=args.epochs,
+        validation_data=val_ds,
+        callbacks=[checkpoint, monitor]
+    )
 
 # Optionally, unfreeze some layers and continue training for better accuracy
-for layer in base_model.layers[-20:]:
+for layer in base_model.layers[len(base_model.layers) - args.unfreeze_layers:]:
     layer.trainable = True
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-model.fit(
-    train_generator,
-    epochs=10,
-    validation_data=val_generator,
-    callbacks=[checkpoint]
+model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'], **training_modes.compile_options())
+training_modes.resumable_fit(
+    args, 'fine_tune', model,
+    train_ds,
+    epochs=args.fine_tune_epochs,
+    validation_data=val_ds,
+    callbacks=[checkpoint, monitor]
 )
 
-model.save('plant_disease_mobilenet_final.h5')
+training_modes.float32_model(model).save(args.output)
+write_class_manifest(args.output, train_data.class_indices)
+write_class_manifest(args.checkpoint, train_data.class_indices)
 print('Transfer learning training complete. Model saved.')
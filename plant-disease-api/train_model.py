@@ -1,46 +1,43 @@
+import argparse
 import os
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
 from tensorflow.keras.callbacks import ModelCheckpoint
+from tensorflow.keras.optimizers import Adam
+from class_manifest import write_class_manifest
+from input_pipeline import LIGHT_AUGMENT, load_images, make_dataset
+import training_modes
+
+parser = argparse.ArgumentParser(description="Train the small CNN plant model.")
+parser.add_argument('--train_dir', type=str, default='C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/train', help='Training class folders')
+parser.add_argument('--val_dir', type=str, default='C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/val', help='Validation class folders')
+parser.add_argument('--epochs', type=int, default=20, help='Number of training epochs')
+parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+parser.add_argument('--learning_rate', type=float, default=0.001, help='Adam learning rate')
+parser.add_argument('--output', type=str, default='plant_disease_model_final.h5', help='Where to save the final model')
+parser.add_argument('--checkpoint', type=str, default=None, help='Where to save the best model (default plant_disease_model_best.h5, or best.h5 in --trial_dir)')
+training_modes.add_arguments(parser)
+args = parser.parse_args()
+training_modes.configure(args)
+if args.checkpoint is None:
+    args.checkpoint = os.path.join(args.trial_dir, 'best.h5') if args.trial_dir else 'plant_disease_model_best.h5'
 
 # Paths
-train_dir = 'C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/train'
-val_dir = 'C:/Users/leela/Downloads/Final4/GNPlantCareApp/plant-disease-data/val'  # Create a validation folder if needed
+train_dir = args.train_dir
+val_dir = args.val_dir  # Create a validation folder if needed
 
 # Image parameters
 IMG_SIZE = (128, 128)
-BATCH_SIZE = 1
-
-# Data augmentation
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=20,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    shear_range=0.2,
-    zoom_range=0.2,
-    horizontal_flip=True,
-    fill_mode='nearest'
-)
-val_datagen = ImageDataGenerator(rescale=1./255)
+BATCH_SIZE = args.batch_size
 
+# Parallel decode with on-graph augmentation; decoded images cached in memory
+train_data = load_images(train_dir, IMG_SIZE)
+val_data = load_images(val_dir, IMG_SIZE)
+train_ds = make_dataset(train_data, IMG_SIZE, BATCH_SIZE, augment=LIGHT_AUGMENT, shuffle=True, cache=True)
+val_ds = make_dataset(val_data, IMG_SIZE, BATCH_SIZE, cache=True)
 
-train_generator = train_datagen.flow_from_directory(
-    train_dir,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical'
-)
-val_generator = val_datagen.flow_from_directory(
-    val_dir,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical'
-)
-
-print('Train samples:', train_generator.samples)
-print('Val samples:', val_generator.samples)
+print('Train samples:', train_data.samples)
+print('Val samples:', val_data.samples)
 
 # Model architecture
 model = Sequential([
@@ -51,22 +48,25 @@ model = Sequential([
     Flatten(),
     Dense(128, activation='relu'),
     Dropout(0.5),
-    Dense(train_generator.num_classes, activation='softmax')
+    Dense(train_data.num_classes, activation='softmax', dtype=training_modes.OUTPUT_DTYPE)
 ])
 
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'], **training_modes.compile_options())
 
 # Save best model
-checkpoint = ModelCheckpoint('plant_disease_model_best.h5', monitor='val_accuracy', save_best_only=True, mode='max')
+checkpoint = ModelCheckpoint(args.checkpoint, monitor='val_accuracy', save_best_only=True, mode='max')
 
 # Train
-model.fit(
-    train_generator,
-    epochs=20,
-    validation_data=val_generator,
-    callbacks=[checkpoint]
+training_modes.resumable_fit(
+    args, 'train', model,
+    train_ds,
+    epochs=args.epochs,
+    validation_data=val_ds,
+    callbacks=[checkpoint, training_modes.ThroughputLogger(train_data.samples)]
 )
 
 # Save final model
-model.save('plant_disease_model_final.h5')
+training_modes.float32_model(model).save(args.output)
+write_class_manifest(args.output, train_data.class_indices)
+write_class_manifest(args.checkpoint, train_data.class_indices)
 print('Training complete. Model saved.')
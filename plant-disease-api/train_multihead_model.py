@@ -0,0 +1,111 @@
+"""
+train_multihead_model.py
+
+Builds one serving model with a shared MobileNetV2 trunk and three heads
+(identify, health, disease), so app.py needs one backbone forward pass per
+image instead of three.
+
+The health and disease models are trained on a frozen ImageNet MobileNetV2,
+so their heads are copied over unchanged on top of the same trunk. The
+identify model fine-tunes its last layers at 128x128, so its head is
+retrained here on the shared frozen 224x224 trunk.
+
+Usage:
+  python train_multihead_model.py --identify_train_dir ../plant-disease-data/train --identify_val_dir ../plant-disease-data/val
+"""
+import argparse
+import numpy as np
+from tensorflow.keras.applications import MobileNetV2
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
+from tensorflow.keras.models import Model, load_model
+from tensorflow.keras.optimizers import Adam
+from class_manifest import read_class_manifest, write_class_manifest
+from input_pipeline import LIGHT_AUGMENT, load_images, make_dataset
+import training_modes
+
+parser = argparse.ArgumentParser(description="Build the fused identify/health/disease model.")
+parser.add_argument('--health_model', type=str, default='plant_health_model.h5', help='Trained health model')
+parser.add_argument('--disease_model', type=str, default='disease_model.h5', help='Trained disease model')
+parser.add_argument('--identify_train_dir', type=str, required=True, help='Plant identification training directory')
+parser.add_argument('--identify_val_dir', type=str, required=True, help='Plant identification validation directory')
+parser.add_argument('--epochs', type=int, default=10, help='Epochs for the identify head')
+parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+parser.add_argument('--learning_rate', type=float, default=0.001, help='Adam learning rate for the identify head')
+parser.add_argument('--output', type=str, default='multihead_model.h5', help='Where to save the fused model')
+training_modes.add_arguments(parser)
+args = parser.parse_args()
+training_modes.configure(args)
+
+IMG_SIZE = (224, 224)
+
+
+def head_layers(model):
+    # Every serving model ends in GAP -> Dense(128) -> Dense(num_classes)
+    return model.layers[-2], model.layers[-1]
+
+
+def trunk_weights(model):
+    return [w for layer in model.layers[:-3] for w in layer.get_weights()]
+
+
+def copy_head(features, source_model, name):
+    hidden_src, out_src = head_layers(source_model)
+    hidden = Dense(hidden_src.units, activation='relu', name=f'{name}_hidden')
+    out = Dense(out_src.units, activation='softmax', name=name, dtype=training_modes.OUTPUT_DTYPE)
+    y = out(hidden(features))
+    hidden.set_weights(hidden_src.get_weights())
+    out.set_weights(out_src.get_weights())
+    return y
+
+
+health_model = load_model(args.health_model)
+disease_model = load_model(args.disease_model)
+# Read up front so a missing manifest fails before any training happens
+health_class_indices = read_class_manifest(args.health_model)
+disease_class_indices = read_class_manifest(args.disease_model)
+
+base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+for layer in base_model.layers:
+    layer.trainable = False
+base_weights = base_model.get_weights()
+
+# The copied heads are only exact if their models kept the ImageNet trunk frozen
+for source_name, source_model in (('health', health_model), ('disease', disease_model)):
+    weights = trunk_weights(source_model)
+    diff = max(float(np.max(np.abs(a - b))) for a, b in zip(weights, base_weights))
+    print(f'{source_name} trunk max weight difference from ImageNet MobileNetV2: {diff:.2e}')
+    if diff > 1e-5:
+        print(f'Warning: {source_name} model trunk was fine-tuned; its copied head may lose accuracy.')
+
+features = GlobalAveragePooling2D(name='shared_pool')(base_model.output)
+
+# Identify head is retrained on the shared 224x224 trunk
+train_data = load_images(args.identify_train_dir, IMG_SIZE)
+val_data = load_images(args.identify_val_dir, IMG_SIZE)
+train_ds = make_dataset(train_data, IMG_SIZE, args.batch_size, augment=LIGHT_AUGMENT, shuffle=True)
+val_ds = make_dataset(val_data, IMG_SIZE, args.batch_size, cache=True)
+
+identify_hidden = Dense(128, activation='relu', name='identify_hidden')(features)
+identify_out = Dense(train_data.num_classes, activation='softmax', name='identify', dtype=training_modes.OUTPUT_DTYPE)(identify_hidden)
+identify_model = Model(inputs=base_model.input, outputs=identify_out)
+identify_model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'], **training_modes.compile_options())
+training_modes.resumable_fit(
+    args, 'identify', identify_model,
+    train_ds,
+    epochs=args.epochs,
+    validation_data=val_ds,
+    callbacks=[training_modes.ThroughputLogger(train_data.samples)]
+)
+
+health_out = copy_head(features, health_model, 'health')
+disease_out = copy_head(features, disease_model, 'disease')
+
+# Output order is what app.py unpacks: identify, health, disease
+fused_model = Model(inputs=base_model.input, outputs=[identify_out, health_out, disease_out])
+training_modes.float32_model(fused_model).save(args.output)
+print(f'Fused model saved as {args.output}.')
+write_class_manifest(args.output, None, heads={
+    'identify': train_data.class_indices,
+    'health': health_class_indices,
+    'disease': disease_class_indices,
+})
@@ -1,72 +1,86 @@
+import argparse
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
 from tensorflow.keras.models import Model
 from tensorflow.keras.callbacks import EarlyStopping
+from tensorflow.keras.optimizers import Adam
 import os
 from collections import Counter
+from class_manifest import write_class_manifest
+from feature_cache import fit_head
+from input_pipeline import STRONG_AUGMENT, load_images, make_dataset
+import quantization_aware
+import training_modes
+from training_monitor import TrainingMonitor
 
-DATA_DIR = 'plant-disease-data/train'
+parser = argparse.ArgumentParser(description="Train the plant health model.")
+parser.add_argument('--data_dir', type=str, default='plant-disease-data/train', help='Health class folders')
+parser.add_argument('--epochs', type=int, default=40, help='Number of training epochs')
+parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+parser.add_argument('--learning_rate', type=float, default=0.001, help='Adam learning rate')
+parser.add_argument('--unfreeze_layers', type=int, default=0, help='Fine-tune the last N MobileNetV2 layers')
+parser.add_argument('--output', type=str, default='plant_health_model.h5', help='Where to save the model')
+parser.add_argument('--feature_cache', type=str, default=None, help='Train the head on trunk features cached in this directory')
+parser.add_argument('--augment_variants', type=int, default=4, help='Augmented feature passes per image with --feature_cache')
+training_modes.add_arguments(parser)
+quantization_aware.add_arguments(parser)
+args = parser.parse_args()
+training_modes.configure(args)
+quantization_aware.check_available(parser, args)
+if args.feature_cache and args.unfreeze_layers:
+    parser.error('--feature_cache needs a frozen trunk (--unfreeze_layers 0)')
 
-# Data augmentation and validation split
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=40,
-    width_shift_range=0.3,
-    height_shift_range=0.3,
-    shear_range=0.3,
-    zoom_range=0.3,
-    brightness_range=[0.7, 1.3],
-    horizontal_flip=True,
-    vertical_flip=True,
-    fill_mode='nearest',
-    validation_split=0.2
-)
-
-train_generator = train_datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=(224, 224),
-    batch_size=32,
-    class_mode='categorical',
-    subset='training'
-)
+DATA_DIR = args.data_dir
 
-val_generator = train_datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=(224, 224),
-    batch_size=32,
-    class_mode='categorical',
-    subset='validation'
-)
+# Data augmentation and validation split
+train_data = load_images(DATA_DIR, (224, 224), subset='training', validation_split=0.2)
+val_data = load_images(DATA_DIR, (224, 224), subset='validation', validation_split=0.2)
+train_ds = make_dataset(train_data, (224, 224), args.batch_size, augment=STRONG_AUGMENT, shuffle=True)
+# Times each step's wait for input against compute (see training_monitor.py)
+monitor = TrainingMonitor(train_data.samples)
+train_ds = monitor.instrument(train_ds)
+val_ds = make_dataset(val_data, (224, 224), args.batch_size, cache=True)
 
 # Print class balance
-print('Class balance (training):', Counter(train_generator.classes))
-print('Class balance (validation):', Counter(val_generator.classes))
+print('Class balance (training):', Counter(train_data.classes))
+print('Class balance (validation):', Counter(val_data.classes))
 
 base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224,224,3))
 x = base_model.output
 x = GlobalAveragePooling2D()(x)
 x = Dense(128, activation='relu')(x)
-predictions = Dense(train_generator.num_classes, activation='softmax')(x)
+predictions = Dense(train_data.num_classes, activation='softmax', dtype=training_modes.OUTPUT_DTYPE)(x)
 model = Model(inputs=base_model.input, outputs=predictions)
 
 for layer in base_model.layers:
     layer.trainable = False
-
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+for layer in base_model.layers[len(base_model.layers) - args.unfreeze_layers:]:
+    layer.trainable = True
 
 early_stop = EarlyStopping(monitor='val_loss', patience=7, restore_best_weights=True)
 
-model.fit(
-    train_generator,
-    validation_data=val_generator,
-    epochs=40,
-    callbacks=[early_stop]
-)
+if args.feature_cache:
+    # The trunk is frozen: run it once per image and train the head on its features
+    fit_head(model, train_data, val_data, (224, 224), args.feature_cache, epochs=args.epochs,
+             batch_size=args.batch_size, augment=STRONG_AUGMENT, augment_variants=args.augment_variants,
+             optimizer=Adam(learning_rate=args.learning_rate), callbacks=[early_stop], args=args)
+else:
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'], **training_modes.compile_options())
+    training_modes.resumable_fit(
+        args, 'train', model,
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        callbacks=[early_stop, monitor]
+    )
 
 # Save the model for Flask API
-model.save('plant_health_model.h5')
+training_modes.float32_model(model).save(args.output)
+write_class_manifest(args.output, train_data.class_indices)
+
+if args.qat_epochs:
+    quantization_aware.fine_tune(model, train_ds, val_ds, args.output, args, callbacks=[monitor])
 
 # Print class indices for reference in your Flask API
-print('Class indices:', train_generator.class_indices)
+print('Class indices:', train_data.class_indices)
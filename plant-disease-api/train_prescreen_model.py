@@ -0,0 +1,76 @@
+"""
+train_prescreen_model.py
+
+Trains the cheap pre-screen used by the app.py inference cascade: a
+reduced-width (alpha=0.35) MobileNetV2 on the same 128x128 input the identify
+model gets, over the plant health classes (guava_healthy, guava_unhealthy, ...).
+
+Add a 'not_leaf' folder of non-leaf / unsupported photos to the data
+directory to let the pre-screen reject those images before any other model
+runs.
+
+Usage:
+  python train_prescreen_model.py --data_dir plant-disease-data/train
+"""
+import argparse
+from collections import Counter
+from tensorflow.keras.applications import MobileNetV2
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
+from tensorflow.keras.models import Model
+from tensorflow.keras.callbacks import EarlyStopping
+from tensorflow.keras.optimizers import Adam
+from class_manifest import write_class_manifest
+from input_pipeline import STRONG_AUGMENT, load_images, make_dataset
+import training_modes
+
+parser = argparse.ArgumentParser(description="Train the low-resolution pre-screen model.")
+parser.add_argument('--data_dir', type=str, default='plant-disease-data/train', help='Health class folders (plus optional not_leaf)')
+parser.add_argument('--epochs', type=int, default=30, help='Number of training epochs')
+parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+parser.add_argument('--learning_rate', type=float, default=0.001, help='Adam learning rate')
+parser.add_argument('--unfreeze_layers', type=int, default=0, help='Fine-tune the last N MobileNetV2 layers')
+parser.add_argument('--alpha', type=float, default=0.35, help='MobileNetV2 width multiplier')
+parser.add_argument('--output', type=str, default='prescreen_model.h5', help='Where to save the model')
+training_modes.add_arguments(parser)
+args = parser.parse_args()
+training_modes.configure(args)
+
+# Same input as the identify model, so app.py reuses that tensor
+IMG_SIZE = (128, 128)
+
+train_data = load_images(args.data_dir, IMG_SIZE, subset='training', validation_split=0.2)
+val_data = load_images(args.data_dir, IMG_SIZE, subset='validation', validation_split=0.2)
+train_ds = make_dataset(train_data, IMG_SIZE, args.batch_size, augment=STRONG_AUGMENT, shuffle=True, cache=True)
+val_ds = make_dataset(val_data, IMG_SIZE, args.batch_size, cache=True)
+
+print('Class balance (training):', Counter(train_data.classes))
+if 'not_leaf' not in train_data.class_indices:
+    print('No not_leaf folder found: the pre-screen will only short-circuit confidently healthy leaves.')
+
+base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=IMG_SIZE + (3,), alpha=args.alpha)
+x = base_model.output
+x = GlobalAveragePooling2D()(x)
+x = Dense(64, activation='relu')(x)
+predictions = Dense(train_data.num_classes, activation='softmax', dtype=training_modes.OUTPUT_DTYPE)(x)
+model = Model(inputs=base_model.input, outputs=predictions)
+
+for layer in base_model.layers:
+    layer.trainable = False
+for layer in base_model.layers[len(base_model.layers) - args.unfreeze_layers:]:
+    layer.trainable = True
+
+model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'], **training_modes.compile_options())
+
+early_stop = EarlyStopping(monitor='val_loss', patience=7, restore_best_weights=True)
+
+training_modes.resumable_fit(
+    args, 'train', model,
+    train_ds,
+    validation_data=val_ds,
+    epochs=args.epochs,
+    callbacks=[early_stop, training_modes.ThroughputLogger(train_data.samples)]
+)
+
+training_modes.float32_model(model).save(args.output)
+write_class_manifest(args.output, train_data.class_indices)
+print(f'Pre-screen model saved as {args.output} ({model.count_params():,} parameters).')
@@ -0,0 +1,116 @@
+"""
+train_symptom_model.py
+
+Trains a multi-label symptom head (leaf_spots, twig_blight, ... from
+symptom_labels.SYMPTOM_LABELS) on the frozen trunk of the trained disease
+model, and saves the disease model with both heads:
+
+  disease_symptom_model.h5   outputs [disease softmax, symptom sigmoids]
+
+app.py serves this model in place of disease_model.h5 when it exists, so
+the per-symptom probabilities (/predict?symptoms=1) come from the same
+forward pass as the disease prediction. The disease head is unchanged.
+
+Labels come from the store compiled by symptom_labels.py; image IDs are
+the CSV's image paths, resolved against --root. A fixed fifth of the images
+(chosen by a hash of the image ID, so it stays put as labels are added) is
+held out for validation, and per-symptom precision and recall are reported
+on it.
+
+Usage:
+  python symptom_labels.py multi_label_symptom_template.csv
+  python train_symptom_model.py --labels symptom_labels.npz --disease_model disease_model.h5
+"""
+import argparse
+import hashlib
+import os
+
+import numpy as np
+from tensorflow.keras.callbacks import EarlyStopping
+from tensorflow.keras.layers import Dense
+from tensorflow.keras.metrics import AUC, BinaryAccuracy
+from tensorflow.keras.models import Model, load_model
+from tensorflow.keras.optimizers import Adam
+
+from class_manifest import read_class_manifest, write_class_manifest
+from input_pipeline import LIGHT_AUGMENT, FolderData, make_dataset
+from symptom_labels import DEFAULT_STORE, SymptomStore
+import training_modes
+
+parser = argparse.ArgumentParser(description="Train the multi-label symptom head on the disease model's trunk.")
+parser.add_argument('--labels', type=str, default=DEFAULT_STORE, help='Label store from symptom_labels.py')
+parser.add_argument('--root', type=str, default='.', help='Directory the image IDs are relative to')
+parser.add_argument('--disease_model', type=str, default='disease_model.h5', help='Trained disease model')
+parser.add_argument('--epochs', type=int, default=30, help='Number of training epochs')
+parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
+parser.add_argument('--learning_rate', type=float, default=0.001, help='Adam learning rate')
+parser.add_argument('--threshold', type=float, default=0.5, help='Probability counted as a positive in the report')
+parser.add_argument('--output', type=str, default='disease_symptom_model.h5', help='Where to save the two-head model')
+training_modes.add_arguments(parser)
+args = parser.parse_args()
+training_modes.configure(args)
+
+IMG_SIZE = (224, 224)
+
+store = SymptomStore(args.labels)
+symptom_indices = {name: idx for idx, name in enumerate(store.symptoms)}
+splits = {'train': ([], []), 'val': ([], [])}
+missing = 0
+for image, labels in zip(store.ids, store.matrix):
+    path = os.path.join(args.root, image)
+    if not os.path.exists(path):
+        missing += 1
+        continue
+    split = 'val' if int(hashlib.sha1(image.encode()).hexdigest(), 16) % 5 == 0 else 'train'
+    splits[split][0].append(path)
+    splits[split][1].append(labels)
+if missing:
+    print(f'Skipping {missing} labelled images not found under {args.root}')
+train_data = FolderData(splits['train'][0], np.array(splits['train'][1]), symptom_indices, multi_label=True)
+val_data = FolderData(splits['val'][0], np.array(splits['val'][1]), symptom_indices, multi_label=True)
+print(f'{train_data.samples} training and {val_data.samples} validation images')
+print('Positives (training):', dict(zip(store.symptoms, train_data.classes.sum(axis=0).tolist())))
+train_ds = make_dataset(train_data, IMG_SIZE, args.batch_size, augment=LIGHT_AUGMENT, shuffle=True)
+val_ds = make_dataset(val_data, IMG_SIZE, args.batch_size, cache=True)
+
+disease_model = load_model(args.disease_model, compile=False)
+disease_model.trainable = False
+# Pooled trunk features, the input of the disease model's Dense head
+features = disease_model.layers[-3].output
+x = Dense(128, activation='relu', name='symptom_hidden')(features)
+symptoms = Dense(len(store.symptoms), activation='sigmoid', dtype=training_modes.OUTPUT_DTYPE, name='symptoms')(x)
+symptom_model = Model(inputs=disease_model.input, outputs=symptoms)
+
+symptom_model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='binary_crossentropy',
+                      metrics=[BinaryAccuracy(name='accuracy'), AUC(multi_label=True, name='auc')],
+                      **training_modes.compile_options())
+training_modes.resumable_fit(
+    args, 'symptoms', symptom_model,
+    train_ds,
+    validation_data=val_ds,
+    epochs=args.epochs,
+    callbacks=[
+        EarlyStopping(monitor='val_auc', mode='max', patience=6, restore_best_weights=True),
+        training_modes.ThroughputLogger(train_data.samples),
+    ]
+)
+
+# Per-symptom precision and recall on the held-out images
+probs = symptom_model.predict(val_ds, verbose=0)
+predicted = probs >= args.threshold
+truth = val_data.classes.astype(bool)
+print(f'{"symptom":<24} {"positives":>9} {"precision":>9} {"recall":>7}')
+for i, name in enumerate(store.symptoms):
+    tp = int(np.sum(predicted[:, i] & truth[:, i]))
+    precision = tp / max(1, int(predicted[:, i].sum()))
+    recall = tp / max(1, int(truth[:, i].sum()))
+    print(f'{name:<24} {int(truth[:, i].sum()):>9} {precision:>9.3f} {recall:>7.3f}')
+
+# One model, one trunk pass: [disease, symptoms]
+model = Model(inputs=disease_model.input, outputs=[disease_model.output, symptoms])
+training_modes.float32_model(model).save(args.output)
+write_class_manifest(args.output, None, heads={
+    'disease': read_class_manifest(args.disease_model),
+    'symptoms': symptom_indices,
+})
+print(f'Disease and symptom model saved as {args.output}.')
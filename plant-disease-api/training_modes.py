@@ -0,0 +1,197 @@
+"""
+training_modes.py
+
+Shared --precision / --xla / --threads options for the training scripts, a
+callback that logs training throughput in images/sec for each
+configuration, and resumable_fit() for runs started by sweep_runner.py.
+
+  --precision mixed_bfloat16   bfloat16 compute with float32 weights. Only
+                               fast on CPUs with native bfloat16 (AVX512_BF16
+                               or AMX); elsewhere it is emulated and slower,
+                               so it falls back to float32 unless forced.
+                               bfloat16 has float32's exponent range and needs
+                               no loss scaling.
+  --precision mixed_float16    float16 compute for GPU build machines; Keras
+                               wraps the optimizer in a LossScaleOptimizer.
+  --xla                        compile the training step with XLA.
+  --threads N                  intra-op threads (default: all cores).
+  --trial_dir DIR              set by sweep_runner.py: checkpoint every epoch
+                               so an interrupted run resumes, report epoch
+                               metrics, and stop when the runner says so.
+
+Output layers must be built with dtype=OUTPUT_DTYPE so softmax and the loss
+stay in float32 under a mixed policy. float32_model() rebuilds a trained
+model under the float32 policy before it is saved, so app.py always loads
+plain float32 models (ModelCheckpoint files written during training keep
+the mixed policy).
+
+  training_modes.add_arguments(parser)
+  args = parser.parse_args()
+  training_modes.configure(args)          # before any layer is built
+  ...
+  model.compile(..., **training_modes.compile_options())
+  training_modes.resumable_fit(args, 'train', model, train_ds, validation_data=val_ds, epochs=...,
+                               callbacks=[training_modes.ThroughputLogger(train_data.samples)])
+  training_modes.float32_model(model).save(...)
+"""
+import json
+import os
+import platform
+import sys
+import time
+
+import tensorflow as tf
+
+from sweep_protocol import PROGRESS_FILE, STOP_FILE, STOPPED_EXIT_CODE
+
+OUTPUT_DTYPE = 'float32'
+PRECISIONS = ('float32', 'mixed_bfloat16', 'mixed_float16')
+THROUGHPUT_LOG = 'training_throughput.jsonl'
+
+_xla = False
+
+
+def add_arguments(parser):
+    parser.add_argument('--precision', choices=PRECISIONS, default='float32', help='Keras mixed precision policy')
+    parser.add_argument('--force_precision', action='store_true', help='Use --precision even if the CPU lacks native support')
+    parser.add_argument('--xla', action='store_true', help='JIT-compile the training step with XLA')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads (default: all cores)')
+    parser.add_argument('--trial_dir', type=str, default=None, help='Sweep trial directory (set by sweep_runner.py)')
+
+
+def cpu_supports_bfloat16():
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def configure(args):
+    global _xla
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+        tf.config.threading.set_inter_op_parallelism_threads(min(2, args.threads))
+    precision = args.precision
+    if precision == 'mixed_bfloat16' and not tf.config.list_physical_devices('GPU') \
+            and not cpu_supports_bfloat16() and not args.force_precision:
+        print('This CPU has no native bfloat16 (avx512_bf16/amx_bf16); training in float32. '
+              'Use --force_precision to run mixed_bfloat16 anyway.')
+        precision = 'float32'
+    tf.keras.mixed_precision.set_global_policy(precision)
+    _xla = args.xla
+    print(f'Training mode: {describe()}')
+    return precision
+
+
+def describe():
+    return tf.keras.mixed_precision.global_policy().name + (' + XLA' if _xla else '')
+
+
+def compile_options():
+    return {'jit_compile': True} if _xla else {}
+
+
+def float32_model(model):
+    """A float32 copy of model (model itself under the float32 policy)."""
+    if tf.keras.mixed_precision.global_policy().name == 'float32':
+        return model
+    policy = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy('float32')
+    try:
+        config = model.get_config()
+        for layer in config['layers']:
+            layer['config'].pop('dtype', None)
+        clone = model.__class__.from_config(config)
+        clone.set_weights(model.get_weights())
+    finally:
+        tf.keras.mixed_precision.set_global_policy(policy)
+    return clone
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Prints training images/sec per epoch and appends a summary line for
+    the run to training_throughput.jsonl. The first epoch includes graph
+    tracing and XLA compilation, so the summary leaves it out."""
+
+    def __init__(self, samples, log_path=THROUGHPUT_LOG):
+        super().__init__()
+        self.samples = samples
+        self.log_path = log_path
+        self.rates = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+        self._validation = 0.0
+
+    # Validation runs inside the epoch; it is not training throughput
+    def on_test_begin(self, logs=None):
+        self._test_start = time.perf_counter()
+
+    def on_test_end(self, logs=None):
+        self._validation += time.perf_counter() - self._test_start
+
+    def on_epoch_end(self, epoch, logs=None):
+        rate = self.samples / (time.perf_counter() - self._start - self._validation)
+        self.rates.append(rate)
+        print(f' - {rate:.1f} images/sec ({describe()})')
+
+    def on_train_end(self, logs=None):
+        if not self.rates:
+            return
+        steady = self.rates[1:] or self.rates
+        summary = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'script': os.path.basename(sys.argv[0]),
+            'mode': describe(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'samples': self.samples,
+            'epochs': len(self.rates),
+            'first_epoch_images_per_sec': self.rates[0],
+            'images_per_sec': sum(steady) / len(steady),
+        }
+        print(f'Mean training throughput: {summary["images_per_sec"]:.1f} images/sec ({summary["mode"]})')
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+
+
+class TrialReporter(tf.keras.callbacks.Callback):
+    """Appends each epoch's metrics to the trial's progress.jsonl and exits
+    once sweep_runner.py has written a STOP file for the trial."""
+
+    def __init__(self, trial_dir, phase):
+        super().__init__()
+        self.trial_dir = trial_dir
+        self.phase = phase
+
+    def on_epoch_end(self, epoch, logs=None):
+        record = {'phase': self.phase, 'epoch': epoch, 'time': time.time(),
+                  **{k: float(v) for k, v in (logs or {}).items()}}
+        with open(os.path.join(self.trial_dir, PROGRESS_FILE), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        if os.path.exists(os.path.join(self.trial_dir, STOP_FILE)):
+            print('Stopped by the sweep runner.')
+            sys.exit(STOPPED_EXIT_CODE)
+
+
+def resumable_fit(args, phase, model, x, **fit_kwargs):
+    """model.fit(x, **fit_kwargs). With --trial_dir, every epoch is backed up
+    so a restarted trial resumes mid-phase, and a phase that already
+    finished is skipped by reloading its weights."""
+    if args is None or not args.trial_dir:
+        return model.fit(x, **fit_kwargs)
+    done = os.path.join(args.trial_dir, f'{phase}.done.weights.h5')
+    if os.path.exists(done):
+        print(f'Phase {phase} already finished; loading its weights.')
+        model.load_weights(done)
+        return None
+    callbacks = list(fit_kwargs.pop('callbacks', None) or [])
+    callbacks += [
+        tf.keras.callbacks.BackupAndRestore(os.path.join(args.trial_dir, f'{phase}_backup')),
+        TrialReporter(args.trial_dir, phase),
+    ]
+    history = model.fit(x, callbacks=callbacks, **fit_kwargs)
+    model.save_weights(done)
+    return history
@@ -0,0 +1,161 @@
+"""
+training_monitor.py
+
+Tells whether training is compute-bound or waiting on the input pipeline.
+
+TrainingMonitor is a ThroughputLogger that also times every training step
+and splits it into input wait (blocked on the tf.data pipeline for the next
+batch) and compute. For each epoch it records images/sec, mean and p95
+step time, input wait and peak RSS. After fit() it writes the epochs to
+training_runs/<script>-<time>.json and .csv and prints a one-line
+diagnosis.
+
+Input wait is only measured on a dataset passed through instrument(). This
+appends a synchronous map after the pipeline's prefetch, so it runs when
+the training step asks for its batch. It stamps the time the batch came
+out of the prefetch buffer. The step's input wait runs from the start of
+the step to that stamp; compute runs from the stamp to the end of the step.
+
+  monitor = TrainingMonitor(train_data.samples)
+  train_ds = monitor.instrument(train_ds)
+  model.fit(train_ds, ..., callbacks=[monitor])
+"""
+import csv
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from training_modes import ThroughputLogger, describe
+
+RUN_LOG_DIR = 'training_runs'
+# Share of step time spent waiting for input above which training is input-bound
+INPUT_BOUND = 0.3
+# ... and below which it is compute-bound
+COMPUTE_BOUND = 0.1
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class TrainingMonitor(ThroughputLogger):
+
+    def __init__(self, samples, log_dir=RUN_LOG_DIR, **kwargs):
+        super().__init__(samples, **kwargs)
+        self.log_dir = log_dir
+        self._ready = []
+        self.instrumented = False
+
+    def instrument(self, dataset):
+        """dataset with each batch's arrival stamped for this monitor."""
+        def stamp():
+            self._ready.append(time.perf_counter())
+            return np.float32(0)
+
+        def mark(*batch):
+            done = tf.py_function(stamp, [], tf.float32)
+            with tf.control_dependencies([done]):
+                return tuple(tf.identity(t) for t in batch)
+
+        # An injected prefetch would run the stamps ahead of the steps they belong to
+        options = tf.data.Options()
+        options.experimental_optimization.inject_prefetch = False
+        self.instrumented = True
+        return dataset.map(mark).with_options(options)
+
+    def on_train_begin(self, logs=None):
+        self.rates = []
+        self.epochs = []
+        self._started = time.strftime('%Y%m%d-%H%M%S')
+
+    def on_epoch_begin(self, epoch, logs=None):
+        super().on_epoch_begin(epoch, logs)
+        # (step seconds, input wait seconds or None) per step
+        self._steps = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._ready.clear()
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        wait = max(0.0, self._ready[-1] - self._step_start) if self._ready else None
+        self._steps.append((time.perf_counter() - self._step_start, wait))
+
+    def on_epoch_end(self, epoch, logs=None):
+        super().on_epoch_end(epoch, logs)
+        # The first step of an epoch waits for the shuffle buffer (and tracing on epoch 1)
+        timed = self._steps[1:] or self._steps
+        steps = np.array([step for step, _ in timed])
+        record = {
+            'epoch': epoch,
+            'images_per_sec': round(self.rates[-1], 1),
+            'steps': len(self._steps),
+            'step_ms': round(float(steps.mean()) * 1000, 2),
+            'step_p95_ms': round(float(np.percentile(steps, 95)) * 1000, 2),
+            'input_wait_ms': None,
+            'compute_ms': None,
+            'input_fraction': None,
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        waited = np.array([(step, wait) for step, wait in timed if wait is not None])
+        if len(waited):
+            record['input_wait_ms'] = round(float(waited[:, 1].mean()) * 1000, 2)
+            record['compute_ms'] = round(float((waited[:, 0] - waited[:, 1]).mean()) * 1000, 2)
+            record['input_fraction'] = round(float(waited[:, 1].sum() / waited[:, 0].sum()), 3)
+        record.update({k: float(v) for k, v in (logs or {}).items()})
+        self.epochs.append(record)
+        if record['input_fraction'] is not None:
+            print(f' - step {record["step_ms"]:.0f} ms: {record["input_wait_ms"]:.0f} ms waiting for input, '
+                  f'{record["compute_ms"]:.0f} ms compute; peak RSS {record["peak_rss_mb"]:.0f} MB')
+        else:
+            print(f' - step {record["step_ms"]:.0f} ms; peak RSS {record["peak_rss_mb"]:.0f} MB')
+
+    def on_train_end(self, logs=None):
+        super().on_train_end(logs)
+        if not self.epochs:
+            return
+        diagnosis = self.diagnose()
+        self.write_run_log(diagnosis)
+        print(f'Bottleneck: {diagnosis}')
+
+    def diagnose(self):
+        steady = self.epochs[1:] or self.epochs
+        fractions = [e['input_fraction'] for e in steady if e['input_fraction'] is not None]
+        if not fractions:
+            return ('input wait not measured (dataset not passed through instrument()); '
+                    f'mean step {np.mean([e["step_ms"] for e in steady]):.0f} ms')
+        fraction = float(np.mean(fractions))
+        if fraction > INPUT_BOUND:
+            return (f'input-bound: {fraction:.0%} of step time waiting for batches. '
+                    'Pack the dataset (pack_dataset.py), cache decoded images or use --feature_cache.')
+        if fraction < COMPUTE_BOUND:
+            return (f'compute-bound: {fraction:.0%} of step time waiting for batches. '
+                    'Try --precision, --xla or a frozen trunk with --feature_cache.')
+        return f'mixed: {fraction:.0%} of step time waiting for batches.'
+
+    def write_run_log(self, diagnosis):
+        os.makedirs(self.log_dir, exist_ok=True)
+        script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'train'
+        base = os.path.join(self.log_dir, f'{script}-{self._started}')
+        with open(base + '.json', 'w') as f:
+            json.dump({
+                'script': script,
+                'mode': describe(),
+                'samples': self.samples,
+                'cpus': os.cpu_count(),
+                'input_wait_measured': self.instrumented,
+                'diagnosis': diagnosis,
+                'epochs': self.epochs,
+            }, f, indent=2)
+        fields = list(dict.fromkeys(k for e in self.epochs for k in e))
+        with open(base + '.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.epochs)
+        print(f'Run log written to {base}.json and .csv')